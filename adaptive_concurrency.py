@@ -0,0 +1,183 @@
+import hashlib
+import json
+import os
+import threading
+import time
+
+from review_metrics import get_default_metrics
+
+# 自适应并发控制 (AIMD): 按 (接口地址, API Key) 分别限制同时在途的请求数。
+# 请求顺利时每完成约 limit 个请求上限加 1 (加性增加)；收到 429/503 或延迟明显上升时上限按比例下降 (乘性减少)。
+# 学到的上限在进程退出时写入状态文件，下次运行以其作为初始值，而不必从头探测。
+
+# 结果类型
+OUTCOME_OK = "ok"
+OUTCOME_THROTTLED = "throttled"  # 429/503: 服务端限流或过载
+OUTCOME_ERROR = "error"          # 其他失败，不影响并发上限
+
+# 视为限流、需要降低并发的状态码
+THROTTLE_STATUS_CODES = (429, 503)
+
+# 延迟的短期/长期指数移动平均系数
+_SHORT_EWMA_ALPHA = 0.2
+_LONG_EWMA_ALPHA = 0.02
+
+
+def limiter_key(url, api_key):
+    """限流器的键: 接口地址与 API Key 的哈希 (不在状态文件中保存明文 Key)"""
+    return hashlib.sha256(f"{url}\0{api_key or ''}".encode('utf-8')).hexdigest()[:16]
+
+
+class AdaptiveLimiter:
+    """
+    单个 (接口地址, API Key) 的 AIMD 并发限制器 (线程安全)。
+
+    acquire() 在在途请求数达到当前上限时阻塞；release(outcome, latency) 报告结果并调整上限:
+    - 成功且延迟正常: limit += 1 / limit，即每完成一轮 (约 limit 个请求) 上限加 1。
+    - 限流 (429/503)，或延迟的短期平均超过长期平均的 latency_tolerance 倍: limit *= backoff_ratio。
+      同一批在途请求可能同时收到 429，下降后的一个冷却间隔 (约为一次请求的耗时) 内不再重复下降。
+    """
+
+    def __init__(self, name, initial_limit, min_limit=1, max_limit=16, backoff_ratio=0.5, latency_tolerance=2.0):
+        self.name = name
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max(self.min_limit, max_limit)
+        self.limit = float(min(self.max_limit, max(self.min_limit, initial_limit)))
+        self.backoff_ratio = backoff_ratio
+        self.latency_tolerance = latency_tolerance
+        self.in_flight = 0
+        self.peak_limit = self.limit
+        self.decreases = 0
+        self._condition = threading.Condition()
+        self._short_latency = None
+        self._long_latency = None
+        self._last_decrease = 0.0
+        self._limit_before_decrease = None
+
+    def acquire(self):
+        with self._condition:
+            while self.in_flight >= int(self.limit):
+                self._condition.wait()
+            self.in_flight += 1
+
+    def release(self, outcome, latency=None):
+        """
+        :param outcome: OUTCOME_OK / OUTCOME_THROTTLED / OUTCOME_ERROR。
+        :param latency: 本次请求从发出到收到响应头的耗时 (秒)，仅在成功时用于判断延迟是否上升。
+        """
+        with self._condition:
+            # 在途请求数未达到上限时，瓶颈不在并发上限，不再继续提高
+            saturated = self.in_flight >= int(self.limit)
+            self.in_flight -= 1
+            if outcome == OUTCOME_THROTTLED:
+                self._decrease("限流")
+            elif outcome == OUTCOME_OK:
+                if latency is not None and self._latency_rising(latency):
+                    self._decrease("延迟上升")
+                elif saturated:
+                    self.limit = min(self.max_limit, self.limit + 1.0 / self.limit)
+                    self.peak_limit = max(self.peak_limit, self.limit)
+            self._condition.notify_all()
+
+    def _latency_rising(self, latency):
+        if self._short_latency is None:
+            self._short_latency = self._long_latency = latency
+            return False
+        self._short_latency += _SHORT_EWMA_ALPHA * (latency - self._short_latency)
+        self._long_latency += _LONG_EWMA_ALPHA * (latency - self._long_latency)
+        return self._short_latency > self.latency_tolerance * self._long_latency
+
+    def _decrease(self, reason):
+        now = time.monotonic()
+        # 冷却间隔取最近的平均延迟，使一轮在途请求的多个 429 只触发一次下降
+        if now - self._last_decrease < (self._short_latency or 1.0):
+            return
+        self._last_decrease = now
+        old_limit = self._limit_before_decrease = self.limit
+        self.limit = max(float(self.min_limit), self.limit * self.backoff_ratio)
+        self.decreases += 1
+        if reason == "延迟上升":
+            # 以下降后的延迟重新开始比较，避免持续的高延迟让上限一路降到最低
+            self._long_latency = self._short_latency
+        get_default_metrics().increment("concurrency_decreases")
+        print(f"  自适应并发 [{self.name}]: {reason}，并发上限 {old_limit:.1f} -> {self.limit:.1f}")
+
+    def learned_limit(self):
+        """
+        供下次运行使用的初始上限。发生过下降时取上一次下降前后两个值的中点
+        (AIMD 的上限在可持续值附近呈锯齿形波动)，否则取当前上限。
+        """
+        with self._condition:
+            if self._limit_before_decrease is None:
+                return self.limit
+            return max(float(self.min_limit), self._limit_before_decrease * (1 + self.backoff_ratio) / 2)
+
+    def format_stats(self):
+        with self._condition:
+            return (f"自适应并发 [{self.name}]: 当前上限 {self.limit:.1f} (最高 {self.peak_limit:.1f}，"
+                    f"下降 {self.decreases} 次)")
+
+
+class AdaptiveLimiterRegistry:
+    """
+    按 (接口地址, API Key) 管理 AdaptiveLimiter，并在 state_path 中保存学到的并发上限。
+    """
+
+    def __init__(self, state_path=None, initial_limit=4, min_limit=1, max_limit=16, backoff_ratio=0.5,
+                 latency_tolerance=2.0):
+        self.state_path = state_path
+        self.initial_limit = initial_limit
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.backoff_ratio = backoff_ratio
+        self.latency_tolerance = latency_tolerance
+        self._lock = threading.Lock()
+        self._limiters = {}
+        self._learned = self._load()
+
+    def _load(self):
+        if not self.state_path or not os.path.exists(self.state_path):
+            return {}
+        try:
+            with open(self.state_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            return {key: float(value) for key, value in data.items()}
+        except (OSError, ValueError, TypeError, AttributeError) as e:
+            print(f"读取自适应并发状态失败，将从初始并发数开始: {e}")
+            return {}
+
+    def get(self, url, api_key):
+        """返回 (url, api_key) 的限制器，首次使用时以上次运行学到的上限 (没有时为初始值) 创建"""
+        key = limiter_key(url, api_key)
+        with self._lock:
+            limiter = self._limiters.get(key)
+            if limiter is None:
+                name = f"{url} key ...{api_key[-4:]}" if api_key else url
+                limiter = self._limiters[key] = AdaptiveLimiter(
+                    name, self._learned.get(key, self.initial_limit), min_limit=self.min_limit,
+                    max_limit=self.max_limit, backoff_ratio=self.backoff_ratio,
+                    latency_tolerance=self.latency_tolerance
+                )
+            return limiter
+
+    def save(self):
+        """保存各限制器当前的并发上限，供下次运行使用"""
+        if not self.state_path:
+            return
+        with self._lock:
+            if not self._limiters:
+                return
+            data = dict(self._learned)
+            data.update({key: round(limiter.learned_limit(), 2) for key, limiter in self._limiters.items()})
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.state_path)), exist_ok=True)
+            with open(self.state_path + ".tmp", 'w', encoding='utf-8') as f:
+                json.dump(data, f, indent=2)
+            os.replace(self.state_path + ".tmp", self.state_path)
+        except OSError as e:
+            print(f"保存自适应并发状态失败: {e}")
+
+    def format_stats(self):
+        with self._lock:
+            limiters = list(self._limiters.values())
+        return "\n".join(limiter.format_stats() for limiter in limiters)
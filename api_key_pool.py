@@ -0,0 +1,203 @@
+import threading
+import time
+
+from review_metrics import get_default_metrics
+
+# API Key 池: 同一接口配置多个 Key 时，按每个 Key 的 RPM/TPM 令牌桶分配请求，
+# 返回鉴权或额度错误的 Key 暂停使用一段时间，使吞吐量随 Key 的数量增加。
+
+# 鉴权失败或额度不足: 该 Key 在 auth_cooldown 内不再使用
+KEY_AUTH_STATUS_CODES = (401, 402, 403)
+# 该 Key 被限流: 在 Retry-After (没有时为 throttle_cooldown) 内不再使用
+KEY_THROTTLE_STATUS_CODES = (429,)
+
+
+class KeyPoolExhausted(Exception):
+    """Key 池中所有 Key 都因鉴权或额度问题暂停使用"""
+
+
+def estimate_request_tokens(payload):
+    """估算一次请求计入 TPM 的 token 数: 消息内容约 4 个字符一个 token，再加上请求的 max_tokens"""
+    chars = sum(len(message.get("content") or "") for message in payload.get("messages") or [])
+    return chars // 4 + 1 + int(payload.get("max_tokens") or 0)
+
+
+class TokenBucket:
+    """每分钟 per_minute 个令牌的令牌桶，容量为一分钟的额度；per_minute 为 0 时不限制"""
+
+    def __init__(self, per_minute):
+        self.capacity = float(per_minute or 0)
+        self.rate = self.capacity / 60.0
+        self.level = self.capacity
+        self._updated = time.monotonic()
+
+    def _refill(self, now):
+        if self.capacity:
+            self.level = min(self.capacity, self.level + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def wait_time(self, amount, now):
+        """返回取出 amount 个令牌前需要等待的秒数 (超过容量的请求按容量计算，避免永远等待)"""
+        if not self.capacity:
+            return 0.0
+        self._refill(now)
+        amount = min(amount, self.capacity)
+        return 0.0 if self.level >= amount else (amount - self.level) / self.rate
+
+    def take(self, amount):
+        """取出令牌；amount 为负数时归还 (不超过容量)"""
+        if self.capacity:
+            self.level = min(self.capacity, self.level - amount)
+
+
+class _KeyState:
+    __slots__ = ('api_key', 'requests_bucket', 'tokens_bucket', 'disabled_until', 'disabled_reason',
+                 'in_flight', 'requests', 'tokens', 'failures', 'last_used')
+
+    def __init__(self, api_key, rpm, tpm):
+        self.api_key = api_key
+        self.requests_bucket = TokenBucket(rpm)
+        self.tokens_bucket = TokenBucket(tpm)
+        self.disabled_until = 0.0
+        self.disabled_reason = None
+        self.in_flight = 0
+        self.requests = 0
+        self.tokens = 0
+        self.failures = 0
+        self.last_used = 0.0
+
+    @property
+    def label(self):
+        return f"key ...{self.api_key[-4:]}"
+
+
+class KeyLease:
+    """一次请求使用的 Key，请求结束后交给 ApiKeyPool.release"""
+
+    __slots__ = ('state', 'estimated_tokens')
+
+    def __init__(self, state, estimated_tokens):
+        self.state = state
+        self.estimated_tokens = estimated_tokens
+
+    @property
+    def api_key(self):
+        return self.state.api_key
+
+
+class ApiKeyPool:
+    """
+    同一接口的多个 API Key (线程安全)。
+
+    - acquire(): 在未暂停的 Key 中选择 RPM/TPM 令牌桶能立即满足本次请求的 Key，
+      有多个时选在途请求最少、最久未使用的；都不满足时等待最早可用的 Key。
+    - release(): 按响应中的实际 usage 修正 TPM 记账；401/402/403 (鉴权或额度问题) 的 Key 暂停 auth_cooldown 秒，
+      429 的 Key 暂停 Retry-After 秒。
+    - 所有 Key 都因鉴权或额度问题暂停时，acquire 抛出 KeyPoolExhausted，由调用方切换到其他后端。
+    """
+
+    def __init__(self, api_keys, rpm=0, tpm=0, auth_cooldown=300, throttle_cooldown=10, name="API"):
+        if not api_keys:
+            raise ValueError("ApiKeyPool 至少需要一个 Key")
+        self.name = name
+        self.auth_cooldown = auth_cooldown
+        self.throttle_cooldown = throttle_cooldown
+        self._keys = [_KeyState(api_key, rpm, tpm) for api_key in dict.fromkeys(api_keys)]
+        self._condition = threading.Condition()
+
+    @property
+    def size(self):
+        return len(self._keys)
+
+    def available_count(self):
+        """当前未暂停的 Key 数"""
+        now = time.monotonic()
+        with self._condition:
+            return sum(1 for state in self._keys if state.disabled_until <= now)
+
+    def acquire(self, estimated_tokens=0):
+        """
+        为一次请求选择 Key，必要时等待令牌桶补充。
+        :return: KeyLease
+        """
+        with self._condition:
+            while True:
+                now = time.monotonic()
+                enabled = [state for state in self._keys if state.disabled_until <= now]
+                if not enabled:
+                    if all(state.disabled_reason == "auth" for state in self._keys):
+                        raise KeyPoolExhausted(f"{self.name} 的 {self.size} 个 API Key 均因鉴权或额度问题暂停使用")
+                    self._condition.wait(min(state.disabled_until for state in self._keys) - now)
+                    continue
+                best_wait, best = None, None
+                for state in enabled:
+                    wait = max(state.requests_bucket.wait_time(1, now),
+                               state.tokens_bucket.wait_time(estimated_tokens, now))
+                    rank = (wait, state.in_flight, state.last_used)
+                    if best is None or rank < best_wait:
+                        best_wait, best = rank, state
+                if best_wait[0] > 0:
+                    # 被 notify (有请求结束或 Key 恢复) 时重新选择
+                    self._condition.wait(best_wait[0])
+                    continue
+                best.requests_bucket.take(1)
+                best.tokens_bucket.take(estimated_tokens)
+                best.in_flight += 1
+                best.requests += 1
+                best.last_used = now
+                return KeyLease(best, estimated_tokens)
+
+    def release(self, lease, status_code=None, usage=None, retry_after=None):
+        """
+        请求结束后归还 Key。
+        :param status_code: 响应状态码，网络错误时为 None。
+        :param usage: 响应中的 usage 字段，用于按实际 token 数修正 TPM 记账。
+        :param retry_after: 429 响应中的 Retry-After 秒数。
+        """
+        state = lease.state
+        with self._condition:
+            state.in_flight -= 1
+            if usage:
+                used = int(usage.get("prompt_tokens") or 0) + int(usage.get("completion_tokens") or 0)
+                state.tokens += used
+                state.tokens_bucket.take(used - lease.estimated_tokens)
+            elif status_code is None or status_code >= 400:
+                # 失败的请求不计入 token 额度
+                state.tokens_bucket.take(-lease.estimated_tokens)
+            if status_code in KEY_AUTH_STATUS_CODES:
+                self._disable(state, self.auth_cooldown, "auth", f"返回 HTTP {status_code} (鉴权或额度问题)")
+            elif status_code in KEY_THROTTLE_STATUS_CODES:
+                self._disable(state, retry_after if retry_after is not None else self.throttle_cooldown,
+                              "throttle", "被限流 (HTTP 429)")
+            self._condition.notify_all()
+
+    def _disable(self, state, seconds, reason, description):
+        state.failures += 1
+        state.disabled_until = max(state.disabled_until, time.monotonic() + seconds)
+        state.disabled_reason = reason
+        get_default_metrics().increment("api_key_disabled")
+        print(f"  {self.name} {state.label} {description}，暂停使用 {seconds:.0f}s")
+
+    def format_stats(self):
+        now = time.monotonic()
+        lines = [f"{self.name} API Key 池 ({self.size} 个 Key):"]
+        with self._condition:
+            for state in self._keys:
+                status = "正常" if state.disabled_until <= now else f"暂停中 (剩余 {state.disabled_until - now:.0f}s)"
+                lines.append(f"  {state.label}: {state.requests} 次请求，{state.tokens} tokens，"
+                             f"暂停 {state.failures} 次，{status}")
+        return "\n".join(lines)
+
+
+_pools_lock = threading.Lock()
+_pools = {}
+
+
+def get_key_pool(api_url, api_keys, rpm=0, tpm=0, auth_cooldown=300, throttle_cooldown=10, name="API"):
+    """返回进程内共享的 Key 池 (按接口地址和 Key 列表区分)，使多个审查器和每次请求共用同一份 RPM/TPM 记账"""
+    key = (api_url, tuple(api_keys))
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = _pools[key] = ApiKeyPool(api_keys, rpm, tpm, auth_cooldown, throttle_cooldown, name)
+        return pool
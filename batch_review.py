@@ -0,0 +1,94 @@
+import re
+
+from prompt_templates import (
+    BATCH_FILE_BLOCK_TEMPLATE,
+    BATCH_FILE_MARKER,
+    BATCH_REVIEW_SYSTEM_PROMPT,
+    BATCH_REVIEW_USER_TEMPLATE,
+    build_messages
+)
+
+# 多个小文件合并为一次审查请求: 提示词中按文件分隔代码，要求模型按固定标记逐个文件输出，
+# 再按标记把回答拆回每个文件的审查意见。
+
+# 解析回答时对标记的写法适当放宽: 允许不同级别的标题、全角冒号以及用反引号包裹的路径
+_SECTION_HEADER = re.compile(r'^\s*(?:#{1,6}\s*)?文件[:：]\s*`?(.+?)`?\s*$')
+
+
+def plan_review_units(file_paths, file_sizes, small_file_max_bytes, max_tokens, max_files, exclude=()):
+    """
+    将文件列表划分为审查单元: 连续的小文件合并为一批，其余文件单独成为一个单元。
+    只合并列表中相邻的文件，因此按单元顺序展开后与原文件顺序完全一致。
+    :param file_sizes: {文件路径: 字节数}，未知大小的文件视为大文件。
+    :param max_tokens: 每批文件内容的估算 token 上限 (按字节数粗略估算)。
+    :param exclude: 不参与合并的文件 (例如可以直接沿用结果的文件)。
+    :return: 单元列表，每个单元是文件路径列表。
+    """
+    units = []
+    batch, batch_tokens = [], 0
+
+    def close_batch():
+        nonlocal batch, batch_tokens
+        if batch:
+            units.append(batch)
+        batch, batch_tokens = [], 0
+
+    for file_path in file_paths:
+        size = file_sizes.get(file_path)
+        if file_path in exclude or size is None or size > small_file_max_bytes:
+            close_batch()
+            units.append([file_path])
+            continue
+        file_tokens = size // 4 + 1
+        if batch and (len(batch) >= max_files or batch_tokens + file_tokens > max_tokens):
+            close_batch()
+        batch.append(file_path)
+        batch_tokens += file_tokens
+    close_batch()
+    return units
+
+
+def build_batch_review_messages(files):
+    """
+    :param files: [(文件路径, 文件内容), ...]
+    :return: 合并审查请求的消息列表
+    """
+    files_block = "".join(
+        BATCH_FILE_BLOCK_TEMPLATE.format(marker=BATCH_FILE_MARKER, file_path=file_path, file_content=file_content)
+        for file_path, file_content in files
+    )
+    return build_messages(BATCH_REVIEW_SYSTEM_PROMPT, BATCH_REVIEW_USER_TEMPLATE,
+                          file_count=len(files), files_block=files_block)
+
+
+def split_batch_review(review_text, file_paths):
+    """
+    按 "### 文件: <路径>" 标记将合并审查的回答拆分为每个文件的审查意见。
+    :return: {文件路径: 审查意见}；回答缺少某个文件、某个文件重复出现或某节为空时返回 None，调用方应回退为逐个文件审查。
+    """
+    if not review_text:
+        return None
+    expected = set(file_paths)
+    sections = {}
+    current_path = None
+    current_lines = []
+    for line in review_text.splitlines():
+        match = _SECTION_HEADER.match(line)
+        if match and match.group(1).strip() in expected:
+            if current_path is not None:
+                sections[current_path] = "\n".join(current_lines).strip()
+            current_path = match.group(1).strip()
+            if current_path in sections:
+                return None
+            current_lines = []
+            continue
+        if current_path is None:
+            # 忽略第一个文件标记之前的开场白
+            continue
+        current_lines.append(line)
+    if current_path is not None:
+        sections[current_path] = "\n".join(current_lines).strip()
+    if set(sections) != expected or not all(sections.values()):
+        return None
+    return sections
+
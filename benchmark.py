@@ -0,0 +1,505 @@
+"""
+审查流程的性能基准。
+
+在本地启动一个模拟 DeepSeek API 的 HTTP 服务 (可配置延迟分布、错误率和 429 突发)，
+生成指定规模的合成仓库，分别运行 ProjectReviewer.review_project、FolderReviewer.review_folders 和
+code_reviewer.main，统计耗时、吞吐、峰值内存 (RSS) 和 API 调用次数，不消耗真实的 API 额度。
+
+每个场景在独立的子进程和临时工作目录中运行，峰值内存互不影响，也不会命中上一次运行的缓存。
+
+用法示例:
+    python benchmark.py                                   # 默认规模 10/1000/50000 个文件
+    python benchmark.py --sizes 10,1000 --diff-sizes 10,100 --latency uniform:0.05,0.3
+    python benchmark.py --error-rate 0.02 --burst-every 200 --burst-length 5
+    python benchmark.py --output bench.json               # 保存结果
+    python benchmark.py --baseline bench.json             # 与上次结果比较，退化超过阈值时返回非零退出码
+
+场景中有文件审查失败 (报告中出现错误标记) 或没有发出任何 API 调用时，该场景标记为无效，并返回非零退出码。
+"""
+import argparse
+import json
+import math
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+PACKAGE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# 各场景的报告文件 (位于子进程的临时工作目录)，以及报告中表示某个文件/变更审查失败的标记
+SCENARIO_REPORTS = {
+    "project": "bench_project_report.txt",
+    "folder": "bench_folder_report.txt",
+    "diff": "code_review_issues.txt",
+}
+FAILURE_MARKERS = {
+    "project": ("\n错误: ", "DeepSeek API 请求失败", "解析 DeepSeek API 响应失败"),
+    "folder": ("\n错误: ", "DeepSeek API 请求失败", "解析 DeepSeek API 响应失败"),
+    "diff": ("AI 代码审查失败或无意见。", "未能提取相关方法/函数体。"),
+}
+
+# 模拟服务返回的审查意见，长度与真实回答相近
+MOCK_REVIEW_TEXT = (
+    "### 潜在的 Bug 和逻辑错误\n- 未发现明显问题。\n\n"
+    "### 代码可读性和可维护性\n- 建议补充函数说明，并为边界条件增加校验。\n\n"
+    "### 总结\n该文件结构清晰，整体质量良好。\n"
+) * 4
+
+
+def parse_latency(spec):
+    """
+    解析延迟分布，返回无参数的采样函数 (秒)。
+    支持: "fixed:0.05"、"uniform:0.01,0.2"、"lognormal:均值秒数,sigma"。
+    """
+    kind, _, args = spec.partition(':')
+    values = [float(v) for v in args.split(',')] if args else []
+    if kind == 'fixed':
+        delay = values[0] if values else 0.0
+        return lambda: delay
+    if kind == 'uniform':
+        low, high = values
+        return lambda: random.uniform(low, high)
+    if kind == 'lognormal':
+        mean, sigma = values
+        # 使分布的均值等于给定的 mean
+        mu = math.log(mean) - sigma * sigma / 2 if mean > 0 else 0.0
+        return lambda: random.lognormvariate(mu, sigma)
+    raise ValueError(f"无法识别的延迟分布: {spec}")
+
+
+class MockDeepSeekServer:
+    """
+    本地的 DeepSeek API 替身。chat/completions 请求按延迟分布等待后返回固定的审查意见，
+    支持流式 (SSE) 请求；同时接受企业微信 webhook 请求并直接返回成功。
+    usage 中模拟上下文缓存: 与之前某个请求的 system 消息相同时，这部分输入计为 prompt_cache_hit_tokens。
+
+    :param error_rate: 返回 HTTP 500 的概率。
+    :param burst_every: 每收到多少个请求触发一次 429 突发，0 表示不触发。
+    :param burst_length: 每次突发连续返回 429 的请求数。
+    :param retry_after: 429 响应中的 Retry-After 秒数。
+    :param max_concurrency: 同时处理的请求数上限，超出的请求返回 429 (模拟按 API Key 的并发限流)，0 表示不限制。
+    """
+
+    def __init__(self, latency="fixed:0", error_rate=0.0, burst_every=0, burst_length=0, retry_after=0.2,
+                 max_concurrency=0):
+        self.sample_latency = parse_latency(latency)
+        self.error_rate = error_rate
+        self.burst_every = burst_every
+        self.burst_length = burst_length
+        self.retry_after = retry_after
+        self.max_concurrency = max_concurrency
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.counts = {"requests": 0, "ok": 0, "errors": 0, "throttled": 0, "webhook": 0}
+        self._lock = threading.Lock()
+        self._burst_remaining = 0
+        self._seen_prefixes = set()
+        self._server = None
+
+    def _usage(self, body, payload):
+        """按请求体大小估算 token 数，system 消息已出现过时计为缓存命中"""
+        prompt_tokens = len(body) // 4
+        messages = payload.get("messages") or []
+        prefix = messages[0].get("content", "") if messages and messages[0].get("role") == "system" else ""
+        with self._lock:
+            hit = bool(prefix) and prefix in self._seen_prefixes
+            if prefix:
+                self._seen_prefixes.add(prefix)
+        cache_hit = min(prompt_tokens, len(prefix.encode('utf-8')) // 4) if hit else 0
+        return {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": len(MOCK_REVIEW_TEXT) // 2,
+            "prompt_cache_hit_tokens": cache_hit,
+            "prompt_cache_miss_tokens": prompt_tokens - cache_hit,
+        }
+
+    def _next_outcome(self):
+        """决定本次请求的状态码；返回 200 或 500 时计入在途请求数，处理完后需调用 _finish_request"""
+        with self._lock:
+            self.counts["requests"] += 1
+            if self.max_concurrency and self.in_flight >= self.max_concurrency:
+                self.counts["throttled"] += 1
+                return 429
+            if self.burst_every and self.counts["requests"] % self.burst_every == 0:
+                self._burst_remaining = self.burst_length
+            if self._burst_remaining > 0:
+                self._burst_remaining -= 1
+                self.counts["throttled"] += 1
+                return 429
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+            if self.error_rate and random.random() < self.error_rate:
+                self.counts["errors"] += 1
+                return 500
+            self.counts["ok"] += 1
+            return 200
+
+    def _finish_request(self):
+        with self._lock:
+            self.in_flight -= 1
+
+    def _make_handler(self):
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # 响应头和响应体分两次写出，不关闭 Nagle 算法时会与客户端的延迟 ACK 叠加出约 40ms 的额外延迟
+            disable_nagle_algorithm = True
+
+            def log_message(self, *args):
+                pass
+
+            def _send_json(self, status, body, headers=None):
+                data = json.dumps(body).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _send_stream(self, text, usage=None):
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/event-stream')
+                self.send_header('Transfer-Encoding', 'chunked')
+                self.end_headers()
+                events = [{"choices": [{"delta": {"content": word + " "}, "finish_reason": None}]} for word in text.split(' ')]
+                events.append({"choices": [{"delta": {}, "finish_reason": "stop"}]})
+                if usage is not None:
+                    events.append({"choices": [], "usage": usage})
+                for event in events:
+                    data = f"data: {json.dumps(event, ensure_ascii=False)}\n\n".encode('utf-8')
+                    self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+                done = b"data: [DONE]\n\n"
+                self.wfile.write(b"%x\r\n%s\r\n0\r\n\r\n" % (len(done), done))
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+                if self.path.startswith('/webhook'):
+                    with mock._lock:
+                        mock.counts["webhook"] += 1
+                    self._send_json(200, {"errcode": 0, "errmsg": "ok"})
+                    return
+                status = mock._next_outcome()
+                if status == 429:
+                    self._send_json(429, {"error": "rate limited"}, {"Retry-After": str(mock.retry_after)})
+                    return
+                try:
+                    self._respond(status, body)
+                finally:
+                    mock._finish_request()
+
+            def _respond(self, status, body):
+                time.sleep(max(0.0, mock.sample_latency()))
+                if status != 200:
+                    self._send_json(status, {"error": "mock server error"})
+                    return
+                try:
+                    payload = json.loads(body or b"{}")
+                except ValueError:
+                    payload = {}
+                usage = mock._usage(body, payload)
+                if payload.get("stream"):
+                    include_usage = (payload.get("stream_options") or {}).get("include_usage")
+                    self._send_stream(MOCK_REVIEW_TEXT, usage if include_usage else None)
+                    return
+                self._send_json(200, {
+                    "choices": [{"message": {"role": "assistant", "content": MOCK_REVIEW_TEXT}, "finish_reason": "stop"}],
+                    "usage": usage,
+                })
+
+        return Handler
+
+    def start(self):
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), self._make_handler())
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, name="mock-deepseek", daemon=True).start()
+        return f"http://127.0.0.1:{self._server.server_port}"
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.counts)
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+
+
+def _synthetic_source(index, version=0):
+    """生成第 index 个合成 Python 文件的内容，大小在几百字节到几 KB 之间"""
+    functions = 1 + index % 6
+    lines = [f'"""合成模块 {index}"""', "", "import os", ""]
+    for number in range(functions):
+        lines.append(f"def handler_{index}_{number}(value):")
+        lines.append(f'    """处理第 {number} 类输入"""')
+        for step in range(3 + (index + number) % 8):
+            lines.append(f"    value = value * {step + 1} + {version}  # step {step}")
+        lines.append("    return value")
+        lines.append("")
+    return "\n".join(lines) + "\n"
+
+
+def _git(repo_path, *args):
+    subprocess.run(["git", "-c", "user.name=bench", "-c", "user.email=bench@example.com", *args],
+                   cwd=repo_path, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def create_synthetic_repo(repo_path, file_count, changed_count=0):
+    """
+    生成包含 file_count 个源文件的 git 仓库 (master 分支)。
+    changed_count 大于 0 时再创建 feature 分支，修改其中 changed_count 个文件，用于 diff 审查。
+    已存在的仓库直接复用。
+    """
+    if os.path.isdir(os.path.join(repo_path, '.git')):
+        return repo_path
+    os.makedirs(repo_path, exist_ok=True)
+    for index in range(file_count):
+        directory = os.path.join(repo_path, "src", f"pkg{index // 100:04d}")
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, f"module_{index}.py"), 'w', encoding='utf-8') as f:
+            f.write(_synthetic_source(index))
+    _git(repo_path, "init", "-q", "-b", "master")
+    _git(repo_path, "add", "-A")
+    _git(repo_path, "commit", "-q", "-m", "synthetic base")
+    if changed_count:
+        _git(repo_path, "checkout", "-q", "-b", "feature")
+        step = max(1, file_count // changed_count)
+        for index in range(0, step * changed_count, step):
+            path = os.path.join(repo_path, "src", f"pkg{index // 100:04d}", f"module_{index}.py")
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(_synthetic_source(index, version=1))
+        _git(repo_path, "commit", "-q", "-am", "synthetic change")
+        _git(repo_path, "checkout", "-q", "master")
+    return repo_path
+
+
+def _peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 上单位为 KB，macOS 上为字节
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def count_failed_items(scenario, report_path):
+    """统计报告中审查失败的文件/变更数；报告不存在时返回 None"""
+    if not os.path.exists(report_path):
+        return None
+    with open(report_path, 'r', encoding='utf-8') as f:
+        report = f.read()
+    return sum(report.count(marker) for marker in FAILURE_MARKERS[scenario])
+
+
+def validate_row(row):
+    """
+    检查场景结果是否有效，返回问题描述，有效时返回 None。
+    审查失败的文件或没有任何 API 调用时，耗时和吞吐并不代表审查性能。
+    """
+    if row.get("failed_items") is None:
+        return "未生成报告"
+    if row["failed_items"]:
+        return f"{row['failed_items']} 个文件/变更审查失败"
+    if row["items"] and not row["api"]["requests"]:
+        return "没有发出任何 API 调用"
+    return None
+
+
+def run_scenario(scenario, repo_path, api_url, max_workers, backoff_base):
+    """
+    在当前进程中运行一个场景 (由子进程调用)。
+    :return: {"items": 审查的文件/变更数, "failed_items": 报告中审查失败的数量, "wall_seconds": 耗时,
+              "peak_rss_mb": 峰值内存, "http": 传输层统计}
+    """
+    sys.path.insert(0, PACKAGE_DIR)
+    import http_transport
+    transport = http_transport.ApiTransport(backoff_base=backoff_base)
+    # code_reviewer 使用进程内共享的传输层，这里替换为使用基准退避参数的实例
+    http_transport._default_transport = transport
+
+    started = time.monotonic()
+    if scenario == "project":
+        from full_project_reviewer import ProjectReviewer
+        reviewer = ProjectReviewer(repo_path=repo_path, target_branch="master", deepseek_api_url=api_url,
+                                   max_workers=max_workers, transport=transport, incremental=False, journal_dir=None)
+        reviewer.review_project(SCENARIO_REPORTS["project"])
+        items = reviewer._total_files
+    elif scenario == "folder":
+        from full_project_reviewer import FolderReviewer
+        reviewer = FolderReviewer([repo_path], "bench-key", api_url, max_workers=max_workers, transport=transport)
+        reviewer.review_folders(SCENARIO_REPORTS["folder"])
+        items = int(subprocess.run(["git", "ls-files"], cwd=repo_path, capture_output=True, text=True).stdout.count("\n"))
+    elif scenario == "diff":
+        import code_reviewer
+        code_reviewer.REPO_PATH = repo_path
+        code_reviewer.TARGET_BRANCH = "master"
+        code_reviewer.CURRENT_BRANCH = "feature"
+        code_reviewer.DEEPSEEK_API_URL = api_url
+        # 不发送真实邮件；企业微信通知发往模拟服务
+        code_reviewer.SMTP_HOST = ""
+        code_reviewer.WECHAT_WEBHOOK_URL = api_url + "/webhook"
+        code_reviewer.main()
+        items = subprocess.run(["git", "diff", "--name-only", "master", "feature"], cwd=repo_path,
+                               capture_output=True, text=True).stdout.count("\n")
+    else:
+        raise ValueError(f"未知场景: {scenario}")
+    wall_seconds = time.monotonic() - started
+    return {
+        "items": items,
+        "failed_items": count_failed_items(scenario, os.path.join(os.getcwd(), SCENARIO_REPORTS[scenario])),
+        "wall_seconds": wall_seconds,
+        "peak_rss_mb": _peak_rss_mb(),
+        "http": {"requests": transport.requests_sent, "retries": transport.retries, "failures": transport.failures},
+    }
+
+
+def _run_in_subprocess(scenario, repo_path, api_url, args, log_path):
+    """在独立的子进程和临时工作目录中运行场景，返回结果字典"""
+    with tempfile.TemporaryDirectory(prefix=f"bench-{scenario}-") as work_dir:
+        result_path = os.path.join(work_dir, "result.json")
+        command = [sys.executable, os.path.abspath(__file__), "--run-scenario", scenario,
+                   "--repo", repo_path, "--api-url", api_url, "--result", result_path,
+                   "--max-workers", str(args.max_workers), "--backoff-base", str(args.backoff_base)]
+        with open(log_path, 'a', encoding='utf-8') as log:
+            log.write(f"\n===== {scenario} {repo_path} =====\n")
+            log.flush()
+            completed = subprocess.run(command, cwd=work_dir, stdout=log, stderr=subprocess.STDOUT)
+        if completed.returncode != 0 or not os.path.exists(result_path):
+            raise RuntimeError(f"场景 {scenario} ({repo_path}) 运行失败，详见 {log_path}")
+        with open(result_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+
+def _format_row(row):
+    throughput = row["items"] / row["wall_seconds"] * 60 if row["wall_seconds"] > 0 else 0.0
+    return (f"{row['name']:<22}{row['items']:>8}{row['wall_seconds']:>10.2f}{throughput:>12.1f}"
+            f"{row['peak_rss_mb']:>10.1f}{row['api']['requests']:>10}{row['api']['throttled']:>8}{row['api']['errors']:>8}"
+            f"{row['http']['retries']:>8}{row['http']['failures']:>8}"
+            f"{'  无效: ' + row['invalid'] if row.get('invalid') else ''}")
+
+
+def compare_with_baseline(rows, baseline_path, threshold):
+    """
+    与基线结果比较耗时和峰值内存，超过 (1 + threshold) 倍时视为退化。
+    :return: 退化描述列表。
+    """
+    with open(baseline_path, 'r', encoding='utf-8') as f:
+        baseline = {row["name"]: row for row in json.load(f)["results"]}
+    regressions = []
+    for row in rows:
+        previous = baseline.get(row["name"])
+        if previous is None:
+            continue
+        for metric in ("wall_seconds", "peak_rss_mb"):
+            if previous[metric] > 0 and row[metric] > previous[metric] * (1 + threshold):
+                regressions.append(f"{row['name']} {metric}: {previous[metric]:.2f} -> {row[metric]:.2f} "
+                                   f"(+{row[metric] / previous[metric] - 1:.0%})")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="使用本地模拟 API 对审查流程进行性能基准测试")
+    parser.add_argument("--sizes", default="10,1000,50000", help="全项目/文件夹审查的合成仓库文件数，逗号分隔")
+    parser.add_argument("--diff-sizes", default="10,100,1000", help="diff 审查中变更的文件数，逗号分隔")
+    parser.add_argument("--scenarios", default="project,folder,diff", help="要运行的场景，逗号分隔")
+    parser.add_argument("--latency", default="fixed:0.02", help="模拟 API 的延迟分布，例如 fixed:0.05、uniform:0.01,0.2、lognormal:0.5,0.6")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="模拟 API 返回 HTTP 500 的概率")
+    parser.add_argument("--burst-every", type=int, default=0, help="每多少个请求触发一次 429 突发，0 表示不触发")
+    parser.add_argument("--burst-length", type=int, default=3, help="每次 429 突发的连续请求数")
+    parser.add_argument("--retry-after", type=float, default=0.2, help="429 响应的 Retry-After 秒数")
+    parser.add_argument("--max-concurrency", type=int, default=0, help="模拟 API 同时处理的请求数上限，超出时返回 429，0 表示不限制")
+    parser.add_argument("--max-workers", type=int, default=4, help="审查并发数")
+    parser.add_argument("--backoff-base", type=float, default=0.05, help="重试退避的基础等待时间 (秒)")
+    parser.add_argument("--workdir", default=os.path.join(tempfile.gettempdir(), "code_sentinel_bench"),
+                        help="合成仓库的存放目录，已生成的仓库会被复用")
+    parser.add_argument("--output", help="将结果保存为 JSON 文件")
+    parser.add_argument("--baseline", help="与之比较的上次结果 (JSON)")
+    parser.add_argument("--max-regression", type=float, default=0.2, help="允许的退化比例，默认 0.2 (20%%)")
+    # 以下参数由父进程在启动子进程时使用
+    parser.add_argument("--run-scenario", help=argparse.SUPPRESS)
+    parser.add_argument("--repo", help=argparse.SUPPRESS)
+    parser.add_argument("--api-url", help=argparse.SUPPRESS)
+    parser.add_argument("--result", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_scenario:
+        result = run_scenario(args.run_scenario, args.repo, args.api_url, args.max_workers, args.backoff_base)
+        with open(args.result, 'w', encoding='utf-8') as f:
+            json.dump(result, f)
+        return 0
+
+    scenarios = [name.strip() for name in args.scenarios.split(',') if name.strip()]
+    sizes = [int(size) for size in args.sizes.split(',') if size.strip()]
+    diff_sizes = [int(size) for size in args.diff_sizes.split(',') if size.strip()]
+    os.makedirs(args.workdir, exist_ok=True)
+    log_path = os.path.join(args.workdir, "benchmark.log")
+    print(f"合成仓库目录: {args.workdir}，审查输出日志: {log_path}")
+
+    runs = []
+    for size in sizes:
+        if "project" in scenarios or "folder" in scenarios:
+            repo_path = os.path.join(args.workdir, f"repo-{size}")
+            print(f"准备 {size} 个文件的合成仓库...")
+            create_synthetic_repo(repo_path, size)
+            for scenario in ("project", "folder"):
+                if scenario in scenarios:
+                    runs.append((f"{scenario}-{size}", scenario, repo_path))
+    if "diff" in scenarios:
+        for changed in diff_sizes:
+            repo_path = os.path.join(args.workdir, f"diff-repo-{changed}")
+            print(f"准备变更 {changed} 个文件的合成仓库...")
+            create_synthetic_repo(repo_path, max(changed * 2, 10), changed_count=changed)
+            runs.append((f"diff-{changed}", "diff", repo_path))
+
+    mock = MockDeepSeekServer(args.latency, args.error_rate, args.burst_every, args.burst_length, args.retry_after,
+                              args.max_concurrency)
+    api_url = mock.start()
+    print(f"模拟 DeepSeek API: {api_url} (延迟 {args.latency}，错误率 {args.error_rate}，"
+          f"429 突发 每 {args.burst_every} 个请求 {args.burst_length} 次，并发上限 {args.max_concurrency or '不限'})")
+
+    header = (f"{'场景':<20}{'文件数':>6}{'耗时(s)':>9}{'文件/分钟':>8}{'RSS(MB)':>10}"
+              f"{'API调用':>7}{'429':>8}{'5xx':>8}{'重试':>6}{'失败':>6}")
+    print(header)
+    rows = []
+    try:
+        for name, scenario, repo_path in runs:
+            before = mock.snapshot()
+            result = _run_in_subprocess(scenario, repo_path, api_url, args, log_path)
+            after = mock.snapshot()
+            row = dict(result, name=name, api={key: after[key] - before[key] for key in after})
+            row["invalid"] = validate_row(row)
+            rows.append(row)
+            print(_format_row(row))
+    finally:
+        mock.stop()
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({"config": {k: v for k, v in vars(args).items() if not k.startswith(('run_', 'repo', 'api_', 'result'))},
+                       "results": rows}, f, ensure_ascii=False, indent=2)
+        print(f"结果已保存至: {args.output}")
+
+    invalid_rows = [row for row in rows if row["invalid"]]
+    if invalid_rows:
+        print(f"以下场景的结果无效 (详见 {log_path})，不能用于性能比较:")
+        for row in invalid_rows:
+            print(f"  {row['name']}: {row['invalid']}")
+        return 1
+
+    if args.baseline:
+        regressions = compare_with_baseline(rows, args.baseline, args.max_regression)
+        if regressions:
+            print("检测到性能退化:")
+            for line in regressions:
+                print(f"  {line}")
+            return 1
+        print(f"与基线相比未发现超过 {args.max_regression:.0%} 的退化。")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
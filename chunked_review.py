@@ -0,0 +1,236 @@
+import os
+import re
+from collections import namedtuple
+
+from concurrent_review import imap_ordered
+from prompt_templates import (
+    CHUNK_REVIEW_SYSTEM_PROMPT,
+    CHUNK_REVIEW_USER_TEMPLATE,
+    CONSOLIDATE_REVIEW_SYSTEM_PROMPT,
+    CONSOLIDATE_REVIEW_USER_TEMPLATE,
+    build_messages
+)
+
+# 代码块: 起止行号从 1 开始且包含两端
+CodeChunk = namedtuple('CodeChunk', ['start_line', 'end_line', 'text'])
+
+# 各语言中标志着函数/类定义开始的行
+_PYTHON_DEFINITION = re.compile(r'^\s*(?:async\s+def|def|class)\s+\w+')
+_BRACE_LANGUAGE_DEFINITION = re.compile(
+    r'^\s*(?:'
+    r'(?:public|private|protected|internal|open|fileprivate|static|final|abstract|override|'
+    r'synchronized|native|inline|suspend|data|sealed|export|default|async|virtual|const|extern)\s+)*'
+    r'(?:class|struct|enum|interface|protocol|extension|object|func|fun|function|'
+    r'@interface|@implementation|@protocol|@end|impl|trait|namespace|typedef\s+struct)\b'
+)
+# ObjC 方法、Go 方法、C/C++/Java 风格的 "返回类型 名称(参数) {" 定义
+_OBJC_METHOD = re.compile(r'^[-+]\s*\(')
+_C_STYLE_FUNCTION = re.compile(
+    r'^\s*(?!(?:return|else|if|while|for|switch|case|new|throw|delete|sizeof|await|yield|do)\b)'
+    r'[A-Za-z_][\w\s\*&<>,:\[\]]*\s+\**[A-Za-z_][\w:~]*\s*\([^;]*$'
+)
+# 紧挨在定义之前、应当与定义放在同一块中的注释和注解
+_LEADING_DECORATION = re.compile(r'^\s*(?:@\w|#\[|//|///|/\*|\*|#(?!include|import|define|if|endif|else|pragma))')
+
+PYTHON_EXTENSIONS = ('.py',)
+
+
+def estimate_tokens(text):
+    """
+    粗略估算文本的 token 数，不依赖任何分词器。
+    ASCII 字符约 4 个对应 1 个 token，中文等非 ASCII 字符约 1 个对应 1 个 token。
+    """
+    if not text:
+        return 0
+    non_ascii = sum(1 for ch in text if ord(ch) > 127)
+    return (len(text) - non_ascii) // 4 + non_ascii + 1
+
+
+def _is_definition_start(line, is_python):
+    if is_python:
+        return bool(_PYTHON_DEFINITION.match(line))
+    return bool(_BRACE_LANGUAGE_DEFINITION.match(line) or _OBJC_METHOD.match(line) or _C_STYLE_FUNCTION.match(line))
+
+
+def _definition_boundaries(lines, file_path):
+    """返回所有可作为切分点的行下标 (从 0 开始)，定义前的注释/注解会归入该定义"""
+    is_python = os.path.splitext(file_path)[1].lower() in PYTHON_EXTENSIONS
+    boundaries = {0}
+    for index, line in enumerate(lines):
+        if not _is_definition_start(line, is_python):
+            continue
+        start = index
+        while start > 0 and _LEADING_DECORATION.match(lines[start - 1]):
+            start -= 1
+        boundaries.add(start)
+    return sorted(boundaries)
+
+
+def _split_oversized_segment(lines, start_index, max_tokens):
+    """将超过预算的单个定义按空行切开，仍然过大时按行硬切"""
+    pieces = []
+    current, current_tokens, current_start = [], 0, start_index
+    last_blank = None
+    for line in lines:
+        line_tokens = estimate_tokens(line)
+        if current and current_tokens + line_tokens > max_tokens:
+            if last_blank is not None and last_blank > 0:
+                pieces.append((current_start, current[:last_blank]))
+                current = current[last_blank:]
+                current_start += last_blank
+            else:
+                pieces.append((current_start, current))
+                current_start += len(current)
+                current = []
+            current_tokens = sum(estimate_tokens(l) for l in current)
+            last_blank = None
+        current.append(line)
+        current_tokens += line_tokens
+        if not line.strip():
+            last_blank = len(current)
+    if current:
+        pieces.append((current_start, current))
+    return pieces
+
+
+def split_into_chunks(content, file_path, max_tokens):
+    """
+    在函数/类定义边界处将文件切分为若干块，每块的估算 token 数不超过 max_tokens。
+    相邻的小定义会被合并进同一块；单个超大的定义会在空行处再次切分。
+    :return: CodeChunk 列表，覆盖文件的全部内容，不丢弃任何行。
+    """
+    lines = content.splitlines(keepends=True)
+    if not lines:
+        return []
+    boundaries = _definition_boundaries(lines, file_path) + [len(lines)]
+
+    segments = []
+    for start, end in zip(boundaries, boundaries[1:]):
+        segment_lines = lines[start:end]
+        if estimate_tokens("".join(segment_lines)) > max_tokens:
+            segments.extend(_split_oversized_segment(segment_lines, start, max_tokens))
+        else:
+            segments.append((start, segment_lines))
+
+    chunks = []
+    current_start, current_lines, current_tokens = None, [], 0
+    for start, segment_lines in segments:
+        segment_tokens = estimate_tokens("".join(segment_lines))
+        if current_lines and current_tokens + segment_tokens > max_tokens:
+            chunks.append(CodeChunk(current_start + 1, current_start + len(current_lines), "".join(current_lines)))
+            current_start, current_lines, current_tokens = None, [], 0
+        if current_start is None:
+            current_start = start
+        current_lines.extend(segment_lines)
+        current_tokens += segment_tokens
+    if current_lines:
+        chunks.append(CodeChunk(current_start + 1, current_start + len(current_lines), "".join(current_lines)))
+    return chunks
+
+
+def select_chunks_for_hunk(chunks, diff_hunk, max_tokens):
+    """
+    从文件的代码块中选出包含 diff hunk 中上下文行或新增行的块，按原顺序拼接返回。
+    匹配的块总量超过 max_tokens 时，优先保留匹配行最多的块。
+    没有任何块匹配时返回第一个块。
+    """
+    hunk_lines = set()
+    for line in diff_hunk.splitlines():
+        if line.startswith(('+', ' ')) and not line.startswith('+++'):
+            stripped = line[1:].strip()
+            if len(stripped) > 3:
+                hunk_lines.add(stripped)
+
+    scored = []
+    for index, chunk in enumerate(chunks):
+        chunk_lines = {l.strip() for l in chunk.text.splitlines()}
+        score = len(hunk_lines & chunk_lines)
+        if score:
+            scored.append((score, index))
+    if not scored:
+        return chunks[:1]
+
+    selected, used_tokens = [], 0
+    for score, index in sorted(scored, key=lambda item: (-item[0], item[1])):
+        chunk_tokens = estimate_tokens(chunks[index].text)
+        if selected and used_tokens + chunk_tokens > max_tokens:
+            continue
+        selected.append(index)
+        used_tokens += chunk_tokens
+    return [chunks[index] for index in sorted(selected)]
+
+
+def format_chunks_as_excerpt(chunks):
+    """将若干代码块拼接为带行号范围标记的文件节选"""
+    parts = []
+    for chunk in chunks:
+        parts.append(f"// ---- 第 {chunk.start_line}-{chunk.end_line} 行 ----\n{chunk.text}")
+    return "\n".join(parts)
+
+
+def review_in_chunks(file_path, file_content, call_api, max_tokens, max_workers=1, is_error=None):
+    """
+    对超大文件执行 map-reduce 审查：按定义边界切块并行审查，再把各块的意见整合为一份报告。
+    各块意见过多、单次整合超出预算时，会分批逐级整合，整体调用次数与文件大小成线性关系。
+
+    :param call_api: 调用模型的函数，签名为 call_api(messages)，返回审查文本。
+    :param max_tokens: 每块 (以及每次整合输入) 的 token 预算。
+    :param max_workers: 并行审查各块时的并发数。本函数通常在文件级的并发审查线程中调用，
+                        call_api 应与文件级共用同一个并发上限 (审查器的 _api_slots)，避免在途请求数成倍增加。
+    :param is_error: 判断 call_api 返回值是否表示失败的函数，默认将空结果视为失败。
+    :return: (整合后的审查意见, 是否所有调用均成功)
+    """
+    if is_error is None:
+        is_error = lambda text: not text
+
+    chunks = split_into_chunks(file_content, file_path, max_tokens)
+    total_lines = chunks[-1].end_line if chunks else 0
+    print(f"  文件 {file_path} 将拆分为 {len(chunks)} 个部分进行审查 (每部分约 {max_tokens} tokens)。")
+
+    def review_chunk(indexed_chunk):
+        part, chunk = indexed_chunk
+        return call_api(build_messages(
+            CHUNK_REVIEW_SYSTEM_PROMPT, CHUNK_REVIEW_USER_TEMPLATE,
+            file_path=file_path, part=part, total_parts=len(chunks),
+            start_line=chunk.start_line, end_line=chunk.end_line,
+            total_lines=total_lines, chunk_content=chunk.text
+        ))
+
+    chunk_reviews = list(imap_ordered(review_chunk, enumerate(chunks, start=1), max_workers=max_workers))
+    all_ok = not any(is_error(review) for review in chunk_reviews)
+    if len(chunks) == 1:
+        return chunk_reviews[0], all_ok
+
+    findings = []
+    for chunk, review in zip(chunks, chunk_reviews):
+        findings.append(f"### 第 {chunk.start_line}-{chunk.end_line} 行\n{review or '该部分审查失败。'}")
+
+    def consolidate(group):
+        return call_api(build_messages(
+            CONSOLIDATE_REVIEW_SYSTEM_PROMPT, CONSOLIDATE_REVIEW_USER_TEMPLATE,
+            file_path=file_path, total_lines=total_lines, chunk_findings="\n\n".join(group)
+        ))
+
+    # 意见总量超出预算时先分组整合，直到可以一次完成最终整合
+    while len(findings) > 1 and estimate_tokens("\n\n".join(findings)) > max_tokens:
+        groups, current, current_tokens = [], [], 0
+        for finding in findings:
+            finding_tokens = estimate_tokens(finding)
+            if current and current_tokens + finding_tokens > max_tokens:
+                groups.append(current)
+                current, current_tokens = [], 0
+            current.append(finding)
+            current_tokens += finding_tokens
+        groups.append(current)
+        if len(groups) == len(findings):
+            # 每组只有一条意见，无法继续缩减，直接进行最终整合
+            break
+        merged = list(imap_ordered(consolidate, groups, max_workers=max_workers))
+        all_ok = all_ok and not any(is_error(review) for review in merged)
+        findings = [review or "该部分整合失败。" for review in merged]
+
+    final_review = consolidate(findings)
+    if is_error(final_review):
+        # 整合失败时保留各部分的原始意见，不丢弃已经获得的审查结果
+        return "\n\n".join(findings), False
+    return final_review, all_ok
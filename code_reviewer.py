@@ -1,23 +1,37 @@
 import subprocess
-import re
-import smtplib
-try:
-    import requests
-except ImportError:
-    # 如果无法导入requests模块,提示安装
-    raise ImportError("请先使用pip安装requests模块: pip install requests")
+import tempfile
+import threading
+import time
 import json
 import os
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
 
 # 从 file_filter.py 导入 FileFilter 类
 from file_filter import FileFilter
+from review_cache import ReviewCache, git_blob_sha
+from http_transport import ApiRequestError, STREAM_CUTOFF_MARKER, get_default_transport
+from llm_router import create_router
+from chunked_review import format_chunks_as_excerpt, select_chunks_for_hunk, split_into_chunks
+from method_extractor import extract_enclosing_methods
+from diff_parser import iter_file_diffs, parse_diff
+from git_blob_reader import GitBlobReader
+from report_writer import ReportWriter, read_report_preview
+from notifier import get_default_dispatcher
+from review_metrics import MetricsRun, get_default_metrics, git_stage_name
+from review_dedup import ReviewDeduplicator, content_key, normalize_content, normalize_hunk
+from prompt_templates import (
+    EXTRACT_METHOD_SYSTEM_PROMPT,
+    EXTRACT_METHOD_USER_TEMPLATE,
+    METHOD_REVIEW_SYSTEM_PROMPT,
+    METHOD_REVIEW_USER_TEMPLATE,
+    build_messages,
+    prompt_fingerprint
+)
 
 # 从 config.py 导入配置
 from config import (
     DEEPSEEK_API_KEY, 
     DEEPSEEK_API_URL, 
+    DEEPSEEK_MODEL,
     WECHAT_WEBHOOK_URL,
     SMTP_HOST,
     SMTP_PORT,
@@ -28,13 +42,29 @@ from config import (
     # 导入新的过滤配置
     DEFAULT_IGNORED_FOLDERS,
     DEFAULT_ALLOWED_FILE_EXTENSIONS,
-    DEFAULT_IGNORED_FILES
+    DEFAULT_IGNORED_FILES,
+    DEFAULT_IGNORE_PATTERNS,
+    REVIEW_CACHE_ENABLED,
+    REVIEW_CACHE_PATH,
+    REVIEW_CACHE_MAX_AGE_DAYS,
+    REVIEW_CACHE_MAX_SIZE_MB,
+    CHUNKED_REVIEW_ENABLED,
+    CHUNK_MAX_TOKENS,
+    LOCAL_METHOD_EXTRACTION_ENABLED,
+    READ_FILES_FROM_GIT,
+    API_STREAM_ENABLED,
+    STREAM_MAX_SECONDS,
+    STREAM_MAX_OUTPUT_TOKENS,
+    DEDUP_REVIEW_ENABLED
 )
 
 # --- 配置信息 ---
 REPO_PATH = "/Users/XXX/XXX"  # Git 项目路径
 TARGET_BRANCH = "origin/master"  # 比较的目标分支，设置为 master
 CURRENT_BRANCH = "feat_1024" # 当前分支，设置为 feat_1024
+DEEPSEEK_MAX_TOKENS = 3000 # 根据需要调整
+EXTRACT_CONTENT_MAX_LENGTH = 8000 # 提取方法体时随提示词发送的文件内容字符数上限
+EMAIL_REPORT_MAX_CHARS = 20000 # 邮件正文中附带的报告字符数上限，超出部分请查看报告文件
 
 # --- 初始化 FileFilter ---
 # 您可以在这里或 main 函数中根据需要自定义这些列表
@@ -42,16 +72,30 @@ CURRENT_BRANCH = "feat_1024" # 当前分支，设置为 feat_1024
 file_filter = FileFilter(
     ignored_folders=DEFAULT_IGNORED_FOLDERS,
     allowed_extensions=DEFAULT_ALLOWED_FILE_EXTENSIONS,
-    ignored_files=DEFAULT_IGNORED_FILES
+    ignored_files=DEFAULT_IGNORED_FILES,
+    ignore_patterns=DEFAULT_IGNORE_PATTERNS
 )
 
+# --- 初始化审查缓存 ---
+# 方法体提取结果以 文件 blob SHA + diff hunk + 提示词模板 + 模型 为键缓存，数据库在首次使用时才创建
+review_cache = ReviewCache(
+    REVIEW_CACHE_PATH,
+    max_age_days=REVIEW_CACHE_MAX_AGE_DAYS,
+    max_size_mb=REVIEW_CACHE_MAX_SIZE_MB
+) if REVIEW_CACHE_ENABLED else None
+
+# --- 初始化内容去重 ---
+# 同一次运行中，相同的变更 (同一文件内容中的相同 hunk) 只提取一次方法体，相同的方法/函数代码只审查一次
+review_deduplicator = ReviewDeduplicator(DEDUP_REVIEW_ENABLED)
+
 # --- 辅助函数 ---
 
 def run_command(command, cwd=None):
     """执行 shell 命令并返回输出"""
     try:
-        process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, shell=True, cwd=cwd, text=True)
-        stdout, stderr = process.communicate()
+        with get_default_metrics().span(git_stage_name(command)):
+            process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, shell=True, cwd=cwd, text=True)
+            stdout, stderr = process.communicate()
         if process.returncode != 0:
             print(f"命令执行错误: {command}")
             print(f"Stderr: {stderr}")
@@ -61,8 +105,38 @@ def run_command(command, cwd=None):
         print(f"执行命令时发生异常 {command}: {e}")
         return None
 
-def get_git_diff(repo_path, target_branch, current_branch):
-    """获取 git diff 内容"""
+def stream_command_lines(command, cwd=None):
+    """
+    执行 shell 命令并逐行产出标准输出，不会把完整输出读入内存。
+    stderr 写入临时文件以避免管道写满导致死锁。
+    命令以非零状态退出时，在产出全部输出后抛出 subprocess.CalledProcessError。
+    只把等待命令输出的时间计入该命令的阶段耗时，调用方处理每一行的时间不计入。
+    """
+    waited = 0.0
+    with tempfile.TemporaryFile() as stderr_file:
+        started = time.perf_counter()
+        process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=stderr_file, shell=True, cwd=cwd,
+                                   text=True, encoding='utf-8', errors='replace')
+        try:
+            for line in process.stdout:
+                waited += time.perf_counter() - started
+                yield line
+                started = time.perf_counter()
+            waited += time.perf_counter() - started
+        finally:
+            get_default_metrics().record(git_stage_name(command), waited)
+            # 调用方提前结束迭代时终止子进程，避免残留
+            if process.poll() is None:
+                process.stdout.close()
+                process.kill()
+            process.wait()
+        if process.returncode != 0:
+            stderr_file.seek(0)
+            stderr = stderr_file.read().decode('utf-8', errors='replace')
+            raise subprocess.CalledProcessError(process.returncode, command, stderr=stderr)
+
+def resolve_diff_base(repo_path, target_branch, current_branch):
+    """拉取远程更新并计算 target_branch 与 current_branch 的 merge-base，失败时返回 None"""
     remote_name = target_branch.split('/')[0] if '/' in target_branch else 'origin'
     
     print(f"正在尝试从远程 '{remote_name}' 获取最新信息...")
@@ -97,333 +171,345 @@ def get_git_diff(repo_path, target_branch, current_branch):
         print(f"  2. 当前分支 '{current_branch}' 可能不是一个有效的分支名或引用。")
         print(f"  3. 目标分支 '{target_branch}' 虽然存在，但与当前分支无关。")
         return None
-    merge_base = merge_base.strip()
+    return merge_base.strip()
 
+def get_git_diff(repo_path, target_branch, current_branch):
+    """获取完整的 git diff 内容 (一次性读入内存；大 diff 请使用 iter_git_diff_files)"""
+    merge_base = resolve_diff_base(repo_path, target_branch, current_branch)
+    if merge_base is None:
+        return None
     diff_command = f"git diff {merge_base} {current_branch}"
     print(f"执行 diff 命令: {diff_command}")
     diff_output = run_command(diff_command, cwd=repo_path)
     return diff_output
 
-def call_deepseek_api(messages):
-    """调用 DeepSeek API"""
-    headers = {
-        "Content-Type": "application/json",
-        "Authorization": f"Bearer {DEEPSEEK_API_KEY}" # 使用导入的 DEEPSEEK_API_KEY
-    }
+def iter_git_diff_files(repo_path, merge_base, current_branch):
+    """
+    以流式方式执行 git diff，每解析完一个文件的 diff 就立即产出对应的 FileDiff。
+    内存占用只与单个文件的 diff 大小有关，与整个 diff 的大小无关。
+    """
+    diff_command = f"git diff {merge_base} {current_branch}"
+    print(f"执行 diff 命令 (流式读取): {diff_command}")
+    return iter_file_diffs(stream_command_lines(diff_command, cwd=repo_path))
+
+# --- 模型路由器 ---
+# 同一次运行中的所有请求共用一个路由器，使后端健康统计和对冲策略在请求之间保持；main() 开始时按当前配置重新创建
+_router = None
+_router_lock = threading.Lock()
+
+
+def get_router(reset=False):
+    """
+    返回本次运行共用的路由器，尚未创建时按当前的 DEEPSEEK_API_KEY / DEEPSEEK_API_URL / DEEPSEEK_MODEL 创建。
+    :param reset: 为 True 时丢弃已有的路由器并重新创建 (配置可能在两次运行之间被修改)。
+    """
+    global _router
+    with _router_lock:
+        if _router is None or reset:
+            _router = create_router(DEEPSEEK_API_KEY, DEEPSEEK_API_URL, DEEPSEEK_MODEL)
+        return _router
+
+
+def call_deepseek_api(messages, progress_label="DeepSeek API"):
+    """
+    调用 DeepSeek API
+    :param progress_label: 启用流式输出时，打印生成进度使用的名称。
+    """
     payload = {
-        "model": "deepseek-coder", # 或者其他适合的模型
+        "model": DEEPSEEK_MODEL, # 在 config.py 中配置
         "messages": messages,
-        "max_tokens": 3000, # 根据需要调整
+        "max_tokens": DEEPSEEK_MAX_TOKENS,
         "temperature": 0.5, # 根据需要调整
     }
     try:
- # 增加超时时间
-        response = requests.post(DEEPSEEK_API_URL, headers=headers, json=payload, timeout=120) # 使用导入的 DEEPSEEK_API_URL
-        response.raise_for_status()  # 如果请求失败则抛出 HTTPError
-        return response.json()["choices"][0]["message"]["content"]
-    except requests.exceptions.RequestException as e:
+        # 通过共享的传输层发送请求，复用连接并自动重试 429/5xx；配置了多个后端时按延迟路由并在失败时切换
+        return get_router().complete(
+            payload, timeout=120,
+            stream=API_STREAM_ENABLED, stream_max_seconds=STREAM_MAX_SECONDS,
+            stream_max_output_tokens=STREAM_MAX_OUTPUT_TOKENS, progress_label=progress_label
+        )
+    except ApiRequestError as e:
         print(f"DeepSeek API 请求失败: {e}")
-        if hasattr(e, 'response') and e.response is not None:
-            print(f"API 响应内容: {e.response.text}")
+        if e.response_text:
+            print(f"API 响应内容: {e.response_text}")
         return None
-    except (KeyError, IndexError) as e:
+    except (KeyError, IndexError, TypeError) as e:
         print(f"解析 DeepSeek API 响应失败: {e}")
-        # 检查response变量是否存在并且是否有text属性
-        response_text = getattr(requests.post(DEEPSEEK_API_URL, headers=headers, json=payload, timeout=120), 'text', 'N/A') if 'response' in locals() else 'N/A'
-        print(f"API 原始响应: {response_text}")
         return None
 
 
 def extract_full_method_from_deepseek(file_path, diff_hunk, file_content_str):
     """使用 DeepSeek 从 diff hunk 和文件内容中提取完整方法体"""
-    prompt = f"""
-    文件路径: {file_path}
-    以下是该文件中的一段代码变更 (git diff hunk):
-    ```diff
-    {diff_hunk}
-    ```
-    以下是该文件的当前完整内容:
-    ```
-    {file_content_str[:8000]} 
-    ```
-    (注意: 为简洁起见，文件内容可能被截断)
-
-    请基于上述 diff hunk 和文件内容，识别并提取出包含这些变更的完整方法或函数体。
-    如果变更位于类定义之外的全局范围，请指出。
-    如果变更跨越多个方法或无法清晰界定单个方法，请说明情况。
-    请仅返回提取到的完整方法/函数代码，如果无法提取或不适用，请明确说明原因。
-    """
-    messages = [{"role": "user", "content": prompt}]
-    return call_deepseek_api(messages)
+    cache_key = None
+    if review_cache is not None:
+        cache_key = ReviewCache.make_key(
+            "extract_full_method", git_blob_sha(file_content_str), git_blob_sha(diff_hunk), file_path,
+            prompt_fingerprint(EXTRACT_METHOD_SYSTEM_PROMPT, EXTRACT_METHOD_USER_TEMPLATE), DEEPSEEK_MODEL, DEEPSEEK_MAX_TOKENS,
+            CHUNK_MAX_TOKENS if CHUNKED_REVIEW_ENABLED else 0
+        )
+        cached_method = review_cache.get(cache_key)
+        if cached_method is not None:
+            print(f"  文件与变更未改变，使用缓存的方法体提取结果。")
+            return cached_method
+
+    file_excerpt = file_content_str[:EXTRACT_CONTENT_MAX_LENGTH]
+    if CHUNKED_REVIEW_ENABLED and len(file_content_str) > EXTRACT_CONTENT_MAX_LENGTH:
+        # 文件过大时，只发送包含本次变更的函数/类所在的代码块，而不是文件开头的固定长度
+        chunks = split_into_chunks(file_content_str, file_path, CHUNK_MAX_TOKENS // 2)
+        file_excerpt = format_chunks_as_excerpt(select_chunks_for_hunk(chunks, diff_hunk, CHUNK_MAX_TOKENS))
+
+    with get_default_metrics().span("prompt_build"):
+        messages = build_messages(
+            EXTRACT_METHOD_SYSTEM_PROMPT, EXTRACT_METHOD_USER_TEMPLATE,
+            file_path=file_path,
+            diff_hunk=diff_hunk,
+            file_content=file_excerpt
+        )
+    full_method = call_deepseek_api(messages, progress_label=f"{file_path} 方法体提取")
+    # 流式生成被提前截断的方法体不完整，不写入缓存
+    if cache_key is not None and full_method and STREAM_CUTOFF_MARKER not in full_method:
+        review_cache.put(cache_key, full_method)
+    return full_method
 
 def get_code_review_from_deepseek(file_path, method_code):
     """使用 DeepSeek 对方法代码进行审查"""
     if not method_code or "无法提取" in method_code or "不适用" in method_code:
         return "无法获取方法代码进行审查，或变更不适用于方法级审查。"
 
-    prompt = f"""
-    请对以下位于文件 '{file_path}' 中的代码进行审查:
-    ```
-    {method_code}
-    ```
-    请关注以下方面：
-    1.  潜在的 Bug 和逻辑错误。
-    2.  安全漏洞。
-    3.  代码可读性和可维护性。
-    4.  性能问题。
-    5.  是否遵循常见的编程最佳实践和代码风格。
-    6.  提出具体的改进建议。
-
-    请以清晰、简洁的方式给出您的审查意见。
-    """
-    messages = [{"role": "user", "content": prompt}]
-    return call_deepseek_api(messages)
+    with get_default_metrics().span("prompt_build"):
+        messages = build_messages(METHOD_REVIEW_SYSTEM_PROMPT, METHOD_REVIEW_USER_TEMPLATE,
+                                  file_path=file_path, method_code=method_code)
+    return call_deepseek_api(messages, progress_label=file_path)
 
 
-def parse_diff_hunks(diff_output):
+def iter_diff_hunks(file_diffs):
     """
-    解析 git diff 输出，提取文件路径和 diff hunks。
-    返回一个列表，每个元素是一个字典: {'file_path': str, 'hunks': [str]}
+    将 FileDiff 序列转换为待审查的变更条目，逐个产出。
+    每个条目是一个字典: {'file_path': str, 'hunk_content': str, 'file_diff': FileDiff}
+    其中 file_diff 保留了每个 hunk 的新旧行号范围以及新增/删除/重命名/二进制等标记。
+    已删除的文件和二进制文件没有可审查的代码，会被跳过。
     """
-    if not diff_output:
-        return []
-
-    changed_files_hunks = []
-    current_file_path = None
-    current_hunks = []
-
-    # 正则表达式匹配 diff --git a/... b/... 行，并捕获 b 文件路径
-    # 它会处理文件名中包含空格的情况
-    file_path_pattern = re.compile(r'^diff --git a/(.+) b/(.+)$')
-    # 正则表达式匹配 @@ ... @@ 行
-    hunk_header_pattern = re.compile(r'^@@ -\d+(?:,\d+)? \+\d+(?:,\d+)? @@')
-
-    lines = diff_output.splitlines()
-    
-    for i, line in enumerate(lines):
-        match_file_path = file_path_pattern.match(line)
-        if match_file_path:
-            if current_file_path and current_hunks:
-                changed_files_hunks.append({'file_path': current_file_path, 'hunks': current_hunks})
-            
-            # 优先使用 b 文件路径，因为它代表更改后的文件
-            # 移除路径中可能存在的 "..." (如果文件名包含空格且被引号包围)
-            current_file_path = match_file_path.group(2).strip('"')
-            current_hunks = []
-            # print(f"解析到文件: {current_file_path}") # 调试信息
+    for file_diff in file_diffs:
+        if file_diff.is_binary:
+            print(f"跳过二进制文件: {file_diff.file_path}")
+            continue
+        if file_diff.is_deleted:
+            print(f"跳过已删除的文件: {file_diff.file_path}")
+            continue
+        if not file_diff.hunks:
+            # 例如仅修改了文件权限或纯重命名
             continue
+        yield {
+            'file_path': file_diff.file_path,
+            'hunk_content': file_diff.hunk_content(),
+            'file_diff': file_diff
+        }
 
-        if current_file_path: # 确保我们已经识别了一个文件
-            # 检查是否是 hunk 内容的一部分 (以 + 或 - 或空格开头，但不是 --- 或 +++)
-            # 并且前面有 hunk header
-            is_hunk_line = line.startswith(('+', '-', ' ')) and \
-                           not line.startswith('---') and \
-                           not line.startswith('+++')
-            
-            if is_hunk_line:
-                # 查找最近的 hunk_header
-                found_hunk_header = False
-                for j in range(i - 1, max(-1, i - 20), -1): # 向上查找几行
-                    if j < 0 or j >= len(lines): break
-                    if hunk_header_pattern.match(lines[j]):
-                        found_hunk_header = True
-                        break
-                if found_hunk_header:
-                     current_hunks.append(line)
-
-
-    if current_file_path and current_hunks: # 添加最后一个文件
-        changed_files_hunks.append({'file_path': current_file_path, 'hunks': ["\n".join(current_hunks)]}) # 将hunks列表合并成一个字符串
-
-    # 进一步处理，将每个文件的hunks列表聚合成单个hunk字符串
-    # (上面的逻辑已经尝试这么做了，但这里可以确保格式)
-    processed_list = []
-    for item in changed_files_hunks:
-        if item['hunks']: # 确保hunks不为空
-             # 将hunks列表中的所有字符串连接成一个大的diff hunk字符串
-            full_hunk_for_file = "\n".join(item['hunks'])
-            if full_hunk_for_file.strip(): # 确保不是空hunk
-                processed_list.append({'file_path': item['file_path'], 'hunk_content': full_hunk_for_file})
-    
-    return processed_list
+
+def parse_diff_hunks(diff_output):
+    """
+    解析完整的 git diff 输出，返回变更条目列表 (格式见 iter_diff_hunks)。
+    """
+    return list(iter_diff_hunks(parse_diff(diff_output)))
 
 
 def send_email(subject, body, receiver_email):
-    """发送邮件"""
+    """提交邮件到后台通知分发器发送 (复用 SMTP 连接，不阻塞审查流程)"""
     if not all([SMTP_HOST, SMTP_USER, SMTP_PASSWORD, EMAIL_SENDER]):
         print("SMTP 配置不完整，跳过发送邮件。请检查 config.py 中的 SMTP_HOST, SMTP_USER, SMTP_PASSWORD, EMAIL_SENDER。")
         return
 
-    msg = MIMEMultipart()
-    msg['From'] = EMAIL_SENDER
-    msg['To'] = receiver_email
-    msg['Subject'] = subject
+    smtp_config = {
+        "host": SMTP_HOST,
+        "port": SMTP_PORT,
+        "user": SMTP_USER,
+        "password": SMTP_PASSWORD,
+        "sender": EMAIL_SENDER,
+        "receiver": receiver_email
+    }
+    get_default_dispatcher().send_email(smtp_config, subject, body, receiver_email)
 
-    msg.attach(MIMEText(body, 'plain', 'utf-8')) # 或者 'html' 如果body是HTML
+def send_wechat_notification(webhook_url, message):
+    """提交企业微信 markdown 通知到后台通知分发器发送，超出长度上限的消息会拆分为多条"""
+    get_default_dispatcher().send_wechat(webhook_url, message)
 
-    try:
-        server = smtplib.SMTP(SMTP_HOST, SMTP_PORT)
-        server.starttls()  # 使用TLS加密
-        server.login(SMTP_USER, SMTP_PASSWORD)
-        text = msg.as_string()
-        server.sendmail(EMAIL_SENDER, receiver_email, text)
-        server.quit()
-        print(f"邮件已成功发送至 {receiver_email}")
-    except Exception as e:
-        print(f"发送邮件失败: {e}")
 
-def send_wechat_notification(webhook_url, message):
-    """发送企业微信通知"""
-    headers = {'Content-Type': 'application/json'}
-    payload = {
-        "msgtype": "markdown",  # 或者 "text"
-        "markdown": {
-            "content": message
-        }
-    }
-    # 对于 "text" 类型:
-    # payload = {
-    #     "msgtype": "text",
-    #     "text": {
-    #         "content": message 
-    #     }
-    # }
+def is_incomplete_response(text):
+    """API 调用失败 (返回 None) 或流式生成被提前截断的结果不在去重时共享"""
+    return not text or STREAM_CUTOFF_MARKER in text
+
+
+def review_diff_item(item, blob_reader=None):
+    """
+    审查单个文件的变更，返回该文件在报告中的各个片段。
+    :param blob_reader: GitBlobReader 实例。提供时从 CURRENT_BRANCH 的 git 对象中读取文件内容，
+                        与 diff 的新版本一致；为 None 时读取工作区中的文件。
+    """
+    file_path = item['file_path']
+    hunk_content = item['hunk_content']
+    review_report_parts = []
+
+    full_file_path_in_repo = os.path.join(REPO_PATH, file_path)
+    file_content_str = ""
+    read_started = time.perf_counter()
     try:
-        response = requests.post(webhook_url, headers=headers, json=payload)
-        response.raise_for_status()
-        result = response.json()
-        if result.get("errcode") == 0:
-            print("企业微信通知发送成功")
+        if blob_reader is not None:
+            file_content_str = blob_reader.read_text(CURRENT_BRANCH, file_path)
+            if file_content_str is None:
+                print(f"警告: 文件 {file_path} 在分支 {CURRENT_BRANCH} 中未找到。将尝试仅使用hunk进行分析。")
+                file_content_str = ""
+        elif os.path.exists(full_file_path_in_repo):
+            with open(full_file_path_in_repo, 'r', encoding='utf-8', errors='ignore') as f:
+                file_content_str = f.read()
         else:
-            print(f"企业微信通知发送失败: {result.get('errmsg')}")
-    except requests.exceptions.RequestException as e:
-        print(f"发送企业微信通知时发生网络错误: {e}")
+            print(f"警告: 文件 {full_file_path_in_repo} 在本地仓库中未找到，可能已被删除或路径不正确。将尝试仅使用hunk进行分析。")
+
     except Exception as e:
-        print(f"发送企业微信通知时发生未知错误: {e}")
+        print(f"读取文件 {full_file_path_in_repo} 失败: {e}")
+        # 即使文件读取失败，也尝试继续，DeepSeek 可能仅从 hunk 中提取信息
+    get_default_metrics().record("file_read", time.perf_counter() - read_started)
+
+    review_report_parts.append(f"--- 文件: {file_path} ---")
+
+    full_method = None
+    if LOCAL_METHOD_EXTRACTION_ENABLED:
+        with get_default_metrics().span("method_extract"):
+            full_method = extract_enclosing_methods(
+                file_path, file_content_str, hunk_content,
+                line_numbers=item['file_diff'].changed_new_lines()
+            )
+        if full_method:
+            print(f"  已在本地定位包含变更的方法/函数，无需调用 DeepSeek 提取。")
+    if not full_method:
+        print(f"  正在使用 DeepSeek 提取完整方法体...")
+        full_method, _ = review_deduplicator.review_once(
+            content_key(normalize_hunk(hunk_content), normalize_content(file_content_str)), file_path,
+            lambda: extract_full_method_from_deepseek(file_path, hunk_content, file_content_str),
+            is_error=is_incomplete_response
+        )
+
+    if full_method:
+        review_report_parts.append("提取到的方法/函数体:\n```\n" + full_method + "\n```\n")
+        print(f"  方法体提取成功 (部分内容): {full_method[:100].strip()}...")
+        
+        print(f"  正在使用 DeepSeek 进行代码审查...")
+        review_comments, duplicate_of = review_deduplicator.review_once(
+            content_key(normalize_content(full_method)), file_path,
+            lambda: get_code_review_from_deepseek(file_path, full_method),
+            is_error=is_incomplete_response
+        )
+        if review_comments and duplicate_of:
+            review_report_parts.append(f"AI 代码审查意见 (与 {duplicate_of} 中的代码相同，沿用其审查结果):\n" + review_comments + "\n")
+            print(f"  与 {duplicate_of} 中的代码相同，沿用其审查结果。")
+        elif review_comments:
+            review_report_parts.append("AI 代码审查意见:\n" + review_comments + "\n")
+            print(f"  代码审查完成 (部分内容): {review_comments[:100].strip()}...")
+        else:
+            review_report_parts.append("AI 代码审查失败或无意见。\n")
+            print(f"  代码审查失败或无意见。")
+    else:
+        review_report_parts.append("未能提取相关方法/函数体。\n")
+        print(f"  未能提取相关方法/函数体。")
+    
+    review_report_parts.append("\n")
+    return review_report_parts
 
 
-# --- 主逻辑 ---
+@MetricsRun("diff_review")
 def main():
     print("开始执行代码审查流程...")
+    router = get_router(reset=True)
+
+    merge_base = resolve_diff_base(REPO_PATH, TARGET_BRANCH, CURRENT_BRANCH)
 
-    diff_output = get_git_diff(REPO_PATH, TARGET_BRANCH, CURRENT_BRANCH)
+    if merge_base is None:
+        print("获取 git diff 失败，流程终止。")
+        send_wechat_notification(WECHAT_WEBHOOK_URL, "自动化代码审查：获取 git diff 失败。")
+        return
+
+    changed_files_count = 0
+    ignored_diff_files_count = 0
+    processed_changes = 0
 
-    if diff_output is None:
+    # 从 CURRENT_BRANCH 的 git 对象中读取文件内容，而不是工作区中碰巧检出的版本
+    blob_reader = GitBlobReader(REPO_PATH) if READ_FILES_FROM_GIT else None
+    # 每个文件审查完成后立即写入报告文件 (脚本的当前工作目录就是本工程目录，直接使用文件名即可)
+    report_writer = ReportWriter("code_review_issues.txt")
+
+    # 边读取 git diff 边审查：每个文件的 diff 解析完成后立即进入审查，无需等待整个 diff 读取完毕
+    try:
+        for item in iter_diff_hunks(iter_git_diff_files(REPO_PATH, merge_base, CURRENT_BRANCH)):
+            changed_files_count += 1
+            # 应用文件过滤器
+            if not file_filter.is_allowed(item['file_path']):
+                print(f"根据过滤规则，已忽略文件 '{item['file_path']}' 中的变更。")
+                ignored_diff_files_count += 1
+                continue
+
+            processed_changes += 1
+            if processed_changes == 1:
+                report_writer.write(f"自动化代码审查报告 - {CURRENT_BRANCH} vs {TARGET_BRANCH}\n\n详细报告:")
+            print(f"\n处理变更 [{processed_changes}]: {item['file_path']}")
+            report_writer.write_parts(review_diff_item(item, blob_reader))
+    except subprocess.CalledProcessError as e:
+        print(f"命令执行错误: {e.cmd}")
+        print(f"Stderr: {e.stderr}")
         print("获取 git diff 失败，流程终止。")
         send_wechat_notification(WECHAT_WEBHOOK_URL, "自动化代码审查：获取 git diff 失败。")
         return
+    finally:
+        # 正常结束时稍后还会追加摘要，此处关闭后再次写入会以追加方式打开
+        report_writer.close()
+        if blob_reader is not None:
+            blob_reader.close()
 
-    if not diff_output.strip():
+    if changed_files_count == 0:
         print("未检测到代码变更。")
         send_email("自动化代码审查报告", "未检测到代码变更。", EMAIL_RECEIVER)
         send_wechat_notification(WECHAT_WEBHOOK_URL, "自动化代码审查：未检测到代码变更。")
         return
 
-    # print("Git Diff 输出:\n", diff_output[:1000]) # 打印部分 diff 用于调试
-    
-    parsed_hunks_data_raw = parse_diff_hunks(diff_output)
-    if not parsed_hunks_data_raw:
-        print("未能从 diff 中解析出有效的变更片段。")
-        send_wechat_notification(WECHAT_WEBHOOK_URL, "自动化代码审查：未能从 diff 中解析出有效的变更片段。")
-        return
-
-    # 应用文件过滤器
-    parsed_hunks_data = []
-    ignored_diff_files_count = 0
-    for item in parsed_hunks_data_raw:
-        if file_filter.is_allowed(item['file_path']):
-            parsed_hunks_data.append(item)
-        else:
-            print(f"根据过滤规则，已忽略文件 '{item['file_path']}' 中的变更。")
-            ignored_diff_files_count += 1
-    
     if ignored_diff_files_count > 0:
         print(f"共忽略了 {ignored_diff_files_count} 个在 diff 中但被规则过滤的文件。")
 
-    if not parsed_hunks_data:
+    if processed_changes == 0:
         print("所有解析出的变更文件均被过滤规则忽略，无内容可审查。")
         send_wechat_notification(WECHAT_WEBHOOK_URL, "自动化代码审查：所有变更文件均被过滤规则忽略。")
         return
 
-    print(f"将对 {len(parsed_hunks_data)} 个文件的变更进行审查 (已应用过滤规则)。")
-
-    review_report_parts = []
-    total_changes = len(parsed_hunks_data)
-    processed_changes = 0
-
-    for item in parsed_hunks_data:
-        file_path = item['file_path']
-        hunk_content = item['hunk_content']
-        
-        processed_changes += 1
-        print(f"\n处理变更 [{processed_changes}/{total_changes}]: {file_path}")
-
-        full_file_path_in_repo = os.path.join(REPO_PATH, file_path)
-        file_content_str = ""
-        try:
-            if os.path.exists(full_file_path_in_repo):
-                with open(full_file_path_in_repo, 'r', encoding='utf-8', errors='ignore') as f:
-                    file_content_str = f.read()
-            else:
-                print(f"警告: 文件 {full_file_path_in_repo} 在本地仓库中未找到，可能已被删除或路径不正确。将尝试仅使用hunk进行分析。")
-
-        except Exception as e:
-            print(f"读取文件 {full_file_path_in_repo} 失败: {e}")
-            # 即使文件读取失败，也尝试继续，DeepSeek 可能仅从 hunk 中提取信息
-
-        review_report_parts.append(f"--- 文件: {file_path} ---")
-
-        print(f"  正在使用 DeepSeek 提取完整方法体...")
-        full_method = extract_full_method_from_deepseek(file_path, hunk_content, file_content_str)
-
-        if full_method:
-            review_report_parts.append("提取到的方法/函数体:\n```\n" + full_method + "\n```\n")
-            print(f"  方法体提取成功 (部分内容): {full_method[:100].strip()}...")
-            
-            print(f"  正在使用 DeepSeek 进行代码审查...")
-            review_comments = get_code_review_from_deepseek(file_path, full_method)
-            if review_comments:
-                review_report_parts.append("AI 代码审查意见:\n" + review_comments + "\n")
-                print(f"  代码审查完成 (部分内容): {review_comments[:100].strip()}...")
-            else:
-                review_report_parts.append("AI 代码审查失败或无意见。\n")
-                print(f"  代码审查失败或无意见。")
-        else:
-            review_report_parts.append("未能提取相关方法/函数体。\n")
-            print(f"  未能提取相关方法/函数体。")
-        
-        review_report_parts.append("\n")
-
-
-    final_report = "\n".join(review_report_parts)
-    report_summary = f"自动化代码审查完成。共处理 {len(parsed_hunks_data)} 个文件的变更。"
+    report_summary = f"自动化代码审查完成。共处理 {processed_changes} 个文件的变更。"
+    if review_deduplicator.saved_count:
+        report_summary += f" {review_deduplicator.format_stats()}。"
     
     print("\n--- 最终审查报告 ---")
-    # print(final_report) # 完整报告可能很长，选择性打印
     print(report_summary)
-
-    # 将报告保存到文件
-    report_file_name = "code_review_issues.txt"
-    # 脚本的当前工作目录就是本工程目录 /Users/yl/code-sentinel/
-    # 所以直接使用文件名即可
-    try:
-        with open(report_file_name, 'w', encoding='utf-8') as f:
-            f.write(f"自动化代码审查报告 - {CURRENT_BRANCH} vs {TARGET_BRANCH}\n")
-            f.write(report_summary + "\n\n")
-            f.write("详细报告:\n")
-            f.write(final_report)
-        print(f"审查报告已保存至: {os.path.abspath(report_file_name)}")
-    except Exception as e:
-        print(f"保存审查报告到文件失败: {e}")
-
-    # 发送邮件
+    if review_cache is not None:
+        print(review_cache.format_stats())
+        review_cache.close()
+    print(get_default_transport().format_stats())
+    router_stats = router.format_stats()
+    if router_stats:
+        print(router_stats)
+    if router.hedging.enabled:
+        print(router.hedging.format_stats())
+
+    # 摘要追加在报告末尾，然后将 .partial 替换为正式报告
+    report_writer.write(f"\n{report_summary}")
+    report_path = report_writer.finish()
+
+    # 发送邮件: 报告过长时只附带开头部分，完整内容见报告文件
+    report_text, truncated = read_report_preview(report_path or report_writer.partial_path, EMAIL_REPORT_MAX_CHARS)
+    if truncated:
+        report_text += f"\n\n... (报告过长，完整内容请查看 {report_path or report_writer.partial_path})"
     email_subject = f"自动化代码审查报告 - {CURRENT_BRANCH} vs {TARGET_BRANCH}"
-    send_email(email_subject, report_summary + "\n\n详细报告:\n" + final_report, EMAIL_RECEIVER)
+    send_email(email_subject, report_summary + "\n\n" + report_text, EMAIL_RECEIVER)
 
     # 发送企业微信通知
     wechat_message = f"#### 自动化代码审查报告\n**分支**: `{CURRENT_BRANCH}` vs `{TARGET_BRANCH}`\n**状态**: {report_summary}\n请查收邮件获取详细报告。"
     send_wechat_notification(WECHAT_WEBHOOK_URL, wechat_message)
 
+    # 等待后台通知发送完毕 (有超时上限)
+    get_default_dispatcher().close()
     print("\n代码审查流程结束。")
 
 if __name__ == "__main__":
@@ -0,0 +1,102 @@
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+
+def _format_duration(seconds):
+    """将秒数格式化为 H:MM:SS"""
+    seconds = int(max(0, seconds))
+    hours, remainder = divmod(seconds, 3600)
+    minutes, secs = divmod(remainder, 60)
+    return f"{hours}:{minutes:02d}:{secs:02d}"
+
+
+class ReviewProgress:
+    """线程安全的审查进度统计，每完成一个文件打印一次吞吐量和预计剩余时间 (ETA)"""
+
+    def __init__(self, total=None, label="审查进度"):
+        """
+        :param total: 待审查的文件总数。未知时传 None，此时不计算 ETA。
+        :param label: 打印进度时使用的前缀。
+        """
+        self.total = total
+        self.label = label
+        self.completed = 0
+        self.started_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def advance(self, item_name=None):
+        """记录一个文件审查完成并打印进度"""
+        with self._lock:
+            self.completed += 1
+            completed = self.completed
+            elapsed = time.monotonic() - self.started_at
+
+        throughput = completed / elapsed * 60 if elapsed > 0 else 0.0
+        message = f"  {self.label}: {completed}"
+        if self.total:
+            message += f"/{self.total} ({completed / self.total:.1%})"
+        message += f" | 吞吐: {throughput:.1f} 文件/分钟 | 已用时: {_format_duration(elapsed)}"
+        if self.total and completed < self.total and completed > 0:
+            eta = elapsed / completed * (self.total - completed)
+            message += f" | 预计剩余: {_format_duration(eta)}"
+        if item_name:
+            message += f" | {item_name}"
+        print(message)
+
+    def summary(self):
+        """返回整体耗时与吞吐量的摘要字符串"""
+        elapsed = time.monotonic() - self.started_at
+        throughput = self.completed / elapsed * 60 if elapsed > 0 else 0.0
+        return f"耗时 {_format_duration(elapsed)}，平均吞吐 {throughput:.1f} 文件/分钟"
+
+
+def imap_ordered(func, items, max_workers=1, on_error=None, progress=None, describe=None):
+    """
+    并发地对 items 中的每个元素调用 func，并严格按照输入顺序逐个产出结果。
+
+    同一时刻最多有 max_workers 个任务在执行，另有少量任务排队等待，
+    因此 items 可以是惰性的生成器，不会被一次性全部读入内存。
+    单个任务抛出的异常不会影响其他任务：若提供了 on_error(item, exc)，
+    其返回值将作为该元素的结果；否则异常会在产出该元素时重新抛出。
+
+    :param func: 处理单个元素的函数。
+    :param items: 可迭代对象 (列表或生成器)。
+    :param max_workers: 并发数。小于等于 1 时按顺序执行。
+    :param on_error: 异常处理回调，签名为 on_error(item, exc)。
+    :param progress: 可选的 ReviewProgress，每完成一个元素调用一次 advance。
+    :param describe: 可选函数，将元素转换为进度输出中显示的名称。
+    """
+    def run_one(item):
+        try:
+            result = func(item)
+        except Exception as e:
+            if on_error is None:
+                raise
+            result = on_error(item, e)
+        if progress is not None:
+            progress.advance(describe(item) if describe else None)
+        return result
+
+    if not max_workers or max_workers <= 1:
+        for item in items:
+            yield run_one(item)
+        return
+
+    max_pending = max_workers * 2
+    pending = deque()
+    iterator = iter(items)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        try:
+            for item in iterator:
+                pending.append(executor.submit(run_one, item))
+                # 队头任务完成后立即产出，保证输出顺序与输入一致
+                while pending and (len(pending) >= max_pending or pending[0].done()):
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+        finally:
+            # 调用方提前结束迭代时，取消尚未开始的任务
+            for future in pending:
+                future.cancel()
@@ -1,6 +1,9 @@
 # API Keys and other configurations
 DEEPSEEK_API_KEY = "sk-kkkkkkkkkkkk"
+# 可选: 多个 DeepSeek API Key。非空时代替 DEEPSEEK_API_KEY，请求按每个 Key 的 RPM/TPM 额度分散到各个 Key 上 (见下方 API Key 池配置)
+DEEPSEEK_API_KEYS = []
 DEEPSEEK_API_URL = "https://api.deepseek.com/chat/completions"
+DEEPSEEK_MODEL = "deepseek-coder"
 
 # 邮件配置 (如果也希望集中管理)
 SMTP_HOST = "smtp.qq.com"
@@ -13,17 +16,39 @@ EMAIL_RECEIVER = "接收邮箱"
 # 企业微信 Webhook (如果也希望集中管理)
 WECHAT_WEBHOOK_URL = "https://qyapi.weixin.qq.com/cgi-bin/webhook/send?key=kkkkkkkkkkk"
 
+# 通知发送配置
+# 邮件和企业微信通知在后台线程中发送，同一 SMTP 账号的多封邮件复用一个连接
+NOTIFY_TIMEOUT_SECONDS = 15  # SMTP 连接/发送和企业微信请求的超时时间
+NOTIFY_DIGEST_ENABLED = False  # 将一次运行中的通知合并为一封汇总邮件和一条汇总消息 (例如一次审查多个仓库时)
+NOTIFY_SHUTDOWN_WAIT_SECONDS = 60  # 程序结束前等待未发送通知的最长时间
+WECHAT_MARKDOWN_MAX_BYTES = 4096  # 企业微信 markdown 消息的长度上限 (UTF-8 字节)，超出时拆分为多条发送
+
+# 运行指标配置
+# 每次运行结束时打印各阶段 (git 命令、文件读取、提示词构建、API 调用、报告写入、通知) 的耗时和 token 用量，
+# 并在 METRICS_DIR 中写入 JSON 摘要和 Prometheus textfile (<运行名>.prom，可供 node_exporter 的 textfile collector 采集)
+METRICS_ENABLED = True
+METRICS_DIR = ".code_sentinel_cache/metrics"  # 相对于运行脚本时的当前目录
+METRICS_PROFILE_ENABLED = False  # 同时用 cProfile 记录本地开销，保存为 METRICS_DIR 中的 .prof 文件
+
 # 文件过滤配置
-# 忽略的文件夹列表 (相对于仓库根目录)
+# 所有规则遵循 .gitignore 语义: 不含 "/" 的规则匹配任意层级 (例如 "node_modules/" 也会忽略 src/node_modules/)，
+# 含有 "/" 的规则相对于仓库根目录；支持 *、?、[abc]、** 通配符
+# 忽略的文件夹列表
 DEFAULT_IGNORED_FOLDERS = ["Pods/", "node_modules/", ".git/", ".idea/", "__pycache__/"]
 # 允许的文件扩展名列表 (如果为空，则不按扩展名过滤，除非被文件夹规则排除)
 DEFAULT_ALLOWED_FILE_EXTENSIONS = ['.py', '.js', '.java', '.m', '.swift', '.kt', '.go', '.c', '.cpp', '.h', '.hpp']
-# 忽略的特定文件列表 (相对于仓库根目录)
+# 忽略的特定文件列表
 DEFAULT_IGNORED_FILES = [
     ".DS_Store", 
     "README.md"
     # "emaosoho/Support File/main.m"  # 举例:忽略特定路径下的文件
 ]
+# 额外的 gitignore 风格规则，在上面两项之后生效，支持 "!" 取反 (后出现的规则优先)
+DEFAULT_IGNORE_PATTERNS = [
+    # "**/generated/**",  # 举例: 忽略任意层级 generated 目录下的内容
+    # "*.pb.go",
+    # "!tools/generated/keep.py",
+]
 
 # 新增：需要审查的文件夹路径列表配置
 # 请根据您的实际需求修改这些路径，路径应该是绝对路径或者相对于项目根目录的路径
@@ -33,3 +58,140 @@ FOLDERS_TO_REVIEW = [
     "/path/to/your/folder2",
     # "relative/path/to/folder3" # 也可以是相对路径
 ]
+
+# 并发审查配置
+# 同时在途的 DeepSeek 请求数量。设置为 1 时按顺序逐个审查文件
+REVIEW_MAX_WORKERS = 4
+
+# 审查结果缓存配置
+# 以文件内容的 blob SHA、提示词模板、模型和 max_tokens 为键缓存审查结果，未变更的文件不再调用 API
+REVIEW_CACHE_ENABLED = True
+REVIEW_CACHE_PATH = ".code_sentinel_cache/review_cache.sqlite3"  # 相对于运行脚本时的当前目录
+REVIEW_CACHE_MAX_AGE_DAYS = 30  # 超过该天数未被访问的条目会被淘汰
+REVIEW_CACHE_MAX_SIZE_MB = 200  # 缓存总大小上限，超出时淘汰最久未访问的条目
+
+# HTTP 传输层配置 (所有审查器共享一个连接池)
+HTTP_POOL_SIZE = 16  # 连接池大小，建议不小于 REVIEW_MAX_WORKERS
+API_MAX_RETRIES = 3  # 网络错误或 429/5xx 时的最大重试次数
+API_BACKOFF_BASE_SECONDS = 1.0  # 指数退避的基础等待时间
+API_BACKOFF_MAX_SECONDS = 60.0  # 单次退避的最长等待时间 (也作为 Retry-After 的上限)
+
+# 自适应并发配置 (AIMD)
+# 启用后按 (接口地址, API Key) 自动调整同时在途的请求数: 请求顺利时逐步提高，收到 429/503 或延迟明显上升时减半；
+# 审查线程数提高到 ADAPTIVE_MAX_CONCURRENCY，实际在途请求数由自适应上限控制 (REVIEW_MAX_WORKERS 不再是上限)。
+# 学到的上限保存在 ADAPTIVE_STATE_PATH 中，下次运行从该值开始
+ADAPTIVE_CONCURRENCY_ENABLED = False
+ADAPTIVE_INITIAL_CONCURRENCY = 4    # 没有历史记录时的初始并发数
+ADAPTIVE_MIN_CONCURRENCY = 1
+ADAPTIVE_MAX_CONCURRENCY = 16       # 并发上限的最大值，建议不超过 HTTP_POOL_SIZE
+ADAPTIVE_BACKOFF_RATIO = 0.5        # 限流或延迟上升时并发上限乘以该比例
+ADAPTIVE_LATENCY_TOLERANCE = 2.0    # 最近平均延迟超过长期平均的该倍数时视为延迟上升
+ADAPTIVE_STATE_PATH = ".code_sentinel_cache/concurrency_limits.json"  # 相对于运行脚本时的当前目录
+
+# 多模型后端路由配置
+# 上面的 DEEPSEEK_* 始终是第一个后端，这里可以追加其他 OpenAI 兼容的 chat completions 后端。
+# 配置多个后端时，每次请求发往最近平均延迟最低的健康后端，请求失败时自动切换到下一个后端；
+# 最近错误率过高的后端暂停使用一段时间 (所有健康后端都失败时仍会尝试)
+LLM_PROVIDERS = [
+    # {"name": "openai", "api_url": "https://api.openai.com/v1/chat/completions", "api_key": "sk-xxx", "model": "gpt-4o-mini"},
+    # {"name": "grok", "api_url": "https://api.x.ai/v1/chat/completions", "api_key": "xai-xxx", "model": "grok-2-latest"},
+    # {"name": "gemini", "api_url": "https://generativelanguage.googleapis.com/v1beta/openai/chat/completions",
+    #  "api_key": "xxx", "model": "gemini-2.0-flash"},
+    # {"name": "claude", "api_url": "https://api.anthropic.com/v1/chat/completions", "api_key": "sk-ant-xxx",
+    #  "model": "claude-3-5-haiku-latest"},
+    # 同一后端有多个 Key 时可以用 "api_keys": ["key1", "key2"] 代替 "api_key"，按 API Key 池的方式分配
+]
+ROUTER_WINDOW_SIZE = 20              # 按最近多少次请求统计每个后端的延迟和错误率
+ROUTER_MIN_SAMPLES = 4               # 至少有多少次记录才会因错误率过高暂停后端
+ROUTER_ERROR_RATE_THRESHOLD = 0.5    # 最近错误率达到该值时暂停后端
+ROUTER_COOLDOWN_SECONDS = 60         # 暂停时长
+ROUTER_RETRIES_BEFORE_FAILOVER = 1   # 配置了多个后端时，每个后端重试几次后切换 (只有一个后端时使用 API_MAX_RETRIES)
+
+# API Key 池配置
+# DEEPSEEK_API_KEYS (或 LLM_PROVIDERS 中某个后端的 "api_keys") 配置了多个 Key 时，每个 Key 按下面的额度用令牌桶记账，
+# 请求分配给额度充足、在途请求最少的 Key；返回 401/402/403 (鉴权失败或余额不足) 或 429 的 Key 暂停使用一段时间，
+# 期间由其他 Key 承担请求
+KEY_POOL_RPM = 0                           # 每个 Key 每分钟的请求数上限，0 表示不限制
+KEY_POOL_TPM = 0                           # 每个 Key 每分钟的 token 上限 (按输入估算 + max_tokens 预留，完成后按实际用量修正)，0 表示不限制
+KEY_POOL_AUTH_COOLDOWN_SECONDS = 300       # 鉴权或额度错误后暂停该 Key 的时长
+KEY_POOL_THROTTLE_COOLDOWN_SECONDS = 10    # 429 且响应中没有 Retry-After 时暂停该 Key 的时长
+
+# 对冲请求配置
+# 启用后，请求耗时超过最近请求耗时的 HEDGE_PERCENTILE 分位数时，再向另一个后端 (只有一个后端时为同一后端)
+# 发送一份相同的请求，采用先完成的结果并取消另一个 (流式请求会立即断开；非流式请求的结果被丢弃，但仍会计费)
+HEDGE_ENABLED = False
+HEDGE_PERCENTILE = 0.9        # 触发对冲的耗时分位数
+HEDGE_WINDOW_SIZE = 100       # 按最近多少次请求的耗时计算分位数
+HEDGE_MIN_SAMPLES = 10        # 耗时样本不足时不对冲
+HEDGE_MIN_DELAY_SECONDS = 5   # 对冲等待时间的下限，避免对本来就很快的请求对冲
+HEDGE_MAX_EXTRA_RATIO = 0.1   # 对冲请求数不超过请求总数的该比例，限制额外开销
+
+# 流式输出配置
+# 启用后以 SSE 流式接收审查结果并定期打印生成进度；单次生成超过时长或 token 上限时立即取消请求，
+# 保留已生成的内容 (附带截断说明，且不写入缓存)，而不是等到超时后整体丢弃
+API_STREAM_ENABLED = False
+STREAM_MAX_SECONDS = 150             # 单次请求的生成时长上限 (秒)，0 表示不限制
+STREAM_MAX_OUTPUT_TOKENS = 0         # 单次请求接收的 token 上限，0 表示只受请求中的 max_tokens 限制
+STREAM_IDLE_TIMEOUT_SECONDS = 60     # 超过该时长未收到任何数据时视为连接中断
+STREAM_PROGRESS_INTERVAL_SECONDS = 15  # 生成过程中打印进度的间隔
+
+# 超大文件分块审查配置
+# 启用后，超过长度上限的文件会在函数/类边界处拆分为多块并行审查，再整合为一份报告，而不是被截断
+CHUNKED_REVIEW_ENABLED = True
+CHUNK_MAX_TOKENS = 4000  # 每块的估算 token 预算 (约 15000 个英文字符)
+
+# 本地方法定位配置
+# 启用后先在本地 (Python 用 ast，Java/Kotlin/Swift/ObjC/Go/C 用括号扫描) 定位包含变更的函数，
+# 仅在无法定位时才调用 DeepSeek 提取方法体
+LOCAL_METHOD_EXTRACTION_ENABLED = True
+
+# 文件内容读取方式
+# True: 通过常驻的 `git cat-file --batch` 进程直接读取被审查分支中的文件内容，不受工作区检出状态影响
+# False: 读取工作区中的文件 (旧行为)
+READ_FILES_FROM_GIT = True
+
+# 增量审查配置
+# 启用后，全项目审查会记录每个仓库/分支上次审查到的提交，下次只审查此后新增或修改的文件，
+# 未变更文件的审查结果从上次记录中沿用，报告依然完整
+INCREMENTAL_REVIEW_ENABLED = False
+REVIEW_STATE_PATH = ".code_sentinel_cache/review_state.sqlite3"  # 相对于运行脚本时的当前目录
+
+# 检查点日志配置
+# 全项目审查时，每完成一个文件就追加写入检查点日志；审查中途退出后可使用 --resume 跳过已完成的文件，
+# 并从日志重建完整报告。审查正常完成后日志会被删除
+REVIEW_JOURNAL_ENABLED = True
+REVIEW_JOURNAL_DIR = ".code_sentinel_cache/journals"  # 相对于运行脚本时的当前目录
+
+# 小文件合并审查配置 (全项目审查)
+# 启用后，相邻的小文件 (头文件、DTO、枚举等) 会合并为一次请求审查，模型按文件分节输出后再拆回每个文件；
+# 回答无法按文件拆分时自动回退为逐个文件审查
+BATCH_REVIEW_ENABLED = False
+BATCH_SMALL_FILE_MAX_BYTES = 1024  # 不超过该大小的文件才参与合并
+BATCH_MAX_TOKENS = 3000            # 每次合并请求中文件内容的估算 token 上限
+BATCH_MAX_FILES = 8                # 每次合并请求最多包含的文件数
+
+# 内容去重配置
+# 同一次运行中，内容相同 (忽略换行符和行尾空白的差异) 的文件或变更只审查一次，其余路径沿用第一次的结果，
+# 适用于多处 vendored 的相同源码、重构时在多个文件中出现的相同改动
+DEDUP_REVIEW_ENABLED = True
+
+# 预算审查配置 (全项目审查)
+# 启用后，先在本地按文件大小估算每个文件的 token 消耗，并按风险信号 (近期修改次数、文件大小、语言、敏感路径) 排序，
+# 优先审查风险最高的文件，直到达到 token 或费用上限；因超出预算而跳过的文件会列在报告末尾
+BUDGET_MODE_ENABLED = False
+BUDGET_MAX_TOKENS = 500000  # 本次运行输入与输出 token 的总上限，0 表示不限制
+BUDGET_MAX_COST = 0         # 本次运行的费用上限 (元)，0 表示不限制
+# 每百万 token 的价格 (元)，用于估算费用，请按所用模型的实际价格调整
+BUDGET_PRICE_INPUT_PER_MTOK = 2.0         # 输入 (未命中上下文缓存)
+BUDGET_PRICE_CACHED_INPUT_PER_MTOK = 0.5  # 输入 (命中上下文缓存)
+BUDGET_PRICE_OUTPUT_PER_MTOK = 8.0        # 输出
+BUDGET_EXPECTED_OUTPUT_TOKENS = 1500  # 预估每次审查的输出 token 数
+BUDGET_CHURN_DAYS = 90  # 统计最近多少天内的修改次数 (git log)
+# 路径中出现这些词 (单词开头匹配，例如 "pay" 匹配 payment/) 的文件优先审查
+BUDGET_RISK_KEYWORDS = ["auth", "login", "password", "passwd", "payment", "pay", "billing", "order", "crypto",
+                        "security", "token", "session", "permission", "admin", "sql", "upload"]
+# 各语言的风险权重，未列出的扩展名权重为 1.0
+BUDGET_LANGUAGE_WEIGHTS = {
+    ".py": 1.2, ".java": 1.2, ".go": 1.2, ".js": 1.1, ".ts": 1.1, ".php": 1.3, ".c": 1.3, ".cpp": 1.3,
+    ".m": 1.1, ".swift": 1.1, ".kt": 1.1, ".h": 0.8, ".json": 0.5, ".md": 0.3, ".txt": 0.3
+}
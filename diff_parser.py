@@ -0,0 +1,229 @@
+import re
+
+# 单遍扫描的 git diff 解析器。
+# 每个文件解析为一个 FileDiff，每个 @@ 块解析为一个 DiffHunk，保留新旧行号范围，
+# 供后续阶段 (本地方法定位、行级审查等) 精确定位变更。
+
+_HUNK_HEADER = re.compile(r'^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@ ?(.*)$')
+
+
+def _unquote_path(path):
+    """还原 git 对含空格或非 ASCII 字符路径的引号转义 (例如 "a/\\344\\270\\255.py")"""
+    if len(path) >= 2 and path.startswith('"') and path.endswith('"'):
+        raw = path[1:-1].encode('latin-1', 'backslashreplace').decode('unicode_escape')
+        try:
+            return raw.encode('latin-1').decode('utf-8')
+        except (UnicodeEncodeError, UnicodeDecodeError):
+            return raw
+    return path
+
+
+def _strip_prefix(path):
+    """去掉 a/ 或 b/ 前缀；/dev/null 返回 None"""
+    path = _unquote_path(path.rstrip('\t'))
+    if path == '/dev/null':
+        return None
+    if path.startswith(('a/', 'b/')):
+        return path[2:]
+    return path
+
+
+def _parse_git_header_paths(rest):
+    """从 'diff --git' 之后的部分解析新旧路径，处理路径带引号和包含空格的情况"""
+    if rest.startswith('"'):
+        closing = rest.find('" ', 1)
+        old_token, new_token = rest[:closing + 1], rest[closing + 2:]
+        return _strip_prefix(old_token), _strip_prefix(new_token)
+    if rest.endswith('"'):
+        opening = rest.rfind(' "')
+        return _strip_prefix(rest[:opening]), _strip_prefix(rest[opening + 1:])
+    # 无引号时，新旧路径相同的情况最常见: "a/P b/P"
+    half = (len(rest) - 1) // 2
+    if len(rest) % 2 == 1 and rest[half] == ' ' and rest[2:half] == rest[half + 3:]:
+        return rest[2:half], rest[half + 3:]
+    match = re.match(r'^a/(.+?) b/(.+)$', rest)
+    if match:
+        return match.group(1), match.group(2)
+    return None, None
+
+
+class DiffHunk:
+    """一个 @@ -a,b +c,d @@ 变更块"""
+
+    __slots__ = ('old_start', 'old_length', 'new_start', 'new_length', 'section',
+                 'lines', 'added_lines', 'removed_lines')
+
+    def __init__(self, old_start, old_length, new_start, new_length, section=''):
+        self.old_start = old_start
+        self.old_length = old_length
+        self.new_start = new_start
+        self.new_length = new_length
+        self.section = section      # @@ 之后 git 给出的函数/类上下文 (可能为空)
+        self.lines = []             # hunk 正文，保留 '+', '-', ' ' 前缀
+        self.added_lines = []       # 新增行在新文件中的行号
+        self.removed_lines = []     # 删除行在旧文件中的行号
+
+    @property
+    def header(self):
+        header = f"@@ -{self.old_start},{self.old_length} +{self.new_start},{self.new_length} @@"
+        return f"{header} {self.section}" if self.section else header
+
+    def text(self):
+        """返回包含 @@ 行的完整 hunk 文本"""
+        return "\n".join([self.header] + self.lines)
+
+    def changed_new_lines(self):
+        """变更在新文件中涉及的行号: 新增行，以及纯删除发生的位置"""
+        if self.added_lines:
+            return list(self.added_lines)
+        if self.removed_lines:
+            return [max(1, self.new_start)]
+        return []
+
+    def __repr__(self):
+        return f"DiffHunk({self.header!r}, +{len(self.added_lines)} -{len(self.removed_lines)})"
+
+
+class FileDiff:
+    """一个文件的全部变更"""
+
+    __slots__ = ('old_path', 'new_path', 'hunks', 'is_new', 'is_deleted', 'is_renamed',
+                 'is_binary', 'similarity')
+
+    def __init__(self, old_path=None, new_path=None):
+        self.old_path = old_path
+        self.new_path = new_path
+        self.hunks = []
+        self.is_new = False
+        self.is_deleted = False
+        self.is_renamed = False
+        self.is_binary = False
+        self.similarity = None
+
+    @property
+    def file_path(self):
+        """用于审查和报告的路径: 优先使用变更后的路径，删除的文件使用原路径"""
+        return self.new_path if self.new_path and not self.is_deleted else self.old_path
+
+    def hunk_content(self):
+        """将该文件所有 hunk 合并为一段 diff 文本"""
+        return "\n".join(hunk.text() for hunk in self.hunks)
+
+    def changed_new_lines(self):
+        """所有 hunk 在新文件中涉及的行号 (升序去重)"""
+        line_numbers = set()
+        for hunk in self.hunks:
+            line_numbers.update(hunk.changed_new_lines())
+        return sorted(line_numbers)
+
+    def __repr__(self):
+        flags = [name for name in ('is_new', 'is_deleted', 'is_renamed', 'is_binary') if getattr(self, name)]
+        return f"FileDiff({self.file_path!r}, hunks={len(self.hunks)}, flags={flags})"
+
+
+def iter_file_diffs(lines):
+    """
+    单遍解析 git diff 输出，每解析完一个文件就产出一个 FileDiff。
+    :param lines: 可迭代的 diff 行 (可以带或不带行尾换行符)，例如 str.splitlines() 的结果或管道输出。
+    """
+    current = None
+    hunk = None
+    old_remaining = new_remaining = 0
+    old_line = new_line = 0
+
+    for line in lines:
+        line = line.rstrip('\r\n')
+
+        # hunk 正文: 依据 @@ 中的行数判断 hunk 何时结束，
+        # 因此以 "---"/"+++" 开头的正文行不会被误认为文件头
+        if hunk is not None and (old_remaining > 0 or new_remaining > 0):
+            if line.startswith('\\'):
+                # "\ No newline at end of file"
+                hunk.lines.append(line)
+                continue
+            tag = line[:1]
+            if tag == '+':
+                hunk.added_lines.append(new_line)
+                new_line += 1
+                new_remaining -= 1
+                hunk.lines.append(line)
+                continue
+            if tag == '-':
+                hunk.removed_lines.append(old_line)
+                old_line += 1
+                old_remaining -= 1
+                hunk.lines.append(line)
+                continue
+            if tag == ' ' or line == '':
+                old_line += 1
+                new_line += 1
+                old_remaining -= 1
+                new_remaining -= 1
+                hunk.lines.append(line if line else ' ')
+                continue
+            # 行数与 @@ 不符 (diff 被截断等)，结束当前 hunk 并按普通行处理
+            hunk = None
+
+        if line.startswith('diff --git '):
+            if current is not None:
+                yield current
+            old_path, new_path = _parse_git_header_paths(line[len('diff --git '):])
+            current = FileDiff(old_path, new_path)
+            hunk = None
+            continue
+
+        if current is None:
+            continue
+
+        if line.startswith('\\') and hunk is not None:
+            hunk.lines.append(line)
+            continue
+
+        header = _HUNK_HEADER.match(line)
+        if header:
+            old_start = int(header.group(1))
+            old_length = int(header.group(2)) if header.group(2) is not None else 1
+            new_start = int(header.group(3))
+            new_length = int(header.group(4)) if header.group(4) is not None else 1
+            hunk = DiffHunk(old_start, old_length, new_start, new_length, header.group(5).strip())
+            current.hunks.append(hunk)
+            old_line, new_line = old_start, new_start
+            old_remaining, new_remaining = old_length, new_length
+            continue
+
+        if line.startswith('--- '):
+            path = _strip_prefix(line[4:])
+            if path is None:
+                current.is_new = True
+            else:
+                current.old_path = path
+        elif line.startswith('+++ '):
+            path = _strip_prefix(line[4:])
+            if path is None:
+                current.is_deleted = True
+            else:
+                current.new_path = path
+        elif line.startswith('new file mode'):
+            current.is_new = True
+        elif line.startswith('deleted file mode'):
+            current.is_deleted = True
+        elif line.startswith('rename from '):
+            current.is_renamed = True
+            current.old_path = _unquote_path(line[len('rename from '):])
+        elif line.startswith('rename to '):
+            current.is_renamed = True
+            current.new_path = _unquote_path(line[len('rename to '):])
+        elif line.startswith('similarity index '):
+            current.similarity = line[len('similarity index '):]
+        elif line.startswith('Binary files ') or line == 'GIT binary patch':
+            current.is_binary = True
+
+    if current is not None:
+        yield current
+
+
+def parse_diff(diff_output):
+    """解析完整的 diff 文本，返回 FileDiff 列表"""
+    if not diff_output:
+        return []
+    return list(iter_file_diffs(diff_output.splitlines()))
@@ -1,16 +1,271 @@
-import os
+import posixpath
+import re
+from collections import namedtuple
+
+# 一条编译后的忽略规则:
+# regex 匹配相对路径 (name_only 时只匹配文件名/目录名)，literal 为不含通配符的文件名规则，
+# negated 表示 "!" 取反规则，dir_only 表示只匹配目录 (以 / 结尾)
+_Rule = namedtuple('_Rule', ['regex', 'negated', 'dir_only', 'name_only', 'literal'])
+# FileFilter 编译后的状态: 目录规则、文件规则、无取反规则时的合并正则，以及目录判定结果的缓存
+_Compiled = namedtuple('_Compiled', ['dir_rules', 'file_rules', 'batch_regex', 'dir_cache'])
+_GLOB_CHARS = re.compile(r'[*?\[\\]')
+
+
+def _translate_glob(pattern):
+    """将 gitignore 风格的通配符转换为正则表达式 (不含首尾锚点)"""
+    parts = []
+    index, length = 0, len(pattern)
+    while index < length:
+        ch = pattern[index]
+        if ch == '*':
+            if pattern.startswith('**', index):
+                at_segment_start = index == 0 or pattern[index - 1] == '/'
+                following = pattern[index + 2:index + 3]
+                if at_segment_start and following == '/':
+                    # "**/" 匹配零级或多级目录
+                    parts.append('(?:[^/]*/)*')
+                    index += 3
+                    continue
+                if at_segment_start and following == '':
+                    # 末尾的 "/**" 匹配该目录下的所有内容
+                    parts.append('.*')
+                    index += 2
+                    continue
+                # 其他位置的 "**" 与 "*" 相同
+                index += 1
+            parts.append('[^/]*')
+        elif ch == '?':
+            parts.append('[^/]')
+        elif ch == '[':
+            closing = pattern.find(']', index + 2)
+            if closing == -1:
+                parts.append(re.escape(ch))
+            else:
+                body = pattern[index + 1:closing].replace('\\', '\\\\')
+                if body.startswith('!'):
+                    body = '^' + body[1:]
+                elif body.startswith('^'):
+                    body = '\\' + body
+                parts.append(f'[{body}]')
+                index = closing + 1
+                continue
+        elif ch == '\\' and index + 1 < length:
+            parts.append(re.escape(pattern[index + 1]))
+            index += 2
+            continue
+        else:
+            parts.append(re.escape(ch))
+        index += 1
+    return "".join(parts)
+
+
+def _compile_rule(line, base_dir='', dir_only=False):
+    """
+    将一行 gitignore 风格的规则编译为 _Rule，空行和注释返回 None。
+    :param base_dir: 规则所在的目录 (相对于仓库根目录)，规则只作用于该目录之下。
+    :param dir_only: 强制规则只匹配目录。
+    """
+    line = line.rstrip('\r\n')
+    if not line.strip() or line.startswith('#'):
+        return None
+    pattern = line.rstrip(' ')
+    if pattern.endswith('\\') and len(pattern) < len(line):
+        # "\ " 转义的行尾空格需要保留
+        pattern += ' '
+    negated = pattern.startswith('!')
+    if negated:
+        pattern = pattern[1:]
+    elif pattern.startswith(('\\!', '\\#')):
+        pattern = pattern[1:]
+    if pattern.endswith('/'):
+        dir_only = True
+        pattern = pattern.rstrip('/')
+    # 规则中间或开头含有 "/" 时相对于 base_dir 锚定，否则可以匹配任意层级
+    anchored = '/' in pattern
+    pattern = pattern.lstrip('/')
+    if not pattern:
+        return None
+    base_dir = base_dir.replace('\\', '/').strip('/')
+    prefix = re.escape(base_dir + '/') if base_dir and base_dir != '.' else ''
+    body = _translate_glob(pattern)
+    if not anchored and not prefix:
+        # 只与路径的最后一段比较，无需在整条路径上回溯
+        literal = None if _GLOB_CHARS.search(pattern) else pattern
+        return _Rule(body, negated, dir_only, True, literal)
+    regex = prefix + body if anchored else prefix + '(?:.*/)?' + body
+    return _Rule(regex, negated, dir_only, False, None)
+
+
+def _combine(indexed_rules):
+    """
+    将 (序号, 规则) 合并为一个正则。规则按倒序排列，第一个完整匹配的分支就是最后一条匹配的规则 (与 gitignore 一致)。
+    返回 (正则, 分组序号到 (序号, 规则) 的映射)；没有规则时正则为 None。
+    """
+    if not indexed_rules:
+        return None, ()
+    ordered = list(reversed(indexed_rules))
+    regex = re.compile("|".join(f"({rule.regex})" for _, rule in ordered), re.DOTALL)
+    return regex, tuple(ordered)
+
+
+class _RuleSet:
+    """
+    编译后的规则集合。不含通配符的文件名规则使用字典查找，其余只比较文件名的规则和需要比较整条路径的规则
+    各合并为一个正则，一次匹配即可得到最后一条生效的规则。
+    """
+
+    __slots__ = ('literals', 'name_regex', 'name_rules', 'path_regex', 'path_rules')
+
+    def __init__(self, rules):
+        self.literals = {}
+        name_rules, path_rules = [], []
+        for order, rule in enumerate(rules):
+            if rule.literal is not None:
+                self.literals[rule.literal] = (order, rule)
+            elif rule.name_only:
+                name_rules.append((order, rule))
+            else:
+                path_rules.append((order, rule))
+        self.name_regex, self.name_rules = _combine(name_rules)
+        self.path_regex, self.path_rules = _combine(path_rules)
+
+    def last_match(self, path, name):
+        """返回最后一条匹配的规则，没有匹配时返回 None"""
+        best = self.literals.get(name)
+        if self.name_regex is not None:
+            match = self.name_regex.fullmatch(name)
+            if match:
+                candidate = self.name_rules[match.lastindex - 1]
+                if best is None or candidate[0] > best[0]:
+                    best = candidate
+        if self.path_regex is not None:
+            match = self.path_regex.fullmatch(path)
+            if match:
+                candidate = self.path_rules[match.lastindex - 1]
+                if best is None or candidate[0] > best[0]:
+                    best = candidate
+        return best[1] if best else None
+
+
+def _needs_normalize(text):
+    """
+    判断路径 (或以换行符连接的多条路径) 是否需要规范化: 含反斜杠、以 / 或 ./ 开头、含 // 或 /./ /../ 片段。
+    只使用字符串查找，批量检查时比逐条正则匹配快得多。
+    """
+    return ('\\' in text or '//' in text or '/./' in text or '/../' in text
+            or text.startswith(('/', './', '../')) or '\n/' in text or '\n./' in text or '\n../' in text
+            or text.endswith(('/.', '/..')) or '/.\n' in text or '/..\n' in text)
+
+
+def _normalize_path(file_path):
+    """统一为以 / 分隔、不带 ./ 前缀的相对路径；常见的规范路径直接返回，避免调用 normpath"""
+    if _needs_normalize(file_path):
+        file_path = posixpath.normpath(file_path.replace('\\', '/')).lstrip('/')
+    return file_path
+
+
+def _build_batch_regex(rules, allowed_extensions):
+    """
+    没有 "!" 取反规则时，"是否允许" 只取决于路径能否匹配某条规则，可以合并为一个正则:
+    先检查扩展名，再用否定前瞻排除任意一段目录/文件名或整条路径前缀匹配规则的路径。
+    存在取反规则时返回 None，由逐条判定处理。
+    """
+    if any(rule.negated for rule in rules):
+        return None
+    parts = []
+    if allowed_extensions:
+        # 与 os.path.splitext 一致: 文件名开头的点不视为扩展名分隔符
+        extensions = "|".join(re.escape(ext.lstrip('.')) for ext in allowed_extensions)
+        parts.append(f"(?=(?:[^/]*/)*\\.*[^/.][^/]*\\.(?i:{extensions})\\Z)")
+    segment_rules = []
+    path_rules = []
+    for rule in rules:
+        # 只匹配目录的规则后面必须还有下一级路径；其余规则可以匹配目录或文件本身
+        ending = '/' if rule.dir_only else '(?:/|\\Z)'
+        (segment_rules if rule.name_only else path_rules).append(f"(?:{rule.regex}){ending}")
+    if segment_rules:
+        parts.append(f"(?!(?:[^/]*/)*?(?:{'|'.join(segment_rules)}))")
+    if path_rules:
+        parts.append(f"(?!(?:{'|'.join(path_rules)}))")
+    return re.compile("".join(parts), re.DOTALL)
+
 
 class FileFilter:
-    def __init__(self, ignored_folders=None, allowed_extensions=None, ignored_files=None):
+    def __init__(self, ignored_folders=None, allowed_extensions=None, ignored_files=None, ignore_patterns=None):
         """
-        初始化文件过滤器。
-        :param ignored_folders: 要忽略的文件夹列表 (相对于仓库根目录)。例如: ["Pods/", "node_modules/"]
+        初始化文件过滤器。所有规则遵循 .gitignore 语义: 不含 "/" 的规则匹配任意层级的同名目录或文件，
+        含有 "/" 的规则相对于仓库根目录锚定；支持 *、?、[abc]、** 通配符以及 "!" 取反规则，后出现的规则优先。
+        :param ignored_folders: 要忽略的文件夹列表。例如: ["Pods/", "node_modules/"] 会同时忽略 src/node_modules/ 等嵌套目录。
         :param allowed_extensions: 允许的文件扩展名列表。例如: [".py", ".js"]。如果为 None 或空列表，则不按扩展名过滤。
-        :param ignored_files: 要忽略的特定文件列表 (相对于仓库根目录)。例如: [".DS_Store"]
+        :param ignored_files: 要忽略的文件列表。例如: [".DS_Store", "docs/*.generated.py"]
+        :param ignore_patterns: 额外的 gitignore 风格规则，在上述规则之后生效。例如: ["**/build/", "!tools/build/"]
         """
-        self.ignored_folders = [os.path.normpath(folder).rstrip(os.sep) + os.sep for folder in ignored_folders] if ignored_folders else []
         self.allowed_extensions = [ext.lower() for ext in allowed_extensions] if allowed_extensions else []
-        self.ignored_files = [os.path.normpath(f) for f in ignored_files] if ignored_files else []
+        self._allowed_extension_set = frozenset(self.allowed_extensions)
+        self._rules = []
+        for folder in ignored_folders or []:
+            self._add_rule(_compile_rule(folder, dir_only=True))
+        for file_pattern in ignored_files or []:
+            self._add_rule(_compile_rule(file_pattern))
+        self.add_patterns(ignore_patterns or [])
+
+    def _add_rule(self, rule):
+        if rule is not None:
+            self._rules.append(rule)
+            self._compiled = None
+
+    def add_patterns(self, patterns, base_dir=''):
+        """
+        追加 gitignore 风格的规则。
+        :param patterns: 规则列表，或 .gitignore 文件的全部文本。
+        :param base_dir: 规则所属的目录 (相对于仓库根目录)，例如子目录中 .gitignore 的所在目录；规则只作用于该目录之下。
+        """
+        if isinstance(patterns, str):
+            patterns = patterns.splitlines()
+        for pattern in patterns:
+            self._add_rule(_compile_rule(pattern, base_dir))
+        self._compiled = None
+
+    def _ensure_compiled(self):
+        """
+        返回编译后的 _Compiled。同一实例会被多个扫描/审查线程共用，
+        因此全部在局部变量中构建好后一次性赋值，其他线程不会看到只编译了一部分的状态。
+        """
+        compiled = self._compiled
+        if compiled is None:
+            rules = list(self._rules)
+            compiled = _Compiled(
+                _RuleSet(rules),
+                _RuleSet([rule for rule in rules if not rule.dir_only]),
+                _build_batch_regex(rules, self.allowed_extensions),
+                # 目录判定结果的缓存: 同一目录下的大量文件只需判定一次目录
+                {}
+            )
+            self._compiled = compiled
+        return compiled
+
+    def compile(self):
+        """预先编译规则。多个线程共用同一实例前调用，避免各线程首次判定时重复编译。"""
+        self._ensure_compiled()
+
+    def is_dir_ignored(self, dir_path):
+        """
+        检查目录是否被忽略。父目录被忽略时，其下所有内容都被忽略 (与 git 一致，不能被子规则重新包含)。
+        :param dir_path: 相对于仓库根目录的目录路径。
+        """
+        return self._is_dir_ignored(_normalize_path(dir_path).rstrip('/'), self._ensure_compiled())
+
+    def _is_dir_ignored(self, dir_path, compiled):
+        ignored = compiled.dir_cache.get(dir_path)
+        if ignored is not None:
+            return ignored
+        parent, _, name = dir_path.rpartition('/')
+        ignored = bool(parent) and self._is_dir_ignored(parent, compiled)
+        if not ignored:
+            rule = compiled.dir_rules.last_match(dir_path, name)
+            ignored = rule is not None and not rule.negated
+        compiled.dir_cache[dir_path] = ignored
+        return ignored
 
     def is_allowed(self, file_path):
         """
@@ -18,22 +273,39 @@ class FileFilter:
         :param file_path: 相对于仓库根目录的文件路径。
         :return: 如果文件允许处理则返回 True，否则返回 False。
         """
-        normalized_file_path = os.path.normpath(file_path)
+        return self._is_allowed(_normalize_path(file_path), self._ensure_compiled())
 
-        # 1. 检查是否是明确忽略的文件
-        if normalized_file_path in self.ignored_files:
-            return False
+    def _is_allowed(self, file_path, compiled):
+        parent, _, file_name = file_path.rpartition('/')
 
-        # 2. 检查是否在忽略的文件夹内
-        for ignored_folder_prefix in self.ignored_folders:
-            if normalized_file_path.startswith(ignored_folder_prefix):
-                return False
-        
-        # 3. 如果指定了允许的扩展名，则检查文件扩展名
-        if self.allowed_extensions:
-            _, ext = os.path.splitext(normalized_file_path)
-            if ext.lower() not in self.allowed_extensions:
+        # 1. 如果指定了允许的扩展名，先检查扩展名 (开销最小，能排除大部分文件)
+        if self._allowed_extension_set:
+            stem = file_name.lstrip('.')
+            dot = stem.rfind('.')
+            if dot < 0 or stem[dot:].lower() not in self._allowed_extension_set:
                 return False
-        
-        # 如果通过所有检查，则文件是允许的
-        return True
\ No newline at end of file
+
+        # 2. 检查所在目录及其上级目录是否被忽略
+        if parent and self._is_dir_ignored(parent, compiled):
+            return False
+
+        # 3. 检查文件本身是否匹配忽略规则
+        rule = compiled.file_rules.last_match(file_path, file_name)
+        return rule is None or rule.negated
+
+    def is_allowed_many(self, file_paths):
+        """
+        批量过滤文件路径，适用于 git ls-tree 等输出的大量路径。
+        :param file_paths: 相对于仓库根目录的文件路径的可迭代对象。
+        :return: 允许处理的路径列表，保持输入顺序。
+        """
+        compiled = self._ensure_compiled()
+        file_paths = list(file_paths)
+        if compiled.batch_regex is not None:
+            # 没有取反规则: 一个合并正则即可完成判定，路径均已规范时逐条匹配完全在 C 层完成
+            match = compiled.batch_regex.match
+            if not _needs_normalize("\n".join(file_paths)):
+                return list(filter(match, file_paths))
+            return [path for path in file_paths if match(_normalize_path(path))]
+        is_allowed = self._is_allowed
+        return [path for path in file_paths if is_allowed(_normalize_path(path), compiled)]
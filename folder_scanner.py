@@ -0,0 +1,145 @@
+import os
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from review_metrics import get_default_metrics
+
+_SCAN_DONE = object()
+# 每个根目录的结果队列最多缓存的文件数，审查跟不上扫描时扫描线程等待，而不是把所有路径读入内存
+DEFAULT_QUEUE_SIZE = 1000
+# 队列已满时扫描线程检查停止信号的间隔 (秒)
+_PUT_POLL_SECONDS = 0.1
+
+
+class ScanStats:
+    """单个根目录的扫描统计"""
+
+    __slots__ = ('files_seen', 'files_matched', 'dirs_pruned', 'errors', 'failure')
+
+    def __init__(self):
+        self.files_seen = 0      # 扫描到的文件数 (不含被剪枝目录中的文件)
+        self.files_matched = 0   # 通过过滤规则的文件数
+        self.dirs_pruned = 0     # 被过滤规则整体跳过的目录数
+        self.errors = 0          # 无法读取的目录数
+        self.failure = None      # 扫描因异常中止时的异常，此时该根目录的结果不完整
+
+
+def scan_folder(base_folder_path, file_filter, stats=None, stop_event=None):
+    """
+    使用 os.scandir 深度优先扫描文件夹，产出通过过滤规则的文件 (完整路径, 相对于 base_folder_path 的路径)。
+    被忽略的目录在进入之前就被剪枝，不会遍历其中的任何条目。
+    每个目录内按名称排序，先产出文件再进入子目录，因此多次扫描的顺序一致。
+    :param file_filter: FileFilter 实例，相对路径用于 is_dir_ignored / is_allowed 判定。
+    :param stats: 可选的 ScanStats，用于累计扫描统计。
+    :param stop_event: 可选的 threading.Event，被设置后在进入下一个目录前停止扫描。
+    """
+    if stats is None:
+        stats = ScanStats()
+    # 栈中保存 (完整路径, 相对路径)；根目录的相对路径为空字符串
+    stack = [(base_folder_path, '')]
+    while stack:
+        if stop_event is not None and stop_event.is_set():
+            return
+        dir_path, rel_dir = stack.pop()
+        try:
+            with os.scandir(dir_path) as iterator:
+                entries = sorted(iterator, key=lambda entry: entry.name)
+        except OSError as e:
+            print(f"  警告: 无法读取目录 {dir_path}: {e}")
+            stats.errors += 1
+            continue
+
+        sub_dirs = []
+        for entry in entries:
+            rel_path = entry.name if not rel_dir else f"{rel_dir}/{entry.name}"
+            try:
+                # 与 os.walk 默认行为一致: 不进入指向目录的符号链接
+                if entry.is_dir(follow_symlinks=False):
+                    if file_filter.is_dir_ignored(rel_path):
+                        stats.dirs_pruned += 1
+                    else:
+                        sub_dirs.append((entry.path, rel_path))
+                    continue
+                if not entry.is_file():
+                    continue
+            except OSError:
+                continue
+            stats.files_seen += 1
+            if file_filter.is_allowed(rel_path):
+                stats.files_matched += 1
+                yield entry.path, rel_path.replace('/', os.sep)
+        # 倒序入栈，使子目录按名称顺序出栈
+        stack.extend(reversed(sub_dirs))
+
+
+class ParallelFolderScanner:
+    """
+    在后台线程中并行扫描多个根目录。每个根目录的结果通过独立的有界队列边扫描边产出，
+    调用方按根目录顺序消费 iter_files() 即可在扫描尚未结束时开始审查，且产出顺序与单线程扫描一致。
+    队列已满时扫描线程等待；close() 通知扫描线程停止，调用方提前结束或出错时不必等待整个目录树扫描完毕。
+    """
+
+    def __init__(self, folder_paths, file_filter, max_workers=4, queue_size=DEFAULT_QUEUE_SIZE):
+        self.folder_paths = list(folder_paths)
+        self.file_filter = file_filter
+        self.stats = [ScanStats() for _ in self.folder_paths]
+        self._queues = [queue.Queue(maxsize=max(1, queue_size)) for _ in self.folder_paths]
+        self._stop_event = threading.Event()
+        self._executor = None
+        self._lock = threading.Lock()
+        self._max_workers = max(1, min(int(max_workers or 1), len(self.folder_paths) or 1))
+
+    def start(self):
+        """启动所有根目录的后台扫描，重复调用无副作用"""
+        with self._lock:
+            if self._executor is not None:
+                return
+            # 在提交扫描任务前编译好过滤规则，各扫描线程共用编译结果
+            self.file_filter.compile()
+            self._executor = ThreadPoolExecutor(max_workers=self._max_workers, thread_name_prefix="folder-scan")
+            for root_index in range(len(self.folder_paths)):
+                self._executor.submit(self._scan_into_queue, root_index)
+
+    def _scan_into_queue(self, root_index):
+        base_folder_path = self.folder_paths[root_index]
+        result_queue = self._queues[root_index]
+        try:
+            with get_default_metrics().span("folder_scan"):
+                for found in scan_folder(base_folder_path, self.file_filter, self.stats[root_index], self._stop_event):
+                    if not self._put(result_queue, found):
+                        return
+        except Exception as e:
+            # 记录到统计中，由调用方写入报告，避免该根目录被当作没有文件而静默跳过
+            self.stats[root_index].failure = e
+            print(f"  错误: 扫描文件夹 {base_folder_path} 时发生异常: {e}")
+        finally:
+            self._put(result_queue, _SCAN_DONE)
+
+    def _put(self, result_queue, item):
+        """放入结果队列，队列已满时等待消费；已调用 close() 时放弃并返回 False"""
+        while not self._stop_event.is_set():
+            try:
+                result_queue.put(item, timeout=_PUT_POLL_SECONDS)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def iter_files(self, root_index):
+        """按扫描顺序产出第 root_index 个根目录下通过过滤的文件 (完整路径, 相对路径)，扫描结束后停止"""
+        self.start()
+        result_queue = self._queues[root_index]
+        while True:
+            found = result_queue.get()
+            if found is _SCAN_DONE:
+                return
+            yield found
+
+    def close(self):
+        """通知后台扫描停止并等待扫描线程结束 (未消费的结果被丢弃)"""
+        self._stop_event.set()
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
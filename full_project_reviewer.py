@@ -1,22 +1,44 @@
+import argparse
 import subprocess
+import threading
 import re
-import smtplib
 import json
 import os
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
-
-try:
-    import requests
-except ImportError:
-    raise ImportError("请先使用pip安装requests模块: pip install requests")
 
 # 从 file_filter.py 导入 FileFilter 类
 from file_filter import FileFilter
+from concurrent_review import ReviewProgress, imap_ordered
+from review_cache import ReviewCache, git_blob_sha
+from http_transport import ApiRequestError, STREAM_CUTOFF_MARKER, get_default_transport
+from llm_router import create_router
+from git_blob_reader import GitBlobReader
+from folder_scanner import ParallelFolderScanner
+from report_writer import ReportWriter, read_report_preview
+from review_state import ReviewStateStore
+from review_journal import ReviewJournal
+from notifier import get_default_dispatcher
+from review_metrics import MetricsRun, UsageTally, get_default_metrics, git_stage_name, usage_scope
+from review_dedup import ReviewDeduplicator, content_key, normalize_content
+from review_budget import TokenBudgetGovernor, compile_risk_keywords, estimate_review_tokens, parse_churn, rank_by_risk
+from batch_review import build_batch_review_messages, plan_review_units, split_batch_review
+from chunked_review import review_in_chunks
+from prompt_templates import (
+    FILE_REVIEW_SYSTEM_PROMPT,
+    FILE_REVIEW_USER_TEMPLATE,
+    CHUNK_REVIEW_SYSTEM_PROMPT,
+    CHUNK_REVIEW_USER_TEMPLATE,
+    CONSOLIDATE_REVIEW_SYSTEM_PROMPT,
+    CONSOLIDATE_REVIEW_USER_TEMPLATE,
+    BATCH_REVIEW_SYSTEM_PROMPT,
+    BATCH_REVIEW_USER_TEMPLATE,
+    build_messages,
+    prompt_fingerprint
+)
 
 # 从 config.py 导入配置
 from config import DEEPSEEK_API_KEY as CONFIG_DEEPSEEK_API_KEY
 from config import DEEPSEEK_API_URL as CONFIG_DEEPSEEK_API_URL
+from config import DEEPSEEK_MODEL as CONFIG_DEEPSEEK_MODEL
 from config import WECHAT_WEBHOOK_URL as CONFIG_WECHAT_WEBHOOK_URL
 from config import (
     SMTP_HOST as CONFIG_SMTP_HOST,
@@ -28,13 +50,47 @@ from config import (
     DEFAULT_IGNORED_FOLDERS,
     DEFAULT_ALLOWED_FILE_EXTENSIONS,
     DEFAULT_IGNORED_FILES,
-    FOLDERS_TO_REVIEW # <--- 新增导入
+    DEFAULT_IGNORE_PATTERNS,
+    FOLDERS_TO_REVIEW, # <--- 新增导入
+    REVIEW_MAX_WORKERS,
+    REVIEW_CACHE_ENABLED,
+    REVIEW_CACHE_PATH,
+    REVIEW_CACHE_MAX_AGE_DAYS,
+    REVIEW_CACHE_MAX_SIZE_MB,
+    CHUNKED_REVIEW_ENABLED,
+    CHUNK_MAX_TOKENS,
+    READ_FILES_FROM_GIT,
+    INCREMENTAL_REVIEW_ENABLED,
+    REVIEW_STATE_PATH,
+    REVIEW_JOURNAL_ENABLED,
+    REVIEW_JOURNAL_DIR,
+    BATCH_REVIEW_ENABLED,
+    BATCH_SMALL_FILE_MAX_BYTES,
+    BATCH_MAX_TOKENS,
+    BATCH_MAX_FILES,
+    API_STREAM_ENABLED,
+    STREAM_MAX_SECONDS,
+    STREAM_MAX_OUTPUT_TOKENS,
+    BUDGET_MODE_ENABLED,
+    BUDGET_MAX_TOKENS,
+    BUDGET_MAX_COST,
+    BUDGET_PRICE_INPUT_PER_MTOK,
+    BUDGET_PRICE_CACHED_INPUT_PER_MTOK,
+    BUDGET_PRICE_OUTPUT_PER_MTOK,
+    BUDGET_EXPECTED_OUTPUT_TOKENS,
+    BUDGET_CHURN_DAYS,
+    BUDGET_RISK_KEYWORDS,
+    BUDGET_LANGUAGE_WEIGHTS,
+    DEDUP_REVIEW_ENABLED,
+    ADAPTIVE_CONCURRENCY_ENABLED,
+    ADAPTIVE_MAX_CONCURRENCY
 )
 
 # --- 默认配置 (可以在实例化 ProjectReviewer 时覆盖) ---
 DEFAULT_REPO_PATH = "."  # 默认为当前目录
 DEFAULT_DEEPSEEK_API_KEY = CONFIG_DEEPSEEK_API_KEY
 DEFAULT_DEEPSEEK_API_URL = CONFIG_DEEPSEEK_API_URL
+DEFAULT_DEEPSEEK_MODEL = CONFIG_DEEPSEEK_MODEL
 DEFAULT_SMTP_CONFIG = {
     "host": CONFIG_SMTP_HOST,
     "port": CONFIG_SMTP_PORT,
@@ -47,6 +103,66 @@ DEFAULT_WECHAT_WEBHOOK_URL = CONFIG_WECHAT_WEBHOOK_URL
 DEFAULT_FILE_EXTENSIONS = DEFAULT_ALLOWED_FILE_EXTENSIONS # 使用 config 中的默认扩展名
 DEFAULT_IGNORED_FOLDERS_CONFIG = DEFAULT_IGNORED_FOLDERS # 使用 config 中的默认忽略文件夹
 DEFAULT_IGNORED_FILES_CONFIG = DEFAULT_IGNORED_FILES # 使用 config 中的默认忽略文件
+DEFAULT_IGNORE_PATTERNS_CONFIG = DEFAULT_IGNORE_PATTERNS # 使用 config 中的额外 gitignore 风格规则
+DEFAULT_REVIEW_MAX_WORKERS = REVIEW_MAX_WORKERS # 使用 config 中的默认并发数
+DEFAULT_CHUNKED_REVIEW = CHUNKED_REVIEW_ENABLED # 超大文件是否分块审查
+DEFAULT_CHUNK_MAX_TOKENS = CHUNK_MAX_TOKENS # 分块审查时每块的 token 预算
+MAX_CONTENT_LENGTH = 15000 # 单次审查的文件字符数上限，根据API和需求调整
+DEFAULT_READ_FILES_FROM_GIT = READ_FILES_FROM_GIT # 从 git 对象库读取目标分支的文件内容
+DEFAULT_INCREMENTAL_REVIEW = INCREMENTAL_REVIEW_ENABLED # 只审查自上次审查以来变更的文件
+INCREMENTAL_SAVE_BATCH_SIZE = 50 # 增量审查时每审查成功多少个文件保存一次结果
+DEFAULT_REVIEW_JOURNAL_DIR = REVIEW_JOURNAL_DIR if REVIEW_JOURNAL_ENABLED else None # 全项目审查的检查点日志目录
+DEFAULT_BATCH_REVIEW = BATCH_REVIEW_ENABLED # 将相邻的小文件合并为一次请求审查
+DEFAULT_STREAM_RESPONSES = API_STREAM_ENABLED # 以 SSE 流式接收审查结果
+DEFAULT_STREAM_MAX_SECONDS = STREAM_MAX_SECONDS # 流式生成的单次时长上限，超出时取消并保留已生成内容
+DEFAULT_STREAM_MAX_OUTPUT_TOKENS = STREAM_MAX_OUTPUT_TOKENS # 流式生成的单次 token 上限，0 表示不限制
+DEFAULT_BUDGET_MODE = BUDGET_MODE_ENABLED # 按风险排序审查，达到 token / 费用上限后跳过剩余文件
+DEFAULT_DEDUP_REVIEW = DEDUP_REVIEW_ENABLED # 内容相同的文件只审查一次
+
+# DeepSeek API 返回的错误信息前缀，带有这些前缀的结果不会写入缓存
+API_ERROR_PREFIXES = ("DeepSeek API 请求失败", "解析 DeepSeek API 响应失败")
+
+
+def is_api_error(review_text):
+    """判断审查结果是否为 API 调用失败时返回的错误信息"""
+    return not review_text or review_text.startswith(API_ERROR_PREFIXES)
+
+
+def is_incomplete_review(review_text):
+    """判断审查结果是否不完整 (API 调用失败或流式生成被提前截断)，不完整的结果不写入缓存"""
+    return is_api_error(review_text) or STREAM_CUTOFF_MARKER in review_text
+
+
+def report_parts_failed(report_parts):
+    """判断某个文件的报告片段是否表示审查失败 (读取失败或 API 调用失败)，失败的结果不应被沿用"""
+    for part in report_parts:
+        if "\n错误: " in part or any(prefix in part for prefix in API_ERROR_PREFIXES):
+            return True
+    return False
+
+
+def format_review_parts(file_path, review_comments, duplicate_of=None):
+    """生成单个文件的审查意见报告片段；duplicate_of 为内容相同、已审查过的文件路径"""
+    if duplicate_of:
+        return [f"--- 文件: {file_path} ---", f"AI 代码审查意见 (内容与 {duplicate_of} 相同，沿用其审查结果):\n" + review_comments + "\n"]
+    return [f"--- 文件: {file_path} ---", "AI 代码审查意见:\n" + review_comments + "\n"]
+
+
+def create_default_review_cache():
+    """根据 config.py 中的缓存配置创建审查缓存，未启用时返回 None"""
+    if not REVIEW_CACHE_ENABLED:
+        return None
+    return ReviewCache(REVIEW_CACHE_PATH, max_age_days=REVIEW_CACHE_MAX_AGE_DAYS, max_size_mb=REVIEW_CACHE_MAX_SIZE_MB)
+
+def worker_count(max_workers):
+    """
+    审查线程数。启用自适应并发时提高到 ADAPTIVE_MAX_CONCURRENCY，
+    由传输层的自适应上限控制实际在途的请求数。
+    """
+    max_workers = max(1, int(max_workers or 1))
+    if ADAPTIVE_CONCURRENCY_ENABLED:
+        return max(max_workers, ADAPTIVE_MAX_CONCURRENCY)
+    return max_workers
 
 class ProjectReviewer:
     def __init__(self, repo_path=DEFAULT_REPO_PATH,
@@ -58,23 +174,71 @@ class ProjectReviewer:
                  target_branch=None,
                  ignored_folders=None,
                  ignored_files=None,
-                 allowed_extensions_override=None # 新增，用于覆盖config中的allowed_extensions
+                 allowed_extensions_override=None, # 新增，用于覆盖config中的allowed_extensions
+                 ignore_patterns=None, # 额外的 gitignore 风格规则，为 None 时使用 config 中的 DEFAULT_IGNORE_PATTERNS
+                 max_workers=DEFAULT_REVIEW_MAX_WORKERS, # 同时在途的 API 请求数，1 表示顺序审查
+                 review_cache=None, # ReviewCache 实例；为 None 时按 config 中的 REVIEW_CACHE_ENABLED 创建默认缓存
+                 model=DEFAULT_DEEPSEEK_MODEL,
+                 max_tokens=3000,
+                 transport=None, # ApiTransport 实例；为 None 时使用进程内共享的默认传输层
+                 chunked_review=DEFAULT_CHUNKED_REVIEW, # 超过长度上限的文件分块审查而不是截断
+                 chunk_max_tokens=DEFAULT_CHUNK_MAX_TOKENS,
+                 read_from_git=DEFAULT_READ_FILES_FROM_GIT, # 从 target_branch 的 git 对象中读取内容，而不是工作区文件
+                 incremental=DEFAULT_INCREMENTAL_REVIEW, # 只审查自上次审查的提交以来新增或修改的文件
+                 review_state=None, # ReviewStateStore 实例；为 None 时在启用增量审查时使用 config 中的 REVIEW_STATE_PATH
+                 journal_dir=DEFAULT_REVIEW_JOURNAL_DIR, # 检查点日志目录，为 None 时不记录检查点 (无法 --resume)
+                 batch_review=DEFAULT_BATCH_REVIEW, # 将相邻的小文件合并为一次请求审查
+                 stream_responses=DEFAULT_STREAM_RESPONSES, # 流式接收审查结果，显示生成进度并在超出上限时取消生成
+                 stream_max_seconds=DEFAULT_STREAM_MAX_SECONDS,
+                 stream_max_output_tokens=DEFAULT_STREAM_MAX_OUTPUT_TOKENS,
+                 budget_mode=DEFAULT_BUDGET_MODE, # 按风险从高到低审查，达到预算上限后跳过剩余文件
+                 budget_max_tokens=BUDGET_MAX_TOKENS,
+                 budget_max_cost=BUDGET_MAX_COST,
+                 dedup_review=DEFAULT_DEDUP_REVIEW # 内容相同的文件只审查一次，其余路径沿用结果
                  ):
         self.repo_path = os.path.abspath(repo_path)
         self.deepseek_api_key = deepseek_api_key
         self.deepseek_api_url = deepseek_api_url
         self.smtp_config = smtp_config if smtp_config else DEFAULT_SMTP_CONFIG.copy() #确保是副本
         self.wechat_webhook_url = wechat_webhook_url
+        self.max_workers = worker_count(max_workers)
+        # 同时在途的 API 调用数上限: 文件级与分块级的并发共用，使分块审查的调用不会超出 max_workers
+        self._api_slots = threading.BoundedSemaphore(self.max_workers)
+        self._total_files = 0
+        self.model = model
+        self.max_tokens = max_tokens
+        self.review_cache = review_cache if review_cache is not None else create_default_review_cache()
+        self.transport = transport if transport is not None else get_default_transport()
+        # DeepSeek 与 config 中 LLM_PROVIDERS 的其他后端，按延迟路由并在失败时切换
+        self.router = create_router(self.deepseek_api_key, self.deepseek_api_url, self.model, self.transport)
+        self.chunked_review = chunked_review
+        self.chunk_max_tokens = chunk_max_tokens
+        self.blob_reader = GitBlobReader(self.repo_path) if read_from_git else None
+        self.incremental = incremental
+        if review_state is None and incremental:
+            review_state = ReviewStateStore(REVIEW_STATE_PATH)
+        self.review_state = review_state
+        self.journal_dir = journal_dir
+        self.batch_review = batch_review
+        self.stream_responses = stream_responses
+        self.stream_max_seconds = stream_max_seconds
+        self.stream_max_output_tokens = stream_max_output_tokens
+        self.budget_mode = budget_mode
+        self.budget_max_tokens = budget_max_tokens
+        self.budget_max_cost = budget_max_cost
+        self.deduplicator = ReviewDeduplicator(dedup_review)
         
         # 初始化 FileFilter
         _ignored_folders = ignored_folders if ignored_folders is not None else DEFAULT_IGNORED_FOLDERS_CONFIG
         _ignored_files = ignored_files if ignored_files is not None else DEFAULT_IGNORED_FILES_CONFIG
         _allowed_extensions = allowed_extensions_override if allowed_extensions_override is not None else DEFAULT_ALLOWED_FILE_EXTENSIONS
+        _ignore_patterns = ignore_patterns if ignore_patterns is not None else DEFAULT_IGNORE_PATTERNS_CONFIG
         
         self.file_filter = FileFilter(
             ignored_folders=_ignored_folders,
             allowed_extensions=_allowed_extensions,
-            ignored_files=_ignored_files
+            ignored_files=_ignored_files,
+            ignore_patterns=_ignore_patterns
         )
         # self.file_extensions 保留用于可能的向后兼容或特定逻辑，但主要过滤由 self.file_filter 完成
         self.file_extensions = _allowed_extensions 
@@ -91,8 +255,9 @@ class ProjectReviewer:
         """执行 shell 命令并返回输出"""
         effective_cwd = cwd if cwd else self.repo_path
         try:
-            process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, shell=True, cwd=effective_cwd, text=True, encoding='utf-8')
-            stdout, stderr = process.communicate(timeout=60) # 增加超时
+            with get_default_metrics().span(git_stage_name(command)):
+                process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, shell=True, cwd=effective_cwd, text=True, encoding='utf-8')
+                stdout, stderr = process.communicate(timeout=60) # 增加超时
             if process.returncode != 0:
                 print(f"命令执行错误: {command}")
                 print(f"Stderr: {stderr}")
@@ -114,7 +279,8 @@ class ProjectReviewer:
 
     def get_project_files(self):
         """获取项目中符合条件的文件列表"""
-        command = f"git ls-tree -r --name-only {self.target_branch}"
+        # -z: 路径以 \0 分隔且不加引号，含空格或非 ASCII 字符 (例如中文) 的路径保持原样
+        command = f"git ls-tree -r -z --name-only {self.target_branch}"
         print(f"正在获取分支 '{self.target_branch}' 下的文件列表...")
         all_files_output = self._run_command(command)
 
@@ -122,15 +288,10 @@ class ProjectReviewer:
             print(f"无法获取分支 '{self.target_branch}' 下的文件列表。请检查仓库状态和分支名称。")
             return []
 
-        all_repo_files = all_files_output.strip().splitlines()
+        all_repo_files = [file_path for file_path in all_files_output.split('\0') if file_path]
         
-        filtered_files = []
-        ignored_count = 0
-        for file_path in all_repo_files:
-            if self.file_filter.is_allowed(file_path):
-                filtered_files.append(file_path)
-            else:
-                ignored_count += 1
+        filtered_files = self.file_filter.is_allowed_many(all_repo_files)
+        ignored_count = len(all_repo_files) - len(filtered_files)
         
         if ignored_count > 0:
             print(f"已根据过滤规则忽略了 {ignored_count} 个文件。")
@@ -138,8 +299,72 @@ class ProjectReviewer:
         print(f"从 {len(all_repo_files)} 个总文件中，筛选出 {len(filtered_files)} 个文件进行审查。")
         return filtered_files
 
-    def _call_deepseek_api(self, messages):
-        """调用 DeepSeek API"""
+    def _resolve_commit(self, rev):
+        """将分支名等引用解析为提交 SHA，失败时返回 None"""
+        output = self._run_command(f"git rev-parse --verify {rev}^{{commit}}")
+        return output.strip() if output else None
+
+    def get_changed_files_since(self, base_commit, head_commit):
+        """
+        使用 git diff --name-status 列出 base_commit 到 head_commit 之间新增、修改、重命名或复制后的文件路径。
+        :return: 路径集合；命令失败时返回 None。
+        """
+        output = self._run_command(f"git diff --name-status -z -M {base_commit} {head_commit}")
+        if output is None:
+            return None
+        changed_files = set()
+        tokens = output.split('\0')
+        index = 0
+        while index < len(tokens) and tokens[index]:
+            status = tokens[index][:1]
+            if status in ('R', 'C'):
+                # 重命名/复制: 状态之后依次是旧路径和新路径
+                changed_files.add(tokens[index + 2])
+                index += 3
+                continue
+            if status != 'D':
+                changed_files.add(tokens[index + 1])
+            index += 2
+        return changed_files
+
+    def _find_carried_files(self, head_commit, project_files):
+        """
+        增量审查时，返回可以直接沿用上次审查结果的文件路径集合 (报告内容在写入报告时才逐个读取)。
+        没有上次记录或无法计算变更时返回空集合，即审查全部文件。
+        """
+        last_commit = self.review_state.get_last_commit(self.repo_path, self.target_branch)
+        if not last_commit:
+            print("增量审查: 未找到该分支的审查记录，本次将审查全部文件。")
+            return set()
+        changed_files = self.get_changed_files_since(last_commit, head_commit)
+        if changed_files is None:
+            print(f"增量审查: 无法计算自 {last_commit[:10]} 以来的变更 (提交可能已不存在)，本次将审查全部文件。")
+            return set()
+        stored_paths = self.review_state.stored_paths(self.repo_path, self.target_branch)
+        carried = {path for path in project_files if path in stored_paths and path not in changed_files}
+        print(f"增量审查: 自 {last_commit[:10]} 以来有 {len(changed_files)} 个文件新增或修改，"
+              f"沿用 {len(carried)} 个未变更文件的审查结果，需审查 {len(project_files) - len(carried)} 个文件。")
+        return carried
+
+    def _finish_incremental_state(self, head_commit, project_files, failed_files, skipped_files=()):
+        """
+        记录本次审查的提交，并清理已不在审查范围内的文件记录。
+        审查失败或因超出预算被跳过的文件同时删除旧记录，否则下次运行时会被当作未变更文件沿用过时的结果。
+        """
+        stored_paths = self.review_state.stored_paths(self.repo_path, self.target_branch)
+        stale_paths = (stored_paths - set(project_files)) | (stored_paths & (set(failed_files) | set(skipped_files)))
+        self.review_state.delete_findings(self.repo_path, self.target_branch, stale_paths)
+        self.review_state.set_last_commit(self.repo_path, self.target_branch, head_commit)
+        if failed_files:
+            print(f"增量审查: {len(failed_files)} 个文件审查失败，下次运行时将重新审查。")
+        if skipped_files:
+            print(f"增量审查: {len(skipped_files)} 个文件因超出预算被跳过，下次运行时将重新审查。")
+
+    def _call_deepseek_api(self, messages, progress_label=None):
+        """
+        调用 DeepSeek API
+        :param progress_label: 流式接收时打印生成进度使用的名称 (通常是文件路径)。
+        """
         if not self.deepseek_api_key or self.deepseek_api_key == "YOUR_DEEPSEEK_API_KEY": # 此处的 "YOUR_DEEPSEEK_API_KEY" 检查可能需要调整或移除，因为默认值已来自 config
             # 如果 config.py 中的值是占位符，则此警告仍然有效
             # 如果 config.py 中的值是真实的 key，则此警告逻辑可能需要调整
@@ -147,26 +372,26 @@ class ProjectReviewer:
             print("警告: DeepSeek API Key 未配置或使用的是默认占位符。请检查 config.py 或环境变量。")
             # return "错误: DeepSeek API Key 未配置。" # 保持原有逻辑或调整
 
-        headers = {
-            "Content-Type": "application/json",
-            "Authorization": f"Bearer {self.deepseek_api_key}"
-        }
         payload = {
-            "model": "deepseek-coder",
+            "model": self.model,
             "messages": messages,
-            "max_tokens": 3000,
+            "max_tokens": self.max_tokens,
             "temperature": 0.3,
         }
         try:
-            response = requests.post(self.deepseek_api_url, headers=headers, json=payload, timeout=180)
-            response.raise_for_status()
-            return response.json()["choices"][0]["message"]["content"]
-        except requests.exceptions.RequestException as e:
+            with self._api_slots:
+                return self.router.complete(
+                    payload, timeout=180,
+                    stream=self.stream_responses, stream_max_seconds=self.stream_max_seconds,
+                    stream_max_output_tokens=self.stream_max_output_tokens,
+                    progress_label=progress_label or "DeepSeek API"
+                )
+        except ApiRequestError as e:
             print(f"DeepSeek API 请求失败: {e}")
-            if hasattr(e, 'response') and e.response is not None:
-                print(f"API 响应内容: {e.response.text}")
+            if e.response_text:
+                print(f"API 响应内容: {e.response_text}")
             return f"DeepSeek API 请求失败: {e}"
-        except (KeyError, IndexError) as e:
+        except (KeyError, IndexError, TypeError) as e:
             print(f"解析 DeepSeek API 响应失败: {e}")
             return f"解析 DeepSeek API 响应失败: {e}"
 
@@ -175,74 +400,436 @@ class ProjectReviewer:
         if not file_content.strip():
             return "文件内容为空，跳过审查。"
 
-        # 限制文件内容长度，避免超出API限制或处理过大文件
-        max_content_length = 15000 # 字符数，根据API和需求调整
-        if len(file_content) > max_content_length:
-            print(f"警告: 文件 {file_path} 内容过长 ({len(file_content)} chars)，将截断至 {max_content_length} chars 进行审查。")
-            file_content = file_content[:max_content_length]
-
-        prompt = f"""
-        请对以下位于项目路径 '{file_path}' 中的代码文件进行全面的代码审查。
-        文件内容如下:
-        ```
-        {file_content}
-        ```
-        请重点关注以下方面，并给出具体的、可操作的审查意见：
-        1.  **潜在的 Bug 和逻辑错误**: 识别代码中可能存在的错误、边界条件问题或不正确的逻辑。
-        2.  **安全漏洞**: 检查是否存在常见的安全风险，如注入、XSS、数据泄露等（根据代码语言和上下文判断）。
-        3.  **代码可读性和可维护性**: 评估代码的清晰度、注释质量、命名规范、模块化程度等。是否有过于复杂或难以理解的部分？
-        4.  **性能问题**: 分析是否存在可能的性能瓶颈，如低效算法、不当的资源使用等。
-        5.  **编程最佳实践和代码风格**: 代码是否遵循了该语言和项目的通用最佳实践和编码规范？
-        6.  **具体改进建议**: 对发现的每个问题，提供清晰的改进方案或代码示例。
-        7.  **总结**: 简要总结文件的主要功能和整体代码质量。
-
-        请以 Markdown 格式返回您的审查意见，使用标题、列表等使报告易于阅读。
-        如果文件内容看起来不像是源代码（例如纯文本、配置文件、二进制文件等），请指出。
+        # 超出长度上限时，启用分块审查则按函数/类边界拆分审查，否则截断
+        use_chunks = self.chunked_review and len(file_content) > MAX_CONTENT_LENGTH
+
+        cache_key = None
+        if self.review_cache is not None:
+            if use_chunks:
+                template_fingerprint = prompt_fingerprint(
+                    CHUNK_REVIEW_SYSTEM_PROMPT, CHUNK_REVIEW_USER_TEMPLATE,
+                    CONSOLIDATE_REVIEW_SYSTEM_PROMPT, CONSOLIDATE_REVIEW_USER_TEMPLATE
+                ) + f":{self.chunk_max_tokens}"
+            else:
+                template_fingerprint = prompt_fingerprint(FILE_REVIEW_SYSTEM_PROMPT, FILE_REVIEW_USER_TEMPLATE)
+            cache_key = ReviewCache.make_key(
+                "project_file_review", git_blob_sha(file_content), file_path,
+                template_fingerprint, self.model, self.max_tokens
+            )
+            cached_review = self.review_cache.get(cache_key)
+            if cached_review is not None:
+                print(f"  {file_path} 内容未变更，使用缓存的审查结果。")
+                return cached_review
+
+        if use_chunks:
+            review_comments, all_ok = review_in_chunks(
+                file_path, file_content,
+                lambda messages: self._call_deepseek_api(messages, progress_label=file_path),
+                self.chunk_max_tokens, max_workers=self.max_workers, is_error=is_incomplete_review
+            )
+            if cache_key is not None and all_ok:
+                self.review_cache.put(cache_key, review_comments)
+            return review_comments
+
+        if len(file_content) > MAX_CONTENT_LENGTH:
+            print(f"警告: 文件 {file_path} 内容过长 ({len(file_content)} chars)，将截断至 {MAX_CONTENT_LENGTH} chars 进行审查。")
+            file_content = file_content[:MAX_CONTENT_LENGTH]
+
+        with get_default_metrics().span("prompt_build"):
+            messages = build_messages(FILE_REVIEW_SYSTEM_PROMPT, FILE_REVIEW_USER_TEMPLATE,
+                                      file_path=file_path, file_content=file_content)
+        review_comments = self._call_deepseek_api(messages, progress_label=file_path)
+        if cache_key is not None and not is_incomplete_review(review_comments):
+            self.review_cache.put(cache_key, review_comments)
+        return review_comments
+
+    def _read_file_content(self, file_rel_path):
+        """
+        读取待审查文件的内容。
+        启用 read_from_git 时从 target_branch 对应的 git 对象中读取，与 get_project_files 列出的文件版本一致；
+        否则读取工作区中的文件。文件不存在时抛出 FileNotFoundError。
+        """
+        with get_default_metrics().span("file_read"):
+            if self.blob_reader is not None:
+                file_content = self.blob_reader.read_text(self.target_branch, file_rel_path)
+                if file_content is None:
+                    raise FileNotFoundError(f"{self.target_branch}:{file_rel_path}")
+                return file_content
+            with open(os.path.join(self.repo_path, file_rel_path), 'r', encoding='utf-8', errors='ignore') as f:
+                return f.read()
+
+    def _review_single_file(self, indexed_file):
+        """
+        审查单个文件并返回该文件在报告中的各个片段。
+        该方法可能在工作线程中并发执行，因此只返回结果，不修改共享状态。
+        :param indexed_file: (序号, 相对路径) 元组，序号从 1 开始。
+        """
+        index, file_rel_path = indexed_file
+        full_file_path = os.path.join(self.repo_path, file_rel_path)
+        print(f"\n正在审查文件 [{index}/{self._total_files}]: {file_rel_path}")
+
+        try:
+            file_content = self._read_file_content(file_rel_path)
+        except FileNotFoundError:
+            print(f"  错误: 文件 {full_file_path} 未找到。")
+            return [f"--- 文件: {file_rel_path} ---\n错误: 文件未找到。\n"]
+        except Exception as e:
+            print(f"  错误: 读取文件 {full_file_path} 失败: {e}")
+            return [f"--- 文件: {file_rel_path} ---\n错误: 读取文件失败 - {e}\n"]
+
+        if not file_content.strip():
+            print(f"  文件 {file_rel_path} 内容为空，跳过。")
+            return [f"--- 文件: {file_rel_path} ---", "文件内容为空，跳过审查。\n"]
+
+        review_comments, duplicate_of = self.deduplicator.review_once(
+            content_key(normalize_content(file_content)), file_rel_path,
+            lambda: self.get_review_for_file_content(file_rel_path, file_content), is_error=is_incomplete_review
+        )
+        if duplicate_of:
+            print(f"  {file_rel_path} 与 {duplicate_of} 内容相同，沿用其审查结果。")
+        else:
+            print(f"  {file_rel_path} 审查完成 (部分意见): {review_comments[:100].replace(os.linesep, ' ').strip()}...")
+        return format_review_parts(file_rel_path, review_comments, duplicate_of)
+
+    def _review_file_failed(self, indexed_file, error):
+        """单个文件审查过程中出现未预期异常时生成的报告片段，不影响其他文件"""
+        _, file_rel_path = indexed_file
+        print(f"  错误: 审查文件 {file_rel_path} 时发生异常: {error}")
+        return [f"--- 文件: {file_rel_path} ---\n错误: 审查过程中发生异常 - {error}\n"]
+
+    def _get_file_sizes(self, project_files):
+        """返回 {文件路径: 字节数}，用于判断哪些文件足够小、可以合并审查"""
+        file_sizes = {}
+        if self.blob_reader is not None:
+            # git ls-tree -l -z 的每条记录: "<mode> <type> <sha> <size>\t<path>"，以 \0 分隔，
+            # 路径不加引号，与 get_project_files 中的路径一致
+            output = self._run_command(f"git ls-tree -r -l -z {self.target_branch}")
+            for record in (output or "").split('\0'):
+                meta, _, file_path = record.partition('\t')
+                fields = meta.split()
+                if len(fields) == 4 and fields[3].isdigit():
+                    file_sizes[file_path] = int(fields[3])
+            return file_sizes
+        for file_path in project_files:
+            try:
+                file_sizes[file_path] = os.path.getsize(os.path.join(self.repo_path, file_path))
+            except OSError:
+                pass
+        return file_sizes
+
+    def _get_recent_churn(self):
+        """统计最近 BUDGET_CHURN_DAYS 天内目标分支上每个文件的修改次数，命令失败时返回空字典"""
+        output = self._run_command(f"git log --since={BUDGET_CHURN_DAYS}.days --name-only -z --format= {self.target_branch}")
+        return parse_churn(output)
+
+    def _plan_budget(self, project_files, reusable):
+        """
+        预算审查的准备工作: 按风险从高到低排序文件，并在本地估算每个文件的 token 消耗 (不读取文件内容)。
+        :param reusable: 可直接沿用结果、不会调用 API 的文件路径集合，这些文件不计入预计消耗。
+        :return: (排序后的文件列表, {文件路径: (风险评分, 信号说明)}, {文件路径: (输入 token, 输出 token)}, 预算控制器)
+        """
+        file_sizes = self._get_file_sizes(project_files)
+        ranked = rank_by_risk(project_files, file_sizes, self._get_recent_churn(),
+                              BUDGET_LANGUAGE_WEIGHTS, compile_risk_keywords(BUDGET_RISK_KEYWORDS))
+        # 提示词模板中多为中文，按每个字符约一个 token 保守估算
+        template_tokens = len(FILE_REVIEW_SYSTEM_PROMPT) + len(FILE_REVIEW_USER_TEMPLATE)
+        expected_output_tokens = min(BUDGET_EXPECTED_OUTPUT_TOKENS, self.max_tokens)
+        estimates = {
+            file_path: estimate_review_tokens(file_sizes.get(file_path), template_tokens, expected_output_tokens,
+                                              MAX_CONTENT_LENGTH, self.chunked_review, self.chunk_max_tokens)
+            for file_path in project_files
+        }
+        governor = TokenBudgetGovernor(
+            self.budget_max_tokens, self.budget_max_cost,
+            BUDGET_PRICE_INPUT_PER_MTOK, BUDGET_PRICE_CACHED_INPUT_PER_MTOK, BUDGET_PRICE_OUTPUT_PER_MTOK
+        )
+        pending = [estimates[file_path] for file_path in project_files if file_path not in reusable]
+        total_input = sum(input_tokens for input_tokens, _ in pending)
+        total_output = sum(output_tokens for _, output_tokens in pending)
+        print(f"预算审查: {governor.describe_limits()}，{len(pending)} 个待审查文件预计消耗约 {total_input + total_output} tokens "
+              f"(费用约 {governor.estimate_cost(total_input, total_output):.4f})，按风险从高到低审查。")
+        for file_path, score, reasons in ranked[:5]:
+            print(f"  高风险: {file_path} (评分 {score:.2f}{'，' + '，'.join(reasons) if reasons else ''})")
+        risk = {file_path: (score, reasons) for file_path, score, reasons in ranked}
+        return [file_path for file_path, _, _ in ranked], risk, estimates, governor
+
+    @staticmethod
+    def _format_budget_skipped(skipped_files, file_risk, file_estimates):
+        """生成报告末尾因超出预算而跳过的文件列表"""
+        lines = [f"\n--- 因超出预算而跳过的文件 ({len(skipped_files)} 个，按风险从高到低) ---"]
+        for file_rel_path in skipped_files:
+            score, reasons = file_risk[file_rel_path]
+            input_tokens, output_tokens = file_estimates[file_rel_path]
+            line = f"- {file_rel_path} (风险评分 {score:.2f}，预计 {input_tokens + output_tokens} tokens"
+            lines.append(line + (f"，{'，'.join(reasons)})" if reasons else ")"))
+        return "\n".join(lines) + "\n"
+
+    def _review_batch(self, indexed_files):
         """
-        messages = [{"role": "user", "content": prompt}]
-        return self._call_deepseek_api(messages)
+        将多个小文件合并为一次请求进行审查，返回每个文件的报告片段 (顺序与 indexed_files 一致)。
+        请求失败或回答无法按文件拆分时，回退为逐个文件审查。
+        """
+        file_paths = [file_rel_path for _, file_rel_path in indexed_files]
+        print(f"\n正在合并审查 {len(file_paths)} 个小文件 [{indexed_files[0][0]}-{indexed_files[-1][0]}/{self._total_files}]: {', '.join(file_paths)}")
+
+        file_results = {}
+        pending = []  # (indexed_file, 文件内容, 缓存键, 去重键)
+        pending_keys = set()
+        duplicates = []  # 与本批中其他文件内容相同的文件，待本批完成后直接沿用结果
+        template_fingerprint = prompt_fingerprint(BATCH_REVIEW_SYSTEM_PROMPT, BATCH_REVIEW_USER_TEMPLATE)
+        for indexed_file in indexed_files:
+            file_rel_path = indexed_file[1]
+            try:
+                file_content = self._read_file_content(file_rel_path)
+            except Exception:
+                file_content = None
+            if file_content is None or not file_content.strip():
+                # 读取失败或内容为空的文件按单文件流程生成对应的报告片段
+                file_results[file_rel_path] = self._review_single_file(indexed_file)
+                continue
+            cache_key = None
+            if self.review_cache is not None:
+                cache_key = ReviewCache.make_key(
+                    "project_batch_file_review", git_blob_sha(file_content), file_rel_path,
+                    template_fingerprint, self.model, self.max_tokens
+                )
+                cached_review = self.review_cache.get(cache_key)
+                if cached_review is not None:
+                    print(f"  {file_rel_path} 内容未变更，使用缓存的审查结果。")
+                    file_results[file_rel_path] = format_review_parts(file_rel_path, cached_review)
+                    continue
+            dedup_key = content_key(normalize_content(file_content))
+            previous = self.deduplicator.lookup(dedup_key)
+            if previous is not None:
+                print(f"  {file_rel_path} 与 {previous[1]} 内容相同，沿用其审查结果。")
+                file_results[file_rel_path] = format_review_parts(file_rel_path, previous[0], previous[1])
+                continue
+            if self.deduplicator.enabled and dedup_key in pending_keys:
+                duplicates.append(indexed_file)
+                continue
+            pending_keys.add(dedup_key)
+            pending.append((indexed_file, file_content, cache_key, dedup_key))
+
+        if len(pending) == 1:
+            indexed_file = pending[0][0]
+            file_results[indexed_file[1]] = self._review_single_file(indexed_file)
+        elif pending:
+            with get_default_metrics().span("prompt_build"):
+                messages = build_batch_review_messages([(item[0][1], item[1]) for item in pending])
+            review_text = self._call_deepseek_api(messages, progress_label=f"合并审查 {len(pending)} 个文件")
+            sections = None if is_api_error(review_text) else split_batch_review(review_text, [item[0][1] for item in pending])
+            if sections is None:
+                print(f"  合并审查的结果无法按文件拆分，改为逐个文件审查: {', '.join(item[0][1] for item in pending)}")
+                for indexed_file, _, _, _ in pending:
+                    file_results[indexed_file[1]] = self._review_single_file(indexed_file)
+            else:
+                for indexed_file, _, cache_key, dedup_key in pending:
+                    file_rel_path = indexed_file[1]
+                    review_comments = sections[file_rel_path]
+                    if not is_incomplete_review(review_comments):
+                        if cache_key is not None:
+                            self.review_cache.put(cache_key, review_comments)
+                        self.deduplicator.remember(dedup_key, file_rel_path, review_comments)
+                    file_results[file_rel_path] = format_review_parts(file_rel_path, review_comments)
+                print(f"  合并审查完成: {', '.join(file_results)}")
+        for indexed_file in duplicates:
+            # 内容相同的文件此时已有结果，按单文件流程沿用 (本批审查失败时会重新审查)
+            file_results[indexed_file[1]] = self._review_single_file(indexed_file)
+        return [file_results[file_rel_path] for file_rel_path in file_paths]
+
+    def _open_journal(self, commit_sha, resume, run_id):
+        """创建 (或恢复) 本次运行的检查点日志，未启用时返回 None"""
+        if not self.journal_dir:
+            return None
+        if run_id is None:
+            run_id = ReviewJournal.make_run_id(self.repo_path, self.target_branch, commit_sha)
+        journal = ReviewJournal(self.journal_dir, run_id)
+        completed = journal.open(
+            {"repo_path": self.repo_path, "branch": self.target_branch, "commit": commit_sha},
+            resume=resume
+        )
+        if completed:
+            print(f"从检查点恢复运行 {run_id}: {completed} 个文件已完成审查，将直接使用日志中的结果。")
+        return journal
 
-    def review_project(self):
-        """审查项目中的所有选定文件"""
+    def review_project(self, report_file_name="full_project_review_report.txt", resume=False, run_id=None):
+        """
+        审查项目中的所有选定文件，每个文件的结果审查完成后立即写入报告文件。
+        :param report_file_name: 报告文件名 (保存在当前工作目录)，也可以是绝对路径。
+        :param resume: 为 True 时从同一运行的检查点日志恢复，跳过已完成的文件。
+        :param run_id: 运行 ID；为 None 时根据仓库、分支和目标分支当前提交生成，同一提交重新运行时 ID 相同。
+        :return: (报告文件路径, 摘要)；报告保存失败时路径为 None。
+        """
         project_files = self.get_project_files()
         if not project_files:
             print("没有找到要审查的文件。")
             return "没有找到要审查的文件。"
 
-        review_report_parts = [f"项目整体代码审查报告 - 分支: {self.target_branch}\n"]
+        report_writer = ReportWriter(os.path.join(os.getcwd(), report_file_name))
+        report_writer.write(f"项目整体代码审查报告 - 分支: {self.target_branch}\n")
         total_files = len(project_files)
-        
-        for i, file_rel_path in enumerate(project_files):
-            full_file_path = os.path.join(self.repo_path, file_rel_path)
-            print(f"\n正在审查文件 [{i+1}/{total_files}]: {file_rel_path}")
-            
-            try:
-                with open(full_file_path, 'r', encoding='utf-8', errors='ignore') as f:
-                    file_content = f.read()
-            except FileNotFoundError:
-                print(f"  错误: 文件 {full_file_path} 未找到。")
-                review_report_parts.append(f"--- 文件: {file_rel_path} ---\n错误: 文件未找到。\n")
-                continue
-            except Exception as e:
-                print(f"  错误: 读取文件 {full_file_path} 失败: {e}")
-                review_report_parts.append(f"--- 文件: {file_rel_path} ---\n错误: 读取文件失败 - {e}\n")
-                continue
+        self._total_files = total_files
+        print(f"并发数: {self.max_workers}{' (自适应并发上限，实际在途请求数自动调整)' if ADAPTIVE_CONCURRENCY_ENABLED else ''}")
+
+        commit_sha = self._resolve_commit(self.target_branch) if (self.incremental or self.journal_dir) else None
+        head_commit = commit_sha if self.incremental else None
+        carried_files = set()
+        if self.incremental:
+            if head_commit:
+                carried_files = self._find_carried_files(head_commit, project_files)
+            else:
+                print(f"增量审查: 无法解析分支 '{self.target_branch}' 的提交，本次将审查全部文件且不记录状态。")
+        journal = self._open_journal(commit_sha, resume, run_id)
+        resumed_count = 0
+        # 可直接沿用结果 (不调用 API) 的文件
+        reusable = {
+            path for path in project_files
+            if path in carried_files or (journal is not None and path in journal)
+        }
 
-            review_report_parts.append(f"--- 文件: {file_rel_path} ---")
-            
-            if not file_content.strip():
-                review_report_parts.append("文件内容为空，跳过审查。\n")
-                print("  文件内容为空，跳过。")
-                continue
+        budget = None
+        if self.budget_mode:
+            project_files, file_risk, file_estimates, budget = self._plan_budget(project_files, reusable)
+
+        def reuse_previous_result(indexed_file):
+            file_rel_path = indexed_file[1]
+            # 检查点日志中已完成的文件直接使用日志中的报告片段
+            if journal is not None and file_rel_path in journal:
+                journaled = journal.read(file_rel_path)
+                if journaled is not None:
+                    return journaled
+            # 未变更的文件直接沿用上次的报告片段，不读取文件也不调用 API
+            if file_rel_path in carried_files:
+                carried = self.review_state.get_findings(self.repo_path, self.target_branch, file_rel_path)
+                if carried is not None:
+                    return carried
+            return None
 
-            review_comments = self.get_review_for_file_content(file_rel_path, file_content)
-            review_report_parts.append("AI 代码审查意见:\n" + review_comments + "\n")
-            print(f"  审查完成 (部分意见): {review_comments[:100].replace(os.linesep, ' ').strip()}...")
-        
-        final_report = "\n".join(review_report_parts)
-        report_summary = f"项目整体代码审查完成。共审查 {total_files} 个文件。"
+        def review_unit(unit):
+            # 单元是一个或多个 (序号, 相对路径)，返回其中每个文件的报告片段；因超出预算而跳过的文件返回 None
+            if len(unit) == 1:
+                previous = reuse_previous_result(unit[0])
+                if previous is not None:
+                    return [previous]
+            reservation = None
+            if budget is not None:
+                reservation = budget.try_reserve(
+                    sum(file_estimates[file_rel_path][0] for _, file_rel_path in unit),
+                    sum(file_estimates[file_rel_path][1] for _, file_rel_path in unit)
+                )
+                if reservation is None:
+                    return [None] * len(unit)
+            # 记录本单元内各次调用的实际用量，没有返回 usage 的调用由 release 按估算值计入预算
+            usage = UsageTally()
+            try:
+                with usage_scope(usage):
+                    if len(unit) == 1:
+                        return [self._review_single_file(unit[0])]
+                    return self._review_batch(unit)
+            finally:
+                if budget is not None:
+                    budget.release(reservation, usage)
+
+        def review_unit_failed(unit, error):
+            return [self._review_file_failed(indexed_file, error) for indexed_file in unit]
+
+        indexed_files = list(enumerate(project_files, start=1))
+        if self.batch_review:
+            # 相邻的小文件合并为一次请求；可直接沿用结果的文件不参与合并
+            planned = plan_review_units(
+                project_files, self._get_file_sizes(project_files),
+                BATCH_SMALL_FILE_MAX_BYTES, BATCH_MAX_TOKENS, BATCH_MAX_FILES, exclude=reusable
+            )
+            units, position = [], 0
+            for unit_paths in planned:
+                units.append(indexed_files[position:position + len(unit_paths)])
+                position += len(unit_paths)
+            batched_units = sum(1 for unit in units if len(unit) > 1)
+            if batched_units:
+                print(f"合并审查: {sum(len(unit) for unit in units if len(unit) > 1)} 个小文件合并为 {batched_units} 次请求。")
+        else:
+            units = [[indexed_file] for indexed_file in indexed_files]
+
+        # 进度按文件统计，在结果按顺序写入报告时更新
+        progress = ReviewProgress(total=total_files)
+        results = imap_ordered(
+            review_unit,
+            units,
+            max_workers=self.max_workers,
+            on_error=review_unit_failed
+        )
+        # 结果按文件列表顺序产出，报告顺序与顺序审查时一致；
+        # 增量审查时新审查成功的结果分批保存，内存中不保留整份报告
+        pending_findings = {}
+        failed_files = []
+        skipped_files = []
+        try:
+            for unit, unit_report_parts in zip(units, results):
+                for (_, file_rel_path), file_report_parts in zip(unit, unit_report_parts):
+                    progress.advance(file_rel_path)
+                    if file_report_parts is None:
+                        # 因超出预算而跳过，统一列在报告末尾；不写入日志和增量状态，下次运行时会重新审查
+                        skipped_files.append(file_rel_path)
+                        continue
+                    report_writer.write_parts(file_report_parts)
+                    if file_rel_path in carried_files:
+                        continue
+                    if report_parts_failed(file_report_parts):
+                        # 失败的结果不写入日志和增量状态，恢复或下次运行时会重新审查
+                        failed_files.append(file_rel_path)
+                        continue
+                    if journal is not None:
+                        if file_rel_path in journal:
+                            resumed_count += 1
+                        else:
+                            journal.record(file_rel_path, file_report_parts)
+                    if head_commit:
+                        pending_findings[file_rel_path] = file_report_parts
+                        if len(pending_findings) >= INCREMENTAL_SAVE_BATCH_SIZE:
+                            self.review_state.save_findings(self.repo_path, self.target_branch, pending_findings)
+                            pending_findings = {}
+        except BaseException:
+            # 审查中止时保留已写入的部分报告 (.partial) 和检查点日志
+            report_writer.close()
+            if journal is not None:
+                journal.close()
+                print(f"审查中止，可使用 --resume 从检查点继续 (运行 ID: {journal.run_id})。")
+            raise
+        finally:
+            if self.blob_reader is not None:
+                self.blob_reader.close()
+        if head_commit:
+            self.review_state.save_findings(self.repo_path, self.target_branch, pending_findings)
+            self._finish_incremental_state(head_commit, project_files, failed_files, skipped_files)
+        if skipped_files:
+            report_writer.write(self._format_budget_skipped(skipped_files, file_risk, file_estimates))
+
+        report_summary = f"项目整体代码审查完成。共审查 {total_files - len(skipped_files)} 个文件，{progress.summary()}。"
+        if carried_files:
+            report_summary += f" 其中 {len(carried_files)} 个未变更文件沿用了上次的审查结果。"
+        if resumed_count:
+            report_summary += f" 其中 {resumed_count} 个文件的结果从检查点恢复。"
+        if budget is not None:
+            report_summary += f" {budget.format_status()}"
+            report_summary += f"，{len(skipped_files)} 个文件因超出预算被跳过 (见报告末尾列表)。" if skipped_files else "。"
+        if self.deduplicator.saved_count:
+            report_summary += f" {self.deduplicator.format_stats()}。"
+        if self.review_cache is not None:
+            report_summary += f" {self.review_cache.format_stats()}。"
+            self.review_cache.close()
         print(f"\n{report_summary}")
-        return final_report, report_summary
+        print(self.transport.format_stats())
+        router_stats = self.router.format_stats()
+        if router_stats:
+            print(router_stats)
+        if self.router.hedging.enabled:
+            print(self.router.hedging.format_stats())
+        report_writer.write(f"\n{report_summary}")
+        report_path = report_writer.finish()
+        if journal is not None:
+            # 报告完整保存后不再需要恢复，删除日志；保存失败时保留日志以便重建报告
+            journal.close(remove=report_path is not None)
+        return report_path, report_summary
 
     def save_report(self, report_content, report_file_name="full_project_review_report.txt"):
         """将报告保存到文件"""
@@ -259,57 +846,20 @@ class ProjectReviewer:
             return None
 
     def send_email_notification(self, subject, body):
-        """发送邮件通知"""
+        """提交邮件通知，由后台通知分发器发送 (复用 SMTP 连接，不阻塞审查流程)"""
         if not self.smtp_config or not all([self.smtp_config.get(k) for k in ['host', 'user', 'password', 'sender', 'receiver']]):
             print("SMTP 配置不完整，跳过发送邮件。")
             return
-
-        cfg = self.smtp_config
-        msg = MIMEMultipart()
-        msg['From'] = cfg['sender']
-        msg['To'] = cfg['receiver']
-        msg['Subject'] = subject
-        msg.attach(MIMEText(body, 'plain', 'utf-8'))
-
-        try:
-            server = smtplib.SMTP(cfg['host'], cfg.get('port', 587))
-            if cfg.get('port', 587) == 587: # 通常 587 端口使用 STARTTLS
-                 server.starttls()
-            server.login(cfg['user'], cfg['password'])
-            text = msg.as_string()
-            server.sendmail(cfg['sender'], cfg['receiver'], text)
-            server.quit()
-            print(f"邮件已成功发送至 {cfg['receiver']}")
-        except Exception as e:
-            print(f"发送邮件失败: {e}")
+        get_default_dispatcher().send_email(self.smtp_config, subject, body)
 
     def send_wechat_notification(self, message):
-        """发送企业微信通知"""
+        """提交企业微信通知，由后台通知分发器发送；超出长度上限的消息会拆分为多条"""
         if not self.wechat_webhook_url or self.wechat_webhook_url == "YOUR_WECHAT_WEBHOOK_URL": # 如果 config.py 中的值可能是占位符，此检查仍有用
             # 或者，如果确信 config.py 中的值总是有效的，可以简化为:
             # if not self.wechat_webhook_url:
             print("企业微信 Webhook URL 未配置或仍为占位符，跳过发送通知。")
             return
-
-        headers = {'Content-Type': 'application/json'}
-        payload = {
-            "msgtype": "markdown",
-            "markdown": {
-                "content": message
-            }
-        }
-        try:
-            response = requests.post(self.wechat_webhook_url, headers=headers, json=payload, timeout=10)
-            response.raise_for_status()
-            result = response.json()
-            if result.get("errcode") == 0:
-                print("企业微信通知发送成功")
-            else:
-                print(f"企业微信通知发送失败: {result.get('errmsg')}")
-        except requests.exceptions.RequestException as e:
-            print(f"发送企业微信通知时发生网络错误: {e}")
-        except Exception as e:
-            print(f"发送企业微信通知时发生未知错误: {e}")
+        get_default_dispatcher().send_wechat(self.wechat_webhook_url, message)
 
 # --- 新增 FolderReviewer 类 ---
 class FolderReviewer:
@@ -320,8 +870,17 @@ class FolderReviewer:
                  ignored_folders_config=None,
                  allowed_extensions_config=None,
                  ignored_files_config=None,
+                 ignore_patterns_config=None,
                  smtp_config=None,
-                 wechat_webhook_url=None):
+                 wechat_webhook_url=None,
+                 max_workers=DEFAULT_REVIEW_MAX_WORKERS,
+                 transport=None,
+                 chunked_review=DEFAULT_CHUNKED_REVIEW,
+                 chunk_max_tokens=DEFAULT_CHUNK_MAX_TOKENS,
+                 stream_responses=DEFAULT_STREAM_RESPONSES,
+                 stream_max_seconds=DEFAULT_STREAM_MAX_SECONDS,
+                 stream_max_output_tokens=DEFAULT_STREAM_MAX_OUTPUT_TOKENS,
+                 dedup_review=DEFAULT_DEDUP_REVIEW):
         
         if not isinstance(folder_paths_to_review, list):
             raise ValueError("folder_paths_to_review 必须是一个列表")
@@ -331,17 +890,30 @@ class FolderReviewer:
         self.deepseek_api_url = deepseek_api_url
         self.smtp_config = smtp_config if smtp_config else {}
         self.wechat_webhook_url = wechat_webhook_url
+        self.max_workers = worker_count(max_workers)
+        # 同时在途的 API 调用数上限，文件级与分块级的并发共用 (见 ProjectReviewer)
+        self._api_slots = threading.BoundedSemaphore(self.max_workers)
+        self.transport = transport if transport is not None else get_default_transport()
+        self.router = create_router(self.deepseek_api_key, self.deepseek_api_url, DEFAULT_DEEPSEEK_MODEL, self.transport)
+        self.chunked_review = chunked_review
+        self.chunk_max_tokens = chunk_max_tokens
+        self.stream_responses = stream_responses
+        self.stream_max_seconds = stream_max_seconds
+        self.stream_max_output_tokens = stream_max_output_tokens
+        self.deduplicator = ReviewDeduplicator(dedup_review)
 
         # 初始化 FileFilter
         # 如果未提供配置，则使用 config.py 中的默认值
         _ignored_folders = ignored_folders_config if ignored_folders_config is not None else DEFAULT_IGNORED_FOLDERS
         _allowed_extensions = allowed_extensions_config if allowed_extensions_config is not None else DEFAULT_ALLOWED_FILE_EXTENSIONS
         _ignored_files = ignored_files_config if ignored_files_config is not None else DEFAULT_IGNORED_FILES
+        _ignore_patterns = ignore_patterns_config if ignore_patterns_config is not None else DEFAULT_IGNORE_PATTERNS
         
         self.file_filter = FileFilter(
             ignored_folders=_ignored_folders,
             allowed_extensions=_allowed_extensions,
-            ignored_files=_ignored_files
+            ignored_files=_ignored_files,
+            ignore_patterns=_ignore_patterns
         )
 
         if not self.deepseek_api_key or self.deepseek_api_key == "YOUR_DEEPSEEK_API_KEY":
@@ -349,32 +921,32 @@ class FolderReviewer:
 
         print(f"文件夹审查器已初始化，目标文件夹: {self.folder_paths_to_review}")
 
-    def _call_deepseek_api(self, messages):
+    def _call_deepseek_api(self, messages, progress_label=None):
         """调用 DeepSeek API (与 ProjectReviewer 中的类似)"""
         if not self.deepseek_api_key or self.deepseek_api_key == "YOUR_DEEPSEEK_API_KEY":
             print("警告 (FolderReviewer): DeepSeek API Key 未配置或使用的是默认占位符。")
             # return "错误: DeepSeek API Key 未配置。"
 
-        headers = {
-            "Content-Type": "application/json",
-            "Authorization": f"Bearer {self.deepseek_api_key}"
-        }
         payload = {
-            "model": "deepseek-coder",
+            "model": DEFAULT_DEEPSEEK_MODEL, # 实际模型由路由到的后端决定
             "messages": messages,
             "max_tokens": 8192, # 与 ProjectReviewer 保持一致或按需调整
             "temperature": 0.3,
         }
         try:
-            response = requests.post(self.deepseek_api_url, headers=headers, json=payload, timeout=180)
-            response.raise_for_status()
-            return response.json()["choices"][0]["message"]["content"]
-        except requests.exceptions.RequestException as e:
+            with self._api_slots:
+                return self.router.complete(
+                    payload, timeout=180,
+                    stream=self.stream_responses, stream_max_seconds=self.stream_max_seconds,
+                    stream_max_output_tokens=self.stream_max_output_tokens,
+                    progress_label=progress_label or "DeepSeek API"
+                )
+        except ApiRequestError as e:
             print(f"DeepSeek API 请求失败 (FolderReviewer): {e}")
-            if hasattr(e, 'response') and e.response is not None:
-                print(f"API 响应内容: {e.response.text}")
+            if e.response_text:
+                print(f"API 响应内容: {e.response_text}")
             return f"DeepSeek API 请求失败: {e}"
-        except (KeyError, IndexError) as e:
+        except (KeyError, IndexError, TypeError) as e:
             print(f"解析 DeepSeek API 响应失败 (FolderReviewer): {e}")
             return f"解析 DeepSeek API 响应失败: {e}"
 
@@ -383,97 +955,146 @@ class FolderReviewer:
         if not file_content.strip():
             return "文件内容为空，跳过审查。"
 
-        max_content_length = 15000 
-        if len(file_content) > max_content_length:
-            print(f"警告 (FolderReviewer): 文件 {file_display_path} 内容过长 ({len(file_content)} chars)，将截断至 {max_content_length} chars 进行审查。")
-            file_content = file_content[:max_content_length]
-
-        prompt = f"""
-        请对以下位于路径 '{file_display_path}' 中的代码文件进行全面的代码审查。
-        文件内容如下:
-        ```
-        {file_content}
-        ```
-        请重点关注以下方面，并给出具体的、可操作的审查意见：
-        1.  **潜在的 Bug 和逻辑错误**
-        2.  **安全漏洞**
-        3.  **代码可读性和可维护性**
-        4.  **性能问题**
-        5.  **编程最佳实践和代码风格**
-        6.  **具体改进建议**
-        7.  **总结**
-
-        请以 Markdown 格式返回您的审查意见。
+        if len(file_content) > MAX_CONTENT_LENGTH:
+            if self.chunked_review:
+                review_comments, _ = review_in_chunks(
+                    file_display_path, file_content,
+                    lambda messages: self._call_deepseek_api(messages, progress_label=file_display_path),
+                    self.chunk_max_tokens, max_workers=self.max_workers, is_error=is_incomplete_review
+                )
+                return review_comments
+            print(f"警告 (FolderReviewer): 文件 {file_display_path} 内容过长 ({len(file_content)} chars)，将截断至 {MAX_CONTENT_LENGTH} chars 进行审查。")
+            file_content = file_content[:MAX_CONTENT_LENGTH]
+
+        with get_default_metrics().span("prompt_build"):
+            messages = build_messages(FILE_REVIEW_SYSTEM_PROMPT, FILE_REVIEW_USER_TEMPLATE,
+                                      file_path=file_display_path, file_content=file_content)
+        return self._call_deepseek_api(messages, progress_label=file_display_path)
+
+    def _review_single_file(self, file_entry):
+        """
+        审查单个文件并返回该文件在报告中的各个片段 (可能在工作线程中并发执行)。
+        :param file_entry: (序号, 完整路径, 显示路径) 元组。
         """
-        messages = [{"role": "user", "content": prompt}]
-        return self._call_deepseek_api(messages)
+        index, full_file_path, display_path = file_entry
+        print(f"\n正在审查文件 [{index}]: {full_file_path}")
+
+        try:
+            with get_default_metrics().span("file_read"):
+                with open(full_file_path, 'r', encoding='utf-8', errors='ignore') as f:
+                    file_content = f.read()
+        except FileNotFoundError: # 理论上 os.walk 不会返回不存在的文件，但以防万一
+            print(f"  错误: 文件 {full_file_path} 未找到。")
+            return [f"--- 文件: {display_path} ---\n错误: 文件未找到。\n"]
+        except Exception as e:
+            print(f"  错误: 读取文件 {full_file_path} 失败: {e}")
+            return [f"--- 文件: {display_path} ---\n错误: 读取文件失败 - {e}\n"]
+
+        if not file_content.strip():
+            print(f"  文件 {display_path} 内容为空，跳过。")
+            return [f"--- 文件: {display_path} ---", "文件内容为空，跳过审查。\n"]
+
+        review_comments, duplicate_of = self.deduplicator.review_once(
+            content_key(normalize_content(file_content)), display_path,
+            lambda: self.get_review_for_file_content(display_path, file_content), is_error=is_incomplete_review
+        )
+        if duplicate_of:
+            print(f"  {display_path} 与 {duplicate_of} 内容相同，沿用其审查结果。")
+        else:
+            print(f"  {display_path} 审查完成 (部分意见): {review_comments[:100].replace(os.linesep, ' ').strip()}...")
+        return format_review_parts(display_path, review_comments, duplicate_of)
 
-    def review_folders(self):
-        """审查配置的文件夹列表中的所有符合条件的文件"""
-        review_report_parts = ["文件夹批量代码审查报告\n"]
+    def _review_file_failed(self, file_entry, error):
+        """单个文件审查过程中出现未预期异常时生成的报告片段，不影响其他文件"""
+        _, full_file_path, display_path = file_entry
+        print(f"  错误 (FolderReviewer): 审查文件 {full_file_path} 时发生异常: {error}")
+        return [f"--- 文件: {display_path} ---\n错误: 审查过程中发生异常 - {error}\n"]
+
+    def review_folders(self, report_file_name="folder_review_report.txt"):
+        """
+        审查配置的文件夹列表中的所有符合条件的文件，每个文件的结果审查完成后立即写入报告文件。
+        :param report_file_name: 报告文件名 (保存在当前工作目录)，也可以是绝对路径。
+        :return: (报告文件路径, 摘要)；报告保存失败时路径为 None。
+        """
+        report_writer = ReportWriter(os.path.join(os.getcwd(), report_file_name))
+        report_writer.write("文件夹批量代码审查报告\n")
         total_files_scanned = 0
         total_files_processed = 0
+        scan_failures = 0
+        print(f"并发数 (FolderReviewer): {self.max_workers}{' (自适应并发上限，实际在途请求数自动调整)' if ADAPTIVE_CONCURRENCY_ENABLED else ''}")
+
+        valid_folders = [path for path in self.folder_paths_to_review if os.path.isdir(path)]
+        # 所有根目录在后台并行扫描，被忽略的目录不会被遍历；审查按配置顺序逐个文件夹进行，
+        # 当前文件夹边扫描边审查，后面的文件夹同时在后台扫描
+        scanner = ParallelFolderScanner(valid_folders, self.file_filter, max_workers=self.max_workers)
+        scanner.start()
+        valid_index = 0
 
         for base_folder_path in self.folder_paths_to_review:
             if not os.path.isdir(base_folder_path):
                 print(f"警告: 路径 {base_folder_path} 不是一个有效的文件夹，跳过。")
-                review_report_parts.append(f"\n--- 目标文件夹 (无效或无法访问): {base_folder_path} ---\n")
+                report_writer.write(f"\n--- 目标文件夹 (无效或无法访问): {base_folder_path} ---\n")
                 continue
+            root_index, valid_index = valid_index, valid_index + 1
             
-            review_report_parts.append(f"\n--- 开始审查文件夹: {base_folder_path} ---\n")
-            files_in_current_folder_processed = 0
-
-            for root, _, files in os.walk(base_folder_path):
-                for file_name in files:
-                    full_file_path = os.path.join(root, file_name)
-                    # 文件路径相对于当前审查的 base_folder_path，用于过滤和报告
-                    relative_file_path_to_base = os.path.relpath(full_file_path, base_folder_path)
-                    
-                    total_files_scanned += 1
-
-                    if not self.file_filter.is_allowed(relative_file_path_to_base):
-                        # print(f"  文件 {relative_file_path_to_base} (在 {base_folder_path} 中) 被过滤规则忽略。")
-                        continue
-                    
-                    total_files_processed += 1
-                    files_in_current_folder_processed +=1
-                    
-                    # 用于报告和API提示的路径可以是相对于base_folder的，也可以是完整的
-                    # 这里我们使用相对于 base_folder_path 的路径，因为它更简洁
-                    display_path = os.path.join(os.path.basename(base_folder_path), relative_file_path_to_base)
-
-
-                    print(f"\n正在审查文件 [{total_files_processed}]: {full_file_path}")
-                    
-                    try:
-                        with open(full_file_path, 'r', encoding='utf-8', errors='ignore') as f:
-                            file_content = f.read()
-                    except FileNotFoundError: # 理论上 os.walk 不会返回不存在的文件，但以防万一
-                        print(f"  错误: 文件 {full_file_path} 未找到。")
-                        review_report_parts.append(f"--- 文件: {display_path} ---\n错误: 文件未找到。\n")
-                        continue
-                    except Exception as e:
-                        print(f"  错误: 读取文件 {full_file_path} 失败: {e}")
-                        review_report_parts.append(f"--- 文件: {display_path} ---\n错误: 读取文件失败 - {e}\n")
-                        continue
-
-                    review_report_parts.append(f"--- 文件: {display_path} ---")
-                    
-                    if not file_content.strip():
-                        review_report_parts.append("文件内容为空，跳过审查。\n")
-                        print("  文件内容为空，跳过。")
-                        continue
+            report_writer.write(f"\n--- 开始审查文件夹: {base_folder_path} ---\n")
+            folder_name = os.path.basename(base_folder_path)
 
-                    review_comments = self.get_review_for_file_content(display_path, file_content)
-                    review_report_parts.append("AI 代码审查意见:\n" + review_comments + "\n")
-                    print(f"  审查完成 (部分意见): {review_comments[:100].replace(os.linesep, ' ').strip()}...")
+            def folder_file_entries(root_index=root_index, folder_name=folder_name):
+                nonlocal total_files_processed
+                for full_file_path, relative_file_path_to_base in scanner.iter_files(root_index):
+                    total_files_processed += 1
+                    # 用于报告和API提示的路径使用相对于 base_folder_path 的路径，因为它更简洁
+                    display_path = os.path.join(folder_name, relative_file_path_to_base)
+                    yield total_files_processed, full_file_path, display_path
+
+            folder_processed_before = total_files_processed
+            # 文件总数要等扫描结束才知道，进度中不显示 ETA
+            progress = ReviewProgress(total=None, label=f"审查进度 ({folder_name})")
+            results = imap_ordered(
+                self._review_single_file,
+                folder_file_entries(),
+                max_workers=self.max_workers,
+                on_error=self._review_file_failed,
+                progress=progress,
+                describe=lambda file_entry: file_entry[2]
+            )
+            try:
+                for file_report_parts in results:
+                    report_writer.write_parts(file_report_parts)
+            except BaseException:
+                # 审查中止时保留已写入的部分报告 (.partial)
+                report_writer.close()
+                scanner.close()
+                raise
             
-            review_report_parts.append(f"--- 文件夹 {base_folder_path} 审查完毕，共处理 {files_in_current_folder_processed} 个文件 ---\n")
+            stats = scanner.stats[root_index]
+            total_files_scanned += stats.files_seen
+            if stats.dirs_pruned:
+                print(f"文件夹 {base_folder_path}: 按过滤规则跳过了 {stats.dirs_pruned} 个目录。")
+            if stats.failure is not None:
+                scan_failures += 1
+                report_writer.write(f"错误: 扫描文件夹 {base_folder_path} 时发生异常，以上结果不完整 - {stats.failure}\n")
+            if stats.errors:
+                report_writer.write(f"警告: 文件夹 {base_folder_path} 中有 {stats.errors} 个目录无法读取，已跳过。\n")
+            report_writer.write(f"--- 文件夹 {base_folder_path} 审查完毕，共处理 {total_files_processed - folder_processed_before} 个文件 ---\n")
+
+        scanner.close()
 
-        final_report = "\n".join(review_report_parts)
         report_summary = f"文件夹批量代码审查完成。共扫描约 {total_files_scanned} 个文件，实际处理并审查 {total_files_processed} 个文件。"
+        if scan_failures:
+            report_summary += f" 警告: {scan_failures} 个文件夹扫描失败，结果不完整。"
+        if self.deduplicator.saved_count:
+            report_summary += f" {self.deduplicator.format_stats()}。"
         print(f"\n{report_summary}")
-        return final_report, report_summary
+        print(self.transport.format_stats())
+        router_stats = self.router.format_stats()
+        if router_stats:
+            print(router_stats)
+        if self.router.hedging.enabled:
+            print(self.router.hedging.format_stats())
+        report_writer.write(f"\n{report_summary}")
+        return report_writer.finish(), report_summary
 
     def save_report(self, report_content, report_file_name="folder_review_report.txt"):
         """将报告保存到文件 (与 ProjectReviewer 中的类似)"""
@@ -488,59 +1109,35 @@ class FolderReviewer:
             return None
 
     def send_email_notification(self, subject, body):
-        """发送邮件通知 (与 ProjectReviewer 中的类似)"""
+        """提交邮件通知 (与 ProjectReviewer 中的类似)"""
         if not self.smtp_config or not all([self.smtp_config.get(k) for k in ['host', 'user', 'password', 'sender', 'receiver']]):
             print("SMTP 配置不完整 (FolderReviewer)，跳过发送邮件。")
             return
-        # (邮件发送逻辑与 ProjectReviewer 相同，此处省略以保持简洁，实际应复制或重构)
-        cfg = self.smtp_config
-        msg = MIMEMultipart()
-        msg['From'] = cfg['sender']
-        msg['To'] = cfg['receiver']
-        msg['Subject'] = subject
-        msg.attach(MIMEText(body, 'plain', 'utf-8'))
-
-        try:
-            server = smtplib.SMTP(cfg['host'], cfg.get('port', 587))
-            if cfg.get('port', 587) == 587:
-                 server.starttls()
-            server.login(cfg['user'], cfg['password'])
-            text = msg.as_string()
-            server.sendmail(cfg['sender'], cfg['receiver'], text)
-            server.quit()
-            print(f"邮件已成功发送至 {cfg['receiver']} (FolderReviewer)")
-        except Exception as e:
-            print(f"发送邮件失败 (FolderReviewer): {e}")
-
+        get_default_dispatcher().send_email(self.smtp_config, subject, body)
 
     def send_wechat_notification(self, message):
-        """发送企业微信通知 (与 ProjectReviewer 中的类似)"""
+        """提交企业微信通知 (与 ProjectReviewer 中的类似)"""
         if not self.wechat_webhook_url or self.wechat_webhook_url == "YOUR_WECHAT_WEBHOOK_URL":
             print("企业微信 Webhook URL 未配置或仍为占位符 (FolderReviewer)，跳过发送通知。")
             return
-        # (企业微信通知逻辑与 ProjectReviewer 相同，此处省略以保持简洁，实际应复制或重构)
-        headers = {'Content-Type': 'application/json'}
-        payload = {
-            "msgtype": "markdown",
-            "markdown": {
-                "content": message
-            }
-        }
-        try:
-            response = requests.post(self.wechat_webhook_url, headers=headers, json=payload, timeout=10)
-            response.raise_for_status()
-            result = response.json()
-            if result.get("errcode") == 0:
-                print("企业微信通知发送成功 (FolderReviewer)")
-            else:
-                print(f"企业微信通知发送失败 (FolderReviewer): {result.get('errmsg')}")
-        except requests.exceptions.RequestException as e:
-            print(f"发送企业微信通知时发生网络错误 (FolderReviewer): {e}")
-        except Exception as e:
-            print(f"发送企业微信通知时发生未知错误 (FolderReviewer): {e}")
+        get_default_dispatcher().send_wechat(self.wechat_webhook_url, message)
 
 
 if __name__ == "__main__":
+    # --- 命令行参数 ---
+    arg_parser = argparse.ArgumentParser(description="全项目代码审查")
+    arg_parser.add_argument("--resume", action="store_true",
+                            help="从上次中断的检查点日志继续，跳过已完成的文件并重建完整报告")
+    arg_parser.add_argument("--run-id", default=None,
+                            help="要恢复的运行 ID (默认根据仓库、分支和目标分支当前提交生成)")
+    arg_parser.add_argument("--budget-tokens", type=int, default=None,
+                            help="启用预算审查并设置 token 上限 (默认使用 config.py 中的 BUDGET_* 配置)")
+    arg_parser.add_argument("--budget-cost", type=float, default=None,
+                            help="启用预算审查并设置费用上限 (元)")
+    cli_args = arg_parser.parse_args()
+    # 记录本次运行各阶段的耗时和 token 用量，结束时导出 JSON 与 Prometheus 文件
+    run_metrics = MetricsRun("project_review").start()
+
     # --- 用户配置 ---
     # ProjectReviewer 配置
     REPO_TO_REVIEW = "/Users/yl/emaosoho"
@@ -589,24 +1186,28 @@ if __name__ == "__main__":
         deepseek_api_key=current_api_key, # 传递最终决定的 API key
         # deepseek_api_url 将使用 DEFAULT_DEEPSEEK_API_URL (来自 config.py) 如果未显式传递
         smtp_config=smtp_cfg,
-        wechat_webhook_url=current_wechat_url # 修正参数名：wechat_url -> wechat_webhook_url
+        wechat_webhook_url=current_wechat_url, # 修正参数名：wechat_url -> wechat_webhook_url
+        budget_mode=DEFAULT_BUDGET_MODE or cli_args.budget_tokens is not None or cli_args.budget_cost is not None,
+        budget_max_tokens=cli_args.budget_tokens if cli_args.budget_tokens is not None else BUDGET_MAX_TOKENS,
+        budget_max_cost=cli_args.budget_cost if cli_args.budget_cost is not None else BUDGET_MAX_COST
         # 如果有其他参数如 file_extensions，请确保它们也在这里传递
         # file_extensions=DEFAULT_FILE_EXTENSIONS # 例如
     )
 
     try:
-        report_content, summary = reviewer.review_project()
+        # 生成报告文件名，包含分支信息，避免覆盖；报告在审查过程中实时写入
+        safe_branch_name = BRANCH_TO_REVIEW.replace('/', '_').replace('\\', '_')
+        report_file_name = f"full_project_review_report_{safe_branch_name}.txt"
+        review_result = reviewer.review_project(report_file_name, resume=cli_args.resume, run_id=cli_args.run_id)
 
-        if report_content and summary: # 确保 review_project 返回了有效内容
-            # 生成报告文件名，包含分支信息，避免覆盖
-            safe_branch_name = BRANCH_TO_REVIEW.replace('/', '_').replace('\\', '_')
-            report_file_name = f"full_project_review_report_{safe_branch_name}.txt"
-            saved_path = reviewer.save_report(report_content, report_file_name)
+        if isinstance(review_result, tuple): # review_project 返回 (报告路径, 摘要)
+            saved_path, summary = review_result
 
             if saved_path:
                 email_subject = f"项目整体代码审查报告 - {reviewer.repo_path} - 分支: {BRANCH_TO_REVIEW}"
-                # 邮件内容可以包含摘要和报告路径
-                email_body = f"{summary}\n\n详细报告已生成并保存至: {os.path.abspath(saved_path)}\n\n---报告预览 (部分)---\n{report_content[:2000]}..."
+                # 邮件内容包含摘要、报告路径和报告开头部分的预览 (只读取预览部分，不载入整份报告)
+                report_preview, _ = read_report_preview(saved_path, 2000)
+                email_body = f"{summary}\n\n详细报告已生成并保存至: {os.path.abspath(saved_path)}\n\n---报告预览 (部分)---\n{report_preview}..."
                 reviewer.send_email_notification(email_subject, email_body)
 
                 wechat_message = (f"#### 项目整体代码审查报告\n"
@@ -616,14 +1217,14 @@ if __name__ == "__main__":
                                   f"报告已保存: `{os.path.abspath(saved_path)}`")
                 reviewer.send_wechat_notification(wechat_message)
             else:
-                print("报告内容已生成但保存失败。")
-        elif isinstance(report_content, str) and "没有找到要审查的文件" in report_content : # 特殊处理 review_project 返回的提示信息
-             print(report_content)
+                print("审查已完成但报告保存失败，已完成部分保留在 .partial 文件中。")
+        elif isinstance(review_result, str) and "没有找到要审查的文件" in review_result : # 特殊处理 review_project 返回的提示信息
+             print(review_result)
              # 可以选择为此情况发送通知
              wechat_message = (f"#### 项目整体代码审查提醒\n"
                                f"**仓库**: `{REPO_TO_REVIEW}`\n"
                                f"**分支**: `{BRANCH_TO_REVIEW}`\n"
-                               f"**状态**: {report_content}")
+                               f"**状态**: {review_result}")
              if reviewer.wechat_webhook_url and reviewer.wechat_webhook_url != DEFAULT_WECHAT_WEBHOOK_URL:
                  reviewer.send_wechat_notification(wechat_message)
         else:
@@ -641,10 +1242,14 @@ if __name__ == "__main__":
         if reviewer.wechat_webhook_url and reviewer.wechat_webhook_url != DEFAULT_WECHAT_WEBHOOK_URL:
             reviewer.send_wechat_notification(error_message)
 
+    # 等待后台通知发送完毕 (有超时上限)
+    get_default_dispatcher().close()
+    run_metrics.finish()
     print("\n项目整体代码审查流程结束。")
 
 # 假设您有一个类似这样的函数来运行文件夹审查
 # 或者这部分逻辑在 if __name__ == "__main__": 块中
+@MetricsRun("folder_review")
 def run_specific_folder_review(): # 函数名可能不同
     print("开始特定文件夹审查...")
 
@@ -662,28 +1267,28 @@ def run_specific_folder_review(): # 函数名可能不同
         ignored_folders_config=DEFAULT_IGNORED_FOLDERS,
         allowed_extensions_config=DEFAULT_ALLOWED_FILE_EXTENSIONS,
         ignored_files_config=DEFAULT_IGNORED_FILES,
+        ignore_patterns_config=DEFAULT_IGNORE_PATTERNS,
         smtp_config=DEFAULT_SMTP_CONFIG,
         wechat_webhook_url=DEFAULT_WECHAT_WEBHOOK_URL
     )
 
-    report_content, report_summary = reviewer.review_folders()
+    saved_report_path, report_summary = reviewer.review_folders("specific_folder_review_report.txt")
+    email_subject = "特定文件夹代码审查报告"
 
-    if report_content:
-        saved_report_path = reviewer.save_report(report_content, "specific_folder_review_report.txt")
-        email_subject = "特定文件夹代码审查报告"
-        
-        # 发送邮件和微信通知
-        if saved_report_path:
-            email_body = f"{report_summary}\n\n详细报告已保存至: {saved_report_path}\n\n部分内容预览:\n{report_content[:2000]}"
-            reviewer.send_email_notification(email_subject, email_body)
-            
-            wechat_message = f"#### 特定文件夹代码审查报告\n**状态**: {report_summary}\n报告已生成，请查收邮件或查看文件: `{os.path.basename(saved_report_path)}`"
-            reviewer.send_wechat_notification(wechat_message)
-        else:
-            reviewer.send_email_notification(email_subject, report_summary + "\n\n报告保存失败。\n" + report_content)
-            wechat_message = f"#### 特定文件夹代码审查报告\n**状态**: {report_summary}\n报告保存失败。"
-            reviewer.send_wechat_notification(wechat_message)
+    # 发送邮件和微信通知
+    if saved_report_path:
+        report_preview, _ = read_report_preview(saved_report_path, 2000)
+        email_body = f"{report_summary}\n\n详细报告已保存至: {saved_report_path}\n\n部分内容预览:\n{report_preview}"
+        reviewer.send_email_notification(email_subject, email_body)
+
+        wechat_message = f"#### 特定文件夹代码审查报告\n**状态**: {report_summary}\n报告已生成，请查收邮件或查看文件: `{os.path.basename(saved_report_path)}`"
+        reviewer.send_wechat_notification(wechat_message)
+    else:
+        reviewer.send_email_notification(email_subject, report_summary + "\n\n报告保存失败，已完成部分保留在 .partial 文件中。")
+        wechat_message = f"#### 特定文件夹代码审查报告\n**状态**: {report_summary}\n报告保存失败。"
+        reviewer.send_wechat_notification(wechat_message)
 
+    get_default_dispatcher().close()
     print("\n特定文件夹审查流程结束。")
 
 if __name__ == "__main__":
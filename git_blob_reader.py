@@ -0,0 +1,86 @@
+import subprocess
+import threading
+
+
+class GitBlobReader:
+    """
+    通过一个常驻的 `git cat-file --batch` 进程读取指定版本中的文件内容。
+
+    直接从 git 对象库读取，不依赖工作区的检出状态，也不会为每个文件启动新进程。
+    读取操作通过锁串行化，可以在多个审查线程中共享同一个实例。
+    """
+
+    def __init__(self, repo_path):
+        self.repo_path = repo_path
+        self._process = None
+        self._lock = threading.Lock()
+
+    def _ensure_process(self):
+        if self._process is None or self._process.poll() is not None:
+            self._process = subprocess.Popen(
+                ["git", "cat-file", "--batch"],
+                stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                cwd=self.repo_path
+            )
+        return self._process
+
+    def read_blob(self, rev, path):
+        """
+        读取 rev 版本中 path 文件的内容。
+        :return: (blob SHA, bytes)；文件在该版本中不存在或不是普通文件时返回 None。
+        """
+        spec = f"{rev}:{path}"
+        if "\n" in spec:
+            return None
+        with self._lock:
+            process = self._ensure_process()
+            try:
+                process.stdin.write(spec.encode('utf-8') + b"\n")
+                process.stdin.flush()
+                header = process.stdout.readline().decode('utf-8', errors='replace').rstrip("\n")
+                parts = header.split(" ")
+                if len(parts) != 3 or parts[1] in ("missing", "ambiguous"):
+                    return None
+                sha, object_type, size = parts[0], parts[1], int(parts[2])
+                data = process.stdout.read(size)
+                process.stdout.read(1)  # 每个对象内容之后的换行符
+            except (OSError, ValueError) as e:
+                print(f"从 git 对象库读取 {spec} 失败: {e}")
+                self._terminate()
+                return None
+        if object_type != "blob":
+            return None
+        return sha, data
+
+    def read_text(self, rev, path):
+        """读取 rev 版本中 path 文件的文本内容，不存在时返回 None"""
+        blob = self.read_blob(rev, path)
+        if blob is None:
+            return None
+        return blob[1].decode('utf-8', errors='ignore')
+
+    def _terminate(self):
+        if self._process is not None:
+            try:
+                self._process.kill()
+                self._process.wait()
+            except OSError:
+                pass
+            self._process = None
+
+    def close(self):
+        """关闭常驻的 git 进程"""
+        with self._lock:
+            if self._process is not None:
+                try:
+                    self._process.stdin.close()
+                    self._process.wait(timeout=5)
+                except (OSError, subprocess.TimeoutExpired):
+                    self._terminate()
+                self._process = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -0,0 +1,458 @@
+import atexit
+import json
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+try:
+    import requests
+    from requests.adapters import HTTPAdapter
+except ImportError:
+    raise ImportError("请先使用pip安装requests模块: pip install requests")
+
+from config import (
+    HTTP_POOL_SIZE,
+    API_MAX_RETRIES,
+    API_BACKOFF_BASE_SECONDS,
+    API_BACKOFF_MAX_SECONDS,
+    STREAM_IDLE_TIMEOUT_SECONDS,
+    STREAM_PROGRESS_INTERVAL_SECONDS,
+    ADAPTIVE_CONCURRENCY_ENABLED,
+    ADAPTIVE_INITIAL_CONCURRENCY,
+    ADAPTIVE_MIN_CONCURRENCY,
+    ADAPTIVE_MAX_CONCURRENCY,
+    ADAPTIVE_BACKOFF_RATIO,
+    ADAPTIVE_LATENCY_TOLERANCE,
+    ADAPTIVE_STATE_PATH
+)
+from review_metrics import get_default_metrics
+from api_key_pool import KEY_AUTH_STATUS_CODES, KEY_THROTTLE_STATUS_CODES, KeyPoolExhausted, estimate_request_tokens
+from adaptive_concurrency import (
+    AdaptiveLimiterRegistry,
+    OUTCOME_ERROR,
+    OUTCOME_OK,
+    OUTCOME_THROTTLED,
+    THROTTLE_STATUS_CODES
+)
+
+# 这些状态码表示服务端暂时不可用或限流，值得重试
+RETRYABLE_STATUS_CODES = (429, 500, 502, 503, 504)
+
+# 使用 API Key 池时，这些状态码说明问题出在当前 Key 上，换用其他 Key 重试
+KEY_ROTATION_STATUS_CODES = KEY_AUTH_STATUS_CODES + KEY_THROTTLE_STATUS_CODES
+
+# 流式生成因时长或 token 上限被提前取消时，追加在回答末尾的说明以此开头；调用方据此避免缓存不完整的结果
+STREAM_CUTOFF_MARKER = "[审查输出已提前截断]"
+
+
+class ApiRequestError(Exception):
+    """API 请求在重试耗尽后仍然失败时抛出"""
+
+    def __init__(self, message, status_code=None, response_text=None, attempts=0):
+        super().__init__(message)
+        self.status_code = status_code
+        self.response_text = response_text
+        self.attempts = attempts
+
+
+class RequestCancelled(ApiRequestError):
+    """请求被调用方通过 cancel_event 取消 (例如对冲请求中较慢的一方)，不视为后端故障"""
+
+
+class ApiKeysExhausted(ApiRequestError):
+    """
+    使用 API Key 池时，池中所有 Key 都因鉴权或额度问题 (401/402/403) 暂停使用。
+    status_code 为最后一次返回的状态码；发送前就发现没有可用的 Key 时为 None。
+    重试无法恢复，路由器据此切换到其他后端。
+    """
+
+
+def parse_retry_after(value):
+    """
+    解析 Retry-After 响应头，返回需要等待的秒数。
+    该头既可以是秒数，也可以是 HTTP 日期；无法解析时返回 None。
+    """
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at is None:
+        return None
+    return max(0.0, retry_at.timestamp() - time.time())
+
+
+class StreamProgress:
+    """
+    流式生成的进度输出，作为 post_json_stream 的 on_delta 回调使用。
+    每隔 interval 秒打印一次已接收的 token 数，避免较慢的生成看起来像是卡住了。
+    """
+
+    def __init__(self, label, interval=15.0):
+        self.label = label
+        self.interval = interval
+        self.received_tokens = 0
+        self.started_at = time.monotonic()
+        self._last_report = self.started_at
+
+    def __call__(self, text):
+        self.received_tokens += 1
+        now = time.monotonic()
+        if self.interval and now - self._last_report >= self.interval:
+            self._last_report = now
+            print(f"  {self.label}: 生成中，已接收约 {self.received_tokens} tokens，用时 {now - self.started_at:.0f}s")
+
+
+class ApiTransport:
+    """
+    所有审查器共享的 HTTP 传输层。
+
+    - 使用带连接池的 requests.Session，复用 TCP/TLS 连接 (keep-alive)。
+    - 对网络错误和 429/5xx 响应按带抖动的指数退避重试，优先遵循 Retry-After。
+    - 收到 429 时暂停所有线程发往同一接口地址的新请求，直到限流窗口结束 (其他后端不受影响)。
+    - 启用自适应并发时，按 (接口地址, API Key) 以 AIMD 方式限制同时在途的请求数，见 adaptive_concurrency。
+    - 记录每次尝试的耗时，可通过 format_stats 查看汇总。
+    """
+
+    def __init__(self, pool_size=HTTP_POOL_SIZE, max_retries=API_MAX_RETRIES,
+                 backoff_base=API_BACKOFF_BASE_SECONDS, backoff_max=API_BACKOFF_MAX_SECONDS,
+                 adaptive_limits=None):
+        """
+        :param adaptive_limits: AdaptiveLimiterRegistry 实例；为 None 时按 config 中的 ADAPTIVE_CONCURRENCY_ENABLED 创建，
+                                未启用时不限制在途请求数。
+        """
+        self.max_retries = max(0, int(max_retries))
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+        self._lock = threading.Lock()
+        self._throttle_until = {}  # 接口地址 -> 限流窗口结束时间
+        self.requests_sent = 0
+        self.retries = 0
+        self.failures = 0
+        self.total_attempt_seconds = 0.0
+        self.max_attempt_seconds = 0.0
+
+        if adaptive_limits is None and ADAPTIVE_CONCURRENCY_ENABLED:
+            adaptive_limits = AdaptiveLimiterRegistry(
+                ADAPTIVE_STATE_PATH, initial_limit=ADAPTIVE_INITIAL_CONCURRENCY, min_limit=ADAPTIVE_MIN_CONCURRENCY,
+                max_limit=ADAPTIVE_MAX_CONCURRENCY, backoff_ratio=ADAPTIVE_BACKOFF_RATIO,
+                latency_tolerance=ADAPTIVE_LATENCY_TOLERANCE
+            )
+            # 进程退出时保存学到的并发上限，下次运行从该值开始
+            atexit.register(adaptive_limits.save)
+        self.adaptive_limits = adaptive_limits
+
+    def _backoff_delay(self, attempt, retry_after=None):
+        """计算第 attempt 次重试前的等待时间 (full jitter)，若服务端给出 Retry-After 则以其为下限"""
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+        if retry_after is not None:
+            delay = max(delay, min(retry_after, self.backoff_max))
+        return delay
+
+    def _wait_for_throttle(self, url):
+        """若其他线程刚从同一接口收到 429，在限流窗口结束前暂缓发送"""
+        with self._lock:
+            wait_seconds = self._throttle_until.get(url, 0.0) - time.monotonic()
+        if wait_seconds > 0:
+            time.sleep(wait_seconds)
+
+    def _record_attempt(self, elapsed, retried=False, failed=False):
+        metrics = get_default_metrics()
+        metrics.record("api_call", elapsed)
+        if retried:
+            metrics.increment("api_retries")
+        if failed:
+            metrics.increment("api_failures")
+        with self._lock:
+            self.requests_sent += 1
+            self.total_attempt_seconds += elapsed
+            self.max_attempt_seconds = max(self.max_attempt_seconds, elapsed)
+            if retried:
+                self.retries += 1
+            if failed:
+                self.failures += 1
+
+    def _post_with_retries(self, url, payload, headers, timeout, label, read_response, stream=False, max_retries=None,
+                           cancel_event=None, key_pool=None):
+        """
+        发送 POST 请求，状态码 < 400 时交给 read_response(response, attempts) 读取结果并返回。
+        网络错误和可重试的状态码按退避策略重试；read_response 抛出 ApiRequestError 时不再重试。
+        :param max_retries: 本次请求的最大重试次数，None 表示使用传输层的默认值。
+        :param cancel_event: threading.Event，被设置后不再发起新的尝试并抛出 RequestCancelled。
+        :param key_pool: ApiKeyPool 实例；提供时每次尝试从池中选择 Key 并设置 Authorization 请求头，
+                         某个 Key 返回 401/402/403/429 时立即换用其他可用的 Key 重试 (不占用重试次数)；
+                         所有 Key 都因 401/402/403 暂停使用时抛出 ApiKeysExhausted。
+        """
+        max_retries = self.max_retries if max_retries is None else max(0, int(max_retries))
+        estimated_tokens = estimate_request_tokens(payload) if key_pool is not None else 0
+        key_rotations = 0
+        attempt = 0
+        while True:
+            self._wait_for_throttle(url)
+            if cancel_event is not None and cancel_event.is_set():
+                raise RequestCancelled(f"{label} 请求已取消", attempts=attempt)
+            lease = None
+            attempt_headers = headers
+            if key_pool is not None:
+                try:
+                    lease = key_pool.acquire(estimated_tokens)
+                except KeyPoolExhausted as e:
+                    raise ApiKeysExhausted(str(e), attempts=attempt)
+                attempt_headers = dict(headers or {}, Authorization=f"Bearer {lease.api_key}")
+            limiter = None
+            if self.adaptive_limits is not None:
+                api_key = (attempt_headers or {}).get("Authorization", "").replace("Bearer ", "", 1)
+                limiter = self.adaptive_limits.get(url, api_key)
+                limiter.acquire()
+            outcome, response_seconds = OUTCOME_ERROR, None
+            status_code, usage = None, None
+            started = time.monotonic()
+            retry_after = None
+            try:
+                response = self.session.post(url, headers=attempt_headers, json=payload, timeout=timeout, stream=stream)
+                status_code = response.status_code
+                response_seconds = time.monotonic() - started
+                if status_code in THROTTLE_STATUS_CODES:
+                    outcome = OUTCOME_THROTTLED
+                elif status_code < 400:
+                    outcome = OUTCOME_OK
+                if status_code < 400:
+                    try:
+                        data = read_response(response, attempt + 1)
+                    except RequestCancelled:
+                        self._record_attempt(time.monotonic() - started)
+                        raise
+                    except ApiRequestError:
+                        self._record_attempt(time.monotonic() - started, failed=True)
+                        raise
+                    finally:
+                        response.close()
+                    self._record_attempt(time.monotonic() - started)
+                    usage = data.get("usage") if isinstance(data, dict) else None
+                    return data
+
+                elapsed = time.monotonic() - started
+                error = ApiRequestError(f"{label} 返回 HTTP {status_code}", status_code, response.text, attempt + 1)
+                retryable = status_code in RETRYABLE_STATUS_CODES
+                retry_after = parse_retry_after(response.headers.get("Retry-After"))
+            except requests.exceptions.RequestException as e:
+                elapsed = time.monotonic() - started
+                error = ApiRequestError(f"{label} 网络错误: {e}", attempts=attempt + 1)
+                retryable = isinstance(e, (requests.exceptions.ConnectionError, requests.exceptions.Timeout,
+                                           requests.exceptions.ChunkedEncodingError))
+            finally:
+                if limiter is not None:
+                    limiter.release(outcome, response_seconds)
+                if lease is not None:
+                    key_pool.release(lease, status_code, usage, retry_after)
+
+            if (key_pool is not None and status_code in KEY_ROTATION_STATUS_CODES
+                    and key_rotations < key_pool.size - 1 and key_pool.available_count()):
+                # 问题出在这个 Key 上，换用池中的其他 Key 立即重试
+                key_rotations += 1
+                self._record_attempt(elapsed, retried=True)
+                print(f"  {error}，换用其他 API Key 重试...")
+                continue
+
+            if key_pool is not None and status_code in KEY_AUTH_STATUS_CODES and not key_pool.available_count():
+                self._record_attempt(elapsed, failed=True)
+                raise ApiKeysExhausted(f"{label} 返回 HTTP {status_code}，{key_pool.size} 个 API Key 均因鉴权或额度问题暂停使用",
+                                       status_code, error.response_text, attempt + 1)
+
+            if not retryable or attempt >= max_retries:
+                self._record_attempt(elapsed, failed=True)
+                raise error
+
+            delay = self._backoff_delay(attempt, retry_after)
+            self._record_attempt(elapsed, retried=True)
+            if error.status_code == 429 and key_pool is None:
+                # 使用 Key 池时限流只针对单个 Key，由 Key 池暂停该 Key
+                with self._lock:
+                    self._throttle_until[url] = max(self._throttle_until.get(url, 0.0), time.monotonic() + delay)
+            print(f"  {error} (第 {attempt + 1} 次尝试，耗时 {elapsed:.1f}s)，{delay:.1f}s 后重试...")
+            if cancel_event is not None:
+                cancel_event.wait(delay)
+            else:
+                time.sleep(delay)
+            attempt += 1
+
+    def post_json(self, url, payload, headers=None, timeout=120, label="API", max_retries=None, cancel_event=None,
+                  key_pool=None):
+        """
+        发送 JSON POST 请求并返回解析后的 JSON 响应。
+        对可重试的错误自动重试，重试耗尽或遇到不可重试的错误时抛出 ApiRequestError。
+        :param label: 打印日志时使用的名称，例如 "DeepSeek API"。
+        :param cancel_event: 被设置后不再重试；已发出的请求无法中途取消，其响应照常读取。
+        :param key_pool: 可选的 ApiKeyPool，见 _post_with_retries。
+        """
+        def read_json(response, attempts):
+            try:
+                return response.json()
+            except ValueError:
+                raise ApiRequestError(f"{label} 响应不是合法的 JSON", response.status_code, response.text, attempts)
+
+        return self._post_with_retries(url, payload, headers, timeout, label, read_json, max_retries=max_retries,
+                                       cancel_event=cancel_event, key_pool=key_pool)
+
+    def post_json_stream(self, url, payload, headers=None, timeout=60, label="API",
+                         on_delta=None, max_seconds=None, max_output_tokens=None, max_retries=None, cancel_event=None,
+                         key_pool=None):
+        """
+        以流式 (server-sent events) 方式发送 chat completions 请求，边接收边回调 on_delta(文本片段)。
+        生成时长超过 max_seconds 或接收的 token 数达到 max_output_tokens 时立即关闭连接以取消生成，
+        保留已经收到的内容。尚未收到任何内容时的网络错误按 post_json 的策略重试。
+
+        :param timeout: 连接以及两次收到数据之间的最长等待时间 (秒)，而不是整个生成过程的时长。
+        :param max_seconds: 单次生成的时长上限，None 或 0 表示不限制。
+        :param max_output_tokens: 接收的 token 数上限 (按收到的片段数计)，None 或 0 表示不限制。
+        :param cancel_event: threading.Event，被设置后在收到下一个事件时关闭连接并抛出 RequestCancelled。
+        :param key_pool: 可选的 ApiKeyPool，见 _post_with_retries。
+        :return: 与非流式响应结构相同的字典 ({"choices": [{"message": {...}, "finish_reason": ...}], "usage": ...})；
+                 因上限被提前取消时额外包含 "stream_cutoff": "time" 或 "tokens"。
+        """
+        # include_usage: 在最后一个事件中返回 usage (包括上下文缓存命中的 token 数)
+        payload = dict(payload, stream=True, stream_options={"include_usage": True})
+
+        def read_events(response, attempts):
+            started = time.monotonic()
+            pieces = []
+            received_tokens = 0
+            finish_reason = None
+            usage = None
+            cutoff = None
+            try:
+                for raw_line in response.iter_lines():
+                    # 空行分隔事件，以 ":" 开头的是服务端的保活注释
+                    if not raw_line or raw_line.startswith(b":") or not raw_line.startswith(b"data:"):
+                        continue
+                    if cancel_event is not None and cancel_event.is_set():
+                        raise RequestCancelled(f"{label} 请求已取消", response.status_code, "".join(pieces), attempts)
+                    data = raw_line[5:].strip()
+                    if data == b"[DONE]":
+                        break
+                    try:
+                        event = json.loads(data)
+                    except ValueError:
+                        raise ApiRequestError(f"{label} 流式响应中包含无法解析的事件", response.status_code,
+                                              data.decode('utf-8', errors='replace'), attempts)
+                    if event.get("usage"):
+                        usage = event["usage"]
+                    for choice in event.get("choices") or []:
+                        text = (choice.get("delta") or {}).get("content")
+                        if text:
+                            pieces.append(text)
+                            received_tokens += 1
+                            if on_delta is not None:
+                                on_delta(text)
+                        if choice.get("finish_reason"):
+                            finish_reason = choice["finish_reason"]
+                    if max_seconds and time.monotonic() - started >= max_seconds:
+                        cutoff = "time"
+                        break
+                    if max_output_tokens and received_tokens >= max_output_tokens:
+                        cutoff = "tokens"
+                        break
+            except requests.exceptions.RequestException as e:
+                if not pieces:
+                    raise
+                # 已经收到部分内容时不再重试，避免重复生成
+                raise ApiRequestError(f"{label} 流式响应中断: {e}", response.status_code, "".join(pieces), attempts)
+            result = {
+                "choices": [{
+                    "message": {"role": "assistant", "content": "".join(pieces)},
+                    "finish_reason": "cancelled" if cutoff else finish_reason,
+                }],
+                "usage": usage,
+            }
+            if cutoff:
+                result["stream_cutoff"] = cutoff
+            return result
+
+        return self._post_with_retries(url, payload, headers, timeout, label, read_events, stream=True,
+                                       max_retries=max_retries, cancel_event=cancel_event, key_pool=key_pool)
+
+    def format_stats(self):
+        """返回请求次数、重试次数和单次尝试耗时的汇总"""
+        with self._lock:
+            average = self.total_attempt_seconds / self.requests_sent if self.requests_sent else 0.0
+            stats = (f"HTTP 请求 {self.requests_sent} 次 (重试 {self.retries} 次，失败 {self.failures} 次)，"
+                     f"单次平均耗时 {average:.1f}s，最长 {self.max_attempt_seconds:.1f}s")
+        if self.adaptive_limits is not None:
+            limiter_stats = self.adaptive_limits.format_stats()
+            if limiter_stats:
+                stats += "\n" + limiter_stats
+        return stats
+
+    def close(self):
+        self.session.close()
+
+
+_default_transport = None
+_default_transport_lock = threading.Lock()
+
+
+def get_default_transport():
+    """返回进程内共享的 ApiTransport 实例，所有审查器共用同一个连接池"""
+    global _default_transport
+    with _default_transport_lock:
+        if _default_transport is None:
+            _default_transport = ApiTransport()
+        return _default_transport
+
+
+def complete_chat(transport, url, payload, headers=None, timeout=180, stream=False,
+                  stream_max_seconds=None, stream_max_output_tokens=None, progress_label="DeepSeek API",
+                  label="DeepSeek API", max_retries=None, cancel_event=None, key_pool=None):
+    """
+    发送一次 chat completions 请求并返回回答文本，失败时抛出 ApiRequestError，响应结构不符时抛出 KeyError 等异常。
+    stream 为 True 时流式接收并定期打印生成进度；生成达到时长或 token 上限时取消请求，
+    保留已生成的内容并在末尾追加以 STREAM_CUTOFF_MARKER 开头的截断说明。
+    :param progress_label: 打印生成进度时使用的名称，例如正在审查的文件路径。
+    :param label: 日志和错误信息中使用的后端名称。
+    :param max_retries: 本次请求的最大重试次数，None 表示使用传输层的默认值。
+    :param cancel_event: threading.Event，被设置后放弃本次请求并抛出 RequestCancelled (流式请求会立即关闭连接)。
+    :param key_pool: 可选的 ApiKeyPool，每次尝试从池中选择 API Key (此时 headers 中无需 Authorization)。
+    """
+    started = time.perf_counter()
+    try:
+        if not stream:
+            response_json = transport.post_json(url, payload, headers=headers, timeout=timeout, label=label,
+                                                max_retries=max_retries, cancel_event=cancel_event, key_pool=key_pool)
+        else:
+            response_json = transport.post_json_stream(
+                url, payload, headers=headers, timeout=STREAM_IDLE_TIMEOUT_SECONDS, label=label,
+                on_delta=StreamProgress(progress_label, STREAM_PROGRESS_INTERVAL_SECONDS),
+                max_seconds=stream_max_seconds, max_output_tokens=stream_max_output_tokens, max_retries=max_retries,
+                cancel_event=cancel_event, key_pool=key_pool
+            )
+    except ApiRequestError as e:
+        if e.status_code is not None and 200 <= e.status_code < 300:
+            # 已收到成功响应后才失败 (流式响应中断或被取消)，生成可能已经计费，记为没有 usage 的调用
+            get_default_metrics().record_usage(None)
+        raise
+    get_default_metrics().record_usage(response_json.get("usage"), time.perf_counter() - started)
+    if not stream:
+        return response_json["choices"][0]["message"]["content"]
+
+    content = response_json["choices"][0]["message"]["content"]
+    cutoff = response_json.get("stream_cutoff")
+    if cutoff:
+        if cutoff == "time":
+            limit = f"{stream_max_seconds} 秒的生成时长"
+        else:
+            limit = f"{stream_max_output_tokens} tokens 的输出"
+        print(f"  {progress_label}: 生成达到{limit}上限，已取消请求并保留已生成的内容。")
+        content += f"\n\n{STREAM_CUTOFF_MARKER} 生成达到{limit}上限，已提前停止，以上审查意见可能不完整。"
+    return content
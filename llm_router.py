@@ -0,0 +1,406 @@
+import math
+import queue
+import threading
+import time
+from collections import deque
+
+from http_transport import ApiKeysExhausted, ApiRequestError, RequestCancelled, complete_chat, get_default_transport
+from api_key_pool import get_key_pool
+from review_metrics import current_usage_tally, get_default_metrics, usage_scope
+from config import (
+    DEEPSEEK_API_KEY,
+    DEEPSEEK_API_KEYS,
+    KEY_POOL_RPM,
+    KEY_POOL_TPM,
+    KEY_POOL_AUTH_COOLDOWN_SECONDS,
+    KEY_POOL_THROTTLE_COOLDOWN_SECONDS,
+    LLM_PROVIDERS,
+    ROUTER_WINDOW_SIZE,
+    ROUTER_MIN_SAMPLES,
+    ROUTER_ERROR_RATE_THRESHOLD,
+    ROUTER_COOLDOWN_SECONDS,
+    ROUTER_RETRIES_BEFORE_FAILOVER,
+    HEDGE_ENABLED,
+    HEDGE_PERCENTILE,
+    HEDGE_WINDOW_SIZE,
+    HEDGE_MIN_SAMPLES,
+    HEDGE_MIN_DELAY_SECONDS,
+    HEDGE_MAX_EXTRA_RATIO
+)
+
+# 多模型后端路由: 每次请求发往滚动平均延迟最低的健康后端，请求失败时自动切换到下一个后端。
+# 各后端的健康状况按 (接口地址, 模型) 记录在进程内共享的注册表中，所有审查器和每次请求共用同一份统计。
+
+# 视为后端故障、需要切换到下一个后端的异常 (与各审查器中 complete_chat 的错误处理一致)。
+# 其中 ApiKeysExhausted (后端的 Key 池中所有 Key 都因鉴权或额度问题不可用) 重试无法恢复，该后端直接进入冷却
+FAILOVER_ERRORS = (ApiRequestError, KeyError, IndexError, TypeError)
+
+
+class OpenAICompatibleProvider:
+    """
+    OpenAI 兼容的 chat completions 后端，例如 DeepSeek、OpenAI、Grok (xAI)，
+    以及 Gemini、Claude 提供的 OpenAI 兼容端点。
+    api_keys 中有多个 Key 时使用进程内共享的 ApiKeyPool，由传输层为每次尝试选择 Key。
+    """
+
+    def __init__(self, name, api_url, api_key, model, extra_headers=None, api_keys=None):
+        self.name = name
+        self.api_url = api_url
+        self.api_key = api_key
+        self.model = model
+        self.extra_headers = dict(extra_headers or {})
+        self.key_pool = None
+        if api_keys and len(set(api_keys)) > 1:
+            self.key_pool = get_key_pool(
+                api_url, api_keys, rpm=KEY_POOL_RPM, tpm=KEY_POOL_TPM, auth_cooldown=KEY_POOL_AUTH_COOLDOWN_SECONDS,
+                throttle_cooldown=KEY_POOL_THROTTLE_COOLDOWN_SECONDS, name=name
+            )
+        elif api_keys:
+            self.api_key = api_keys[0]
+
+    @property
+    def key(self):
+        """健康统计的键: 同一接口的不同模型分别统计"""
+        return self.api_url, self.model
+
+    def build_request(self, payload):
+        """
+        将请求体改写为本后端的请求: 替换模型名并附带本后端的鉴权头 (使用 Key 池时由传输层设置)。
+        :return: (请求体, 请求头)
+        """
+        headers = {"Content-Type": "application/json"}
+        if self.key_pool is None:
+            headers["Authorization"] = f"Bearer {self.api_key}"
+        headers.update(self.extra_headers)
+        return dict(payload, model=self.model), headers
+
+    def __repr__(self):
+        return f"{self.name} ({self.model})"
+
+
+class ProviderHealth:
+    """
+    单个后端最近 window 次请求的结果与延迟 (线程安全)。
+
+    最近的请求中错误率不低于阈值 (且样本数足够) 时，后端在冷却时间内被视为不健康，
+    路由器只在所有健康后端都失败后才会尝试它；冷却结束后重新参与路由。
+    """
+
+    def __init__(self, window=ROUTER_WINDOW_SIZE):
+        self._lock = threading.Lock()
+        self._outcomes = deque(maxlen=max(1, window))  # (是否成功, 耗时)
+        self.requests = 0
+        self.failures = 0
+        self.cooldown_until = 0.0
+        self.last_failure_at = 0.0
+
+    def record(self, ok, seconds, min_samples=ROUTER_MIN_SAMPLES,
+               error_threshold=ROUTER_ERROR_RATE_THRESHOLD, cooldown_seconds=ROUTER_COOLDOWN_SECONDS):
+        with self._lock:
+            self._outcomes.append((ok, seconds))
+            self.requests += 1
+            if ok:
+                return
+            self.failures += 1
+            self.last_failure_at = time.monotonic()
+            errors = sum(1 for success, _ in self._outcomes if not success)
+            if len(self._outcomes) >= min_samples and errors / len(self._outcomes) >= error_threshold:
+                self.cooldown_until = time.monotonic() + cooldown_seconds
+                # 冷却结束后按新的请求重新评估，避免旧的失败记录让后端立即再次进入冷却
+                self._outcomes.clear()
+
+    def latency(self):
+        """最近成功请求的平均耗时，没有成功记录时返回 None"""
+        with self._lock:
+            latencies = [seconds for ok, seconds in self._outcomes if ok]
+        return sum(latencies) / len(latencies) if latencies else None
+
+    def error_rate(self):
+        with self._lock:
+            if not self._outcomes:
+                return 0.0
+            return sum(1 for ok, _ in self._outcomes if not ok) / len(self._outcomes)
+
+    def routing_score(self):
+        """
+        路由排序依据，越小越优先: 平均延迟按错误率折算为得到一次成功回答的期望耗时。
+        没有任何记录时为 0 (优先尝试以便测量)；只有失败记录时为无穷大，
+        最后一次失败已超过冷却时长时重新视为 0，让偶发失败的后端有机会恢复。
+        """
+        with self._lock:
+            if not self._outcomes:
+                return 0.0
+            latencies = [seconds for ok, seconds in self._outcomes if ok]
+            if not latencies:
+                if time.monotonic() - self.last_failure_at >= ROUTER_COOLDOWN_SECONDS:
+                    return 0.0
+                return float("inf")
+            success_rate = len(latencies) / len(self._outcomes)
+        return sum(latencies) / len(latencies) / success_rate
+
+    def suspend(self, cooldown_seconds=ROUTER_COOLDOWN_SECONDS):
+        """不论最近的错误率，立即让后端进入冷却 (例如其所有 API Key 均不可用)"""
+        with self._lock:
+            self.cooldown_until = max(self.cooldown_until, time.monotonic() + cooldown_seconds)
+            self._outcomes.clear()
+
+    def is_healthy(self):
+        return time.monotonic() >= self.cooldown_until
+
+
+_health_lock = threading.Lock()
+_health_registry = {}
+
+
+def get_provider_health(provider):
+    """返回进程内共享的后端健康统计，首次使用时创建"""
+    with _health_lock:
+        health = _health_registry.get(provider.key)
+        if health is None:
+            health = _health_registry[provider.key] = ProviderHealth()
+        return health
+
+
+class HedgingPolicy:
+    """
+    对冲请求策略 (线程安全): 记录最近请求的耗时，请求耗时超过其分位数时允许发送一份对冲请求。
+
+    - 耗时样本少于 min_samples 时不对冲；等待时间不低于 min_delay 秒。
+    - 对冲请求数不超过请求总数的 max_extra_ratio，超出时本次不对冲。
+    """
+
+    def __init__(self, enabled=HEDGE_ENABLED, percentile=HEDGE_PERCENTILE, window=HEDGE_WINDOW_SIZE,
+                 min_samples=HEDGE_MIN_SAMPLES, min_delay=HEDGE_MIN_DELAY_SECONDS, max_extra_ratio=HEDGE_MAX_EXTRA_RATIO):
+        self.enabled = enabled
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.min_delay = min_delay
+        self.max_extra_ratio = max_extra_ratio
+        self._lock = threading.Lock()
+        self._latencies = deque(maxlen=max(1, window))
+        self.requests = 0
+        self.hedges_sent = 0
+        self.hedges_won = 0
+        self.hedges_capped = 0
+
+    def observe(self, seconds):
+        """记录一次成功请求的耗时 (从发出到得到结果)"""
+        with self._lock:
+            self.requests += 1
+            self._latencies.append(seconds)
+
+    def hedge_delay(self):
+        """返回发送对冲请求前的等待时间，不对冲时返回 None"""
+        if not self.enabled:
+            return None
+        with self._lock:
+            if len(self._latencies) < self.min_samples:
+                return None
+            ordered = sorted(self._latencies)
+        index = min(len(ordered) - 1, max(0, math.ceil(self.percentile * len(ordered)) - 1))
+        return max(self.min_delay, ordered[index])
+
+    def try_acquire(self):
+        """申请发送一份对冲请求，超出额外开销上限时返回 False"""
+        with self._lock:
+            if self.hedges_sent + 1 > self.max_extra_ratio * max(1, self.requests):
+                self.hedges_capped += 1
+                get_default_metrics().increment("hedge_capped")
+                return False
+            self.hedges_sent += 1
+        get_default_metrics().increment("hedge_sent")
+        return True
+
+    def record_outcome(self, hedge_won):
+        """记录发送了对冲请求后由哪一方先完成"""
+        with self._lock:
+            if hedge_won:
+                self.hedges_won += 1
+        get_default_metrics().increment("hedge_won" if hedge_won else "hedge_lost")
+
+    def format_stats(self):
+        delay = self.hedge_delay()
+        delay_text = f"{delay:.1f}s" if delay is not None else "样本不足"
+        with self._lock:
+            return (f"对冲请求: 共 {self.requests} 次请求，发送对冲 {self.hedges_sent} 次 "
+                    f"(对冲先完成 {self.hedges_won} 次)，因额外开销上限未对冲 {self.hedges_capped} 次，"
+                    f"当前对冲等待时间 {delay_text}")
+
+
+_default_hedging_policy = HedgingPolicy()
+
+
+def get_default_hedging_policy():
+    """返回进程内共享的对冲策略，按 config 中的 HEDGE_* 配置创建"""
+    return _default_hedging_policy
+
+
+class LLMRouter:
+    """
+    在多个后端之间路由 chat completions 请求。
+
+    - 健康的后端按滚动平均延迟 (按错误率折算) 从低到高排序，尚无记录的后端排在最前，使每个后端都有机会被测量；
+      相同时按配置顺序。处于冷却中的后端排在最后，仅作为兜底。
+    - 请求失败 (网络错误、重试后仍为 429/5xx、响应无法解析) 时记录失败并切换到下一个后端，
+      所有后端都失败时抛出最后一个错误。后端的 Key 池中所有 Key 都不可用 (ApiKeysExhausted) 时该后端立即进入冷却。
+    - 配置了多个后端时，每个后端只重试 retries_before_failover 次就切换，而不是用完传输层的全部重试次数。
+    - 启用对冲时，请求耗时超过 hedging.hedge_delay() 后向排在下一位的后端 (只有一个后端时为同一后端)
+      发送一份相同的请求，采用先成功的结果并取消另一方。
+    """
+
+    def __init__(self, providers, transport=None, retries_before_failover=ROUTER_RETRIES_BEFORE_FAILOVER,
+                 hedging=None):
+        if not providers:
+            raise ValueError("LLMRouter 至少需要一个后端")
+        self.providers = list(providers)
+        self.transport = transport if transport is not None else get_default_transport()
+        self.retries_before_failover = retries_before_failover
+        self.hedging = hedging if hedging is not None else get_default_hedging_policy()
+
+    def ranked_providers(self):
+        """返回本次请求尝试后端的顺序"""
+        healthy, cooling = [], []
+        for index, provider in enumerate(self.providers):
+            health = get_provider_health(provider)
+            if health.is_healthy():
+                healthy.append((health.routing_score(), index, provider))
+            else:
+                cooling.append((health.cooldown_until, index, provider))
+        return [provider for _, _, provider in sorted(healthy) + sorted(cooling)]
+
+    def complete(self, payload, timeout=180, stream=False, stream_max_seconds=None,
+                 stream_max_output_tokens=None, progress_label="DeepSeek API"):
+        """
+        发送 chat completions 请求并返回回答文本，参数含义与 http_transport.complete_chat 相同。
+        payload 中的 model 会被替换为实际使用的后端的模型名。
+        """
+        options = dict(timeout=timeout, stream=stream, stream_max_seconds=stream_max_seconds,
+                       stream_max_output_tokens=stream_max_output_tokens)
+        ranked = self.ranked_providers()
+        delay = self.hedging.hedge_delay()
+        started = time.perf_counter()
+        if delay is None:
+            content = self._complete_in_order(ranked, payload, options, progress_label)
+        else:
+            content = self._complete_hedged(ranked, payload, options, progress_label, delay)
+        self.hedging.observe(time.perf_counter() - started)
+        return content
+
+    def _complete_hedged(self, ranked, payload, options, progress_label, delay):
+        """
+        在后台线程中发送请求；delay 秒内没有完成时发送对冲请求，返回先成功的一方的结果并取消另一方。
+        双方都失败时抛出原请求的错误。
+        """
+        results = queue.Queue()
+        cancel_events = {}
+        # 双方的用量都计入调用方的 UsageTally (例如预算审查中当前文件的用量)
+        tally = current_usage_tally()
+
+        def launch(order, label, is_hedge):
+            cancel_event = cancel_events[is_hedge] = threading.Event()
+
+            def run():
+                try:
+                    with usage_scope(tally):
+                        content = self._complete_in_order(order, payload, options, label, cancel_event)
+                    results.put((is_hedge, content, None))
+                except Exception as e:
+                    results.put((is_hedge, None, e))
+
+            threading.Thread(target=run, name="hedged-request", daemon=True).start()
+
+        launch(ranked, progress_label, False)
+        try:
+            outcome = results.get(timeout=delay)
+        except queue.Empty:
+            outcome = None
+            if self.hedging.try_acquire():
+                hedge_order = ranked[1:] + ranked[:1]
+                print(f"  {progress_label}: 请求已超过 {delay:.1f}s，向 {hedge_order[0]!r} 发送对冲请求")
+                launch(hedge_order, f"{progress_label} (对冲)", True)
+            outcome = results.get()
+
+        errors = {}
+        while outcome[2] is not None:
+            errors[outcome[0]] = outcome[2]
+            if len(errors) == len(cancel_events):
+                raise errors.get(False, outcome[2])
+            outcome = results.get()
+
+        winner, content, _ = outcome
+        for is_hedge, cancel_event in cancel_events.items():
+            if is_hedge != winner:
+                cancel_event.set()
+        if len(cancel_events) > 1:
+            self.hedging.record_outcome(winner)
+        return content
+
+    def _complete_in_order(self, ranked, payload, options, progress_label, cancel_event=None):
+        """按 ranked 的顺序依次尝试各后端，直到某个后端成功"""
+        metrics = get_default_metrics()
+        max_retries = self.retries_before_failover if len(ranked) > 1 else None
+        last_error = None
+        for position, provider in enumerate(ranked):
+            body, headers = provider.build_request(payload)
+            health = get_provider_health(provider)
+            started = time.perf_counter()
+            try:
+                content = complete_chat(
+                    self.transport, provider.api_url, body, headers=headers, progress_label=progress_label,
+                    label=provider.name, max_retries=max_retries, cancel_event=cancel_event,
+                    key_pool=provider.key_pool, **options
+                )
+            except RequestCancelled:
+                raise
+            except FAILOVER_ERRORS as e:
+                health.record(False, time.perf_counter() - started)
+                if isinstance(e, ApiKeysExhausted):
+                    health.suspend()
+                metrics.increment(f"llm_{provider.name}_failures")
+                last_error = e
+                if position + 1 < len(ranked):
+                    metrics.increment("llm_failovers")
+                    print(f"  后端 {provider!r} 请求失败: {e}，切换到 {ranked[position + 1]!r}")
+                continue
+            elapsed = time.perf_counter() - started
+            health.record(True, elapsed)
+            metrics.record(f"llm_{provider.name}", elapsed)
+            return content
+        raise last_error
+
+    def format_stats(self):
+        """
+        返回各后端的请求数、平均延迟、错误率和状态，以及 API Key 池的使用情况，用于打印；
+        只有一个后端且未使用 Key 池时返回空字符串。
+        """
+        pools = [provider.key_pool for provider in self.providers if provider.key_pool is not None]
+        if len(self.providers) == 1:
+            return "\n".join(pool.format_stats() for pool in pools)
+        lines = ["模型后端统计:"]
+        for provider in self.providers:
+            health = get_provider_health(provider)
+            latency = health.latency()
+            latency_text = f"{latency:.2f}s" if latency is not None else "-"
+            status = "正常" if health.is_healthy() else "冷却中"
+            lines.append(f"  {provider!r}: {health.requests} 次请求，失败 {health.failures} 次，"
+                         f"最近平均延迟 {latency_text}，最近错误率 {health.error_rate():.0%}，{status}")
+        lines.extend(pool.format_stats() for pool in pools)
+        return "\n".join(lines)
+
+
+def create_router(api_key, api_url, model, transport=None, providers=None, api_keys=None):
+    """
+    创建路由器: 由 api_key / api_url / model 指定的 DeepSeek 后端排在第一位，
+    其后是 providers (为 None 时使用 config 中的 LLM_PROVIDERS) 中的其他后端。
+    :param api_keys: DeepSeek 后端的多个 Key；为 None 时，若 api_key 就是 config 中的 DEEPSEEK_API_KEY (未被环境变量等覆盖)，
+                     使用 config 中的 DEEPSEEK_API_KEYS。
+    """
+    if api_keys is None:
+        api_keys = DEEPSEEK_API_KEYS if api_key in ("", None, DEEPSEEK_API_KEY) else None
+    backends = [OpenAICompatibleProvider("deepseek", api_url, api_key, model, api_keys=api_keys)]
+    for entry in (LLM_PROVIDERS if providers is None else providers):
+        backends.append(OpenAICompatibleProvider(
+            entry.get("name") or entry["model"], entry["api_url"], entry.get("api_key", ""), entry["model"],
+            extra_headers=entry.get("headers"), api_keys=entry.get("api_keys")
+        ))
+    return LLMRouter(backends, transport=transport)
@@ -0,0 +1,238 @@
+import ast
+import os
+import re
+
+# 定位包含变更的函数/方法，替代 "让模型提取方法体" 这一次 API 调用。
+# Python 使用 ast 精确定位；Java/Kotlin/Swift/ObjC/Go/C 系列语言使用感知括号、字符串和注释的扫描器。
+
+_HUNK_HEADER = re.compile(r'^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@')
+
+PYTHON_EXTENSIONS = ('.py',)
+BRACE_EXTENSIONS = ('.java', '.kt', '.kts', '.swift', '.m', '.mm', '.go', '.c', '.h', '.cc', '.cpp', '.hpp', '.cs', '.js', '.ts')
+
+# 这些关键字后面的代码块不是函数定义
+_CONTROL_KEYWORDS = {
+    'if', 'else', 'for', 'foreach', 'while', 'do', 'switch', 'case', 'catch', 'try', 'finally',
+    'synchronized', 'return', 'guard', 'defer', 'when', 'select', 'using', 'lock', 'new', 'sizeof'
+}
+_FUNCTION_KEYWORD = re.compile(r'\b(?:func|fun|function|init|deinit|constructor|subscript)\b')
+_TYPE_KEYWORD = re.compile(r'\b(?:class|struct|enum|interface|object|protocol|extension|record|namespace)\b')
+# 这些语言的函数定义总是带有关键字；不带关键字的 "名称(参数) {" 通常是尾随闭包
+KEYWORD_FUNCTION_EXTENSIONS = ('.swift', '.kt', '.kts', '.go')
+# 以这些内容开头的行 (预处理指令、package/import 声明、ObjC 编译指令) 不属于任何函数头
+_DIRECTIVE_LINE = re.compile(r'^\s*(?:#|(?:package|import)\b|@(?:implementation|interface|end|protocol|synthesize|dynamic|property|class|import)\b)')
+_OBJC_METHOD_HEADER = re.compile(r'^[-+]\s*\(')
+# "名称(参数)" 之后可能跟随的修饰: const/override/throws/返回类型等
+_C_STYLE_HEADER = re.compile(
+    r'[A-Za-z_~][\w:<>~]*\s*\([^()]*(?:\([^()]*\)[^()]*)*\)\s*'
+    r'(?:const|override|final|noexcept|mutating|async|throws(?:\s+[\w.,\s]+)?|->\s*[^{]+|:\s*[\w<>?,\s.]+)*\s*$'
+)
+_FIRST_WORD = re.compile(r'^\s*([A-Za-z_]\w*)')
+
+
+def changed_line_numbers(diff_hunk):
+    """
+    根据 hunk 中的 @@ -a,b +c,d @@ 行号信息，计算变更在新文件中涉及的行号。
+    新增行直接记录；纯删除的位置记录为删除点在新文件中的行号。
+    hunk 中没有 @@ 行时返回空列表。
+    """
+    line_numbers = set()
+    new_line = None
+    for line in diff_hunk.splitlines():
+        header = _HUNK_HEADER.match(line)
+        if header:
+            new_line = int(header.group(3))
+            continue
+        if new_line is None:
+            continue
+        if line.startswith('+') and not line.startswith('+++'):
+            line_numbers.add(new_line)
+            new_line += 1
+        elif line.startswith('-') and not line.startswith('---'):
+            line_numbers.add(max(1, new_line))
+        elif line.startswith(' '):
+            new_line += 1
+    return sorted(line_numbers)
+
+
+def _python_definitions(content):
+    """使用 ast 列出所有函数定义的 (起始行, 结束行, 名称)，起始行包含装饰器"""
+    tree = ast.parse(content)
+    definitions = []
+    for node in ast.walk(tree):
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            start = min([node.lineno] + [d.lineno for d in node.decorator_list])
+            definitions.append((start, node.end_lineno, node.name))
+    return definitions
+
+
+def _python_definitions_by_indent(lines):
+    """ast 解析失败 (例如 Python 2 代码) 时，按缩进推断函数范围"""
+    definitions = []
+    def_pattern = re.compile(r'^(\s*)(?:async\s+)?def\s+(\w+)')
+    for index, line in enumerate(lines):
+        match = def_pattern.match(line)
+        if not match:
+            continue
+        indent = len(match.group(1).expandtabs())
+        end = index
+        for next_index in range(index + 1, len(lines)):
+            next_line = lines[next_index]
+            if not next_line.strip():
+                continue
+            if len(next_line) - len(next_line.lstrip()) <= indent and not next_line.lstrip().startswith(')'):
+                break
+            end = next_index
+        definitions.append((index + 1, end + 1, match.group(2)))
+    return definitions
+
+
+def _is_function_header(header, ext):
+    """判断 '{' 之前的代码是否为函数/方法头"""
+    header = header.strip()
+    if not header:
+        return False
+    first_word = _FIRST_WORD.match(header)
+    if first_word and first_word.group(1) in _CONTROL_KEYWORDS:
+        return False
+    if _OBJC_METHOD_HEADER.match(header):
+        return True
+    if _FUNCTION_KEYWORD.search(header):
+        # 以 = , ( in 结尾的是闭包或变量，而不是函数定义
+        return not header.endswith(('=', ',', '(', ' in'))
+    if ext in KEYWORD_FUNCTION_EXTENSIONS or _TYPE_KEYWORD.search(header):
+        return False
+    return bool(_C_STYLE_HEADER.search(header))
+
+
+def _brace_definitions(content, ext):
+    """
+    扫描括号语言源码，返回所有函数/方法定义的 (起始行, 结束行, 函数头首行)。
+    扫描时跳过字符串、字符字面量、注释以及预处理指令中的括号。
+    """
+    definitions = []
+    stack = []  # 每个元素: (是否为函数, 函数头起始行, 函数头文本)
+    line = 1
+    header_chars = []
+    header_start_line = None
+    index = 0
+    length = len(content)
+    at_line_start = True
+    while index < length:
+        if at_line_start:
+            at_line_start = False
+            line_end = content.find('\n', index)
+            line_end = length if line_end == -1 else line_end
+            if _DIRECTIVE_LINE.match(content[index:line_end]):
+                header_chars, header_start_line = [], None
+                index = line_end
+                continue
+        ch = content[index]
+        nxt = content[index + 1] if index + 1 < length else ''
+        if ch == '\n':
+            line += 1
+            header_chars.append(' ')
+            index += 1
+            at_line_start = True
+            continue
+        if ch == '/' and nxt == '/':
+            end = content.find('\n', index)
+            index = length if end == -1 else end
+            continue
+        if ch == '/' and nxt == '*':
+            end = content.find('*/', index + 2)
+            end = length if end == -1 else end + 2
+            line += content.count('\n', index, end)
+            index = end
+            continue
+        if ch in ('"', "'", '`'):
+            quote = ch
+            index += 1
+            while index < length and content[index] != quote:
+                if content[index] == '\\':
+                    index += 1
+                elif content[index] == '\n':
+                    line += 1
+                    if quote != '`':
+                        # 未闭合的字符串不会跨行 (例如 Swift 多行字符串的引号)，避免吞掉后续代码
+                        break
+                index += 1
+            index += 1
+            header_chars.append('""')
+            continue
+        if ch == '{':
+            header = "".join(header_chars)
+            is_function = _is_function_header(header, ext)
+            stack.append((is_function, header_start_line or line, header.strip()))
+            header_chars, header_start_line = [], None
+        elif ch == '}':
+            if stack:
+                is_function, start_line, header = stack.pop()
+                if is_function:
+                    definitions.append((start_line, line, header[:80]))
+            header_chars, header_start_line = [], None
+        elif ch == ';':
+            header_chars, header_start_line = [], None
+        else:
+            if header_start_line is None and not ch.isspace():
+                header_start_line = line
+            header_chars.append(ch)
+        index += 1
+    return definitions
+
+
+def find_enclosing_definitions(file_path, content, line_numbers):
+    """
+    找出包含给定行号的最外层函数/方法 (闭包、局部函数会归入其所在的方法)。
+    :return: (定义列表, 未被任何函数包含的行号列表)。定义为 (起始行, 结束行, 名称) 并按起始行排序；
+             语言不受支持时返回 (None, line_numbers)。
+    """
+    ext = os.path.splitext(file_path)[1].lower()
+    if ext in PYTHON_EXTENSIONS:
+        try:
+            definitions = _python_definitions(content)
+        except (SyntaxError, ValueError):
+            definitions = _python_definitions_by_indent(content.splitlines())
+    elif ext in BRACE_EXTENSIONS:
+        definitions = _brace_definitions(content, ext)
+    else:
+        return None, list(line_numbers)
+
+    found = {}
+    uncovered = []
+    for line_number in line_numbers:
+        containing = [d for d in definitions if d[0] <= line_number <= d[1]]
+        if not containing:
+            uncovered.append(line_number)
+            continue
+        outermost = max(containing, key=lambda d: d[1] - d[0])
+        found[(outermost[0], outermost[1])] = outermost
+    return sorted(found.values()), uncovered
+
+
+def extract_enclosing_methods(file_path, content, diff_hunk, line_numbers=None):
+    """
+    在本地提取包含 diff hunk 变更的完整函数/方法代码。
+    无法可靠定位时 (语言不支持、hunk 缺少行号、变更全部位于函数之外) 返回 None，
+    调用方应回退到模型提取。
+    :param line_numbers: 变更在新文件中涉及的行号 (例如 FileDiff.changed_new_lines())；
+                         为 None 时从 diff_hunk 的 @@ 行推算。
+    """
+    if not content:
+        return None
+    if line_numbers is None:
+        line_numbers = changed_line_numbers(diff_hunk)
+    if not line_numbers:
+        return None
+    definitions, uncovered = find_enclosing_definitions(file_path, content, line_numbers)
+    if not definitions:
+        return None
+
+    lines = content.splitlines()
+    comment_prefix = '#' if os.path.splitext(file_path)[1].lower() in PYTHON_EXTENSIONS else '//'
+    parts = []
+    for start, end, _ in definitions:
+        parts.append(f"{comment_prefix} 第 {start}-{end} 行\n" + "\n".join(lines[start - 1:end]))
+    if uncovered:
+        parts.append(f"{comment_prefix} 另有位于函数之外的变更 (第 {', '.join(str(n) for n in uncovered[:10])} 行)，未包含在上述代码中")
+    return "\n\n".join(parts)
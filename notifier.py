@@ -0,0 +1,320 @@
+import atexit
+import queue
+import smtplib
+import threading
+from email.mime.text import MIMEText
+from email.mime.multipart import MIMEMultipart
+
+try:
+    import requests
+except ImportError:
+    raise ImportError("请先使用pip安装requests模块: pip install requests")
+
+from config import (
+    NOTIFY_TIMEOUT_SECONDS,
+    NOTIFY_DIGEST_ENABLED,
+    NOTIFY_SHUTDOWN_WAIT_SECONDS,
+    WECHAT_MARKDOWN_MAX_BYTES
+)
+from review_metrics import get_default_metrics
+
+_STOP = object()
+# 拆分企业微信消息时为每段末尾的 "(第 i/n 段)" 预留的字节数
+_PART_SUFFIX_RESERVE = 32
+
+
+class SmtpMailer:
+    """
+    复用同一个 SMTP 会话发送多封邮件: 只在第一次发送时建立连接并完成 STARTTLS 和登录，
+    连接被服务端断开时自动重连一次。所有网络操作都带有超时。
+    """
+
+    def __init__(self, smtp_config, timeout=NOTIFY_TIMEOUT_SECONDS):
+        """
+        :param smtp_config: {"host", "port", "user", "password", "sender", "receiver"}
+        """
+        self.config = smtp_config
+        self.timeout = timeout
+        self._server = None
+
+    @staticmethod
+    def is_configured(smtp_config):
+        return bool(smtp_config) and all(smtp_config.get(k) for k in ['host', 'user', 'password', 'sender'])
+
+    def _connect(self):
+        cfg = self.config
+        port = cfg.get('port', 587)
+        if port == 465:
+            server = smtplib.SMTP_SSL(cfg['host'], port, timeout=self.timeout)
+        else:
+            server = smtplib.SMTP(cfg['host'], port, timeout=self.timeout)
+            server.ehlo()
+            if server.has_extn('starttls'):
+                server.starttls()  # 使用TLS加密
+                server.ehlo()
+        server.login(cfg['user'], cfg['password'])
+        return server
+
+    def send(self, subject, body, receiver=None):
+        """发送一封纯文本邮件，失败时抛出异常"""
+        cfg = self.config
+        receiver = receiver or cfg.get('receiver')
+        msg = MIMEMultipart()
+        msg['From'] = cfg['sender']
+        msg['To'] = receiver
+        msg['Subject'] = subject
+        msg.attach(MIMEText(body, 'plain', 'utf-8'))
+        text = msg.as_string()
+
+        for attempt in range(2):
+            if self._server is None:
+                self._server = self._connect()
+            try:
+                self._server.sendmail(cfg['sender'], receiver, text)
+                return receiver
+            except (smtplib.SMTPServerDisconnected, OSError):
+                # 会话空闲过久被服务端关闭，重新连接后再试一次
+                self._discard()
+                if attempt:
+                    raise
+
+    def _discard(self):
+        server, self._server = self._server, None
+        if server is not None:
+            try:
+                server.close()
+            except OSError:
+                pass
+
+    def close(self):
+        """结束 SMTP 会话"""
+        server, self._server = self._server, None
+        if server is not None:
+            try:
+                server.quit()
+            except (smtplib.SMTPException, OSError):
+                server.close()
+
+
+def _truncate_utf8(text, max_bytes):
+    """按 UTF-8 字节数截取文本开头，不会截断多字节字符"""
+    return text.encode('utf-8')[:max_bytes].decode('utf-8', errors='ignore')
+
+
+def split_markdown_message(message, max_bytes=WECHAT_MARKDOWN_MAX_BYTES):
+    """
+    将超过企业微信 markdown 消息长度上限 (按 UTF-8 字节计) 的消息按行拆分为多段，
+    超长的单行按字节截断为多行。拆分为多段时，每段末尾附加 "(第 i/n 段)"。
+    :return: 消息段列表，未超出上限时只有一段。
+    """
+    if len(message.encode('utf-8')) <= max_bytes:
+        return [message]
+
+    budget = max(1, max_bytes - _PART_SUFFIX_RESERVE)
+    parts = []
+    current, current_bytes = [], 0
+    for line in message.split('\n'):
+        while True:
+            line_bytes = len(line.encode('utf-8')) + 1  # 包括换行符
+            if current and current_bytes + line_bytes > budget:
+                parts.append('\n'.join(current))
+                current, current_bytes = [], 0
+            if line_bytes <= budget:
+                current.append(line)
+                current_bytes += line_bytes
+                break
+            head = _truncate_utf8(line, budget - 1)
+            parts.append(head)
+            line = line[len(head):]
+    if current:
+        parts.append('\n'.join(current))
+    return [f"{part}\n(第 {index}/{len(parts)} 段)" for index, part in enumerate(parts, start=1)]
+
+
+def post_wechat_markdown(webhook_url, message, timeout=NOTIFY_TIMEOUT_SECONDS, session=None):
+    """
+    发送企业微信 markdown 消息，超出长度上限时拆分为多条依次发送。
+    :return: 是否全部发送成功。
+    """
+    post = session.post if session is not None else requests.post
+    segments = split_markdown_message(message)
+    for index, segment in enumerate(segments, start=1):
+        payload = {
+            "msgtype": "markdown",
+            "markdown": {
+                "content": segment
+            }
+        }
+        label = f" (第 {index}/{len(segments)} 段)" if len(segments) > 1 else ""
+        try:
+            response = post(webhook_url, headers={'Content-Type': 'application/json'}, json=payload, timeout=timeout)
+            response.raise_for_status()
+            result = response.json()
+        except requests.exceptions.RequestException as e:
+            print(f"发送企业微信通知时发生网络错误{label}: {e}")
+            return False
+        except ValueError as e:
+            print(f"企业微信通知响应无法解析{label}: {e}")
+            return False
+        if result.get("errcode") != 0:
+            print(f"企业微信通知发送失败{label}: {result.get('errmsg')}")
+            return False
+    print("企业微信通知发送成功" + (f" (共 {len(segments)} 段)" if len(segments) > 1 else ""))
+    return True
+
+
+class NotificationDispatcher:
+    """
+    在后台线程中发送邮件和企业微信通知，审查流程不会被缓慢的邮件服务器或 webhook 阻塞。
+
+    - 相同 SMTP 配置的邮件复用同一个 SmtpMailer 会话。
+    - digest 为 True 时，通知先在内存中累积，调用 flush() 或 close() 时按收件人/webhook 合并为一条汇总发送，
+      适合一次运行中审查多个仓库的场景。
+    - close() 最多等待 wait_seconds 秒，让尚未发送的通知发送完毕。
+    """
+
+    def __init__(self, timeout=NOTIFY_TIMEOUT_SECONDS, digest=NOTIFY_DIGEST_ENABLED):
+        self.timeout = timeout
+        self.digest = digest
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._pending_emails = {}  # (SMTP 配置键, 收件人) -> (smtp_config, [(主题, 正文), ...])
+        self._pending_wechat = {}  # webhook_url -> [消息, ...]
+        self._mailers = {}
+        self._session = None
+        self._thread = None
+        self.closed = False
+
+    def _ensure_worker(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="notification-dispatcher", daemon=True)
+                self._thread.start()
+
+    def send_email(self, smtp_config, subject, body, receiver=None):
+        """提交一封邮件，立即返回"""
+        if not SmtpMailer.is_configured(smtp_config) or not (receiver or smtp_config.get('receiver')):
+            print("SMTP 配置不完整，跳过发送邮件。")
+            return
+        receiver = receiver or smtp_config['receiver']
+        if self.digest:
+            key = (smtp_config['host'], smtp_config.get('port', 587), smtp_config['user'], receiver)
+            with self._lock:
+                self._pending_emails.setdefault(key, (smtp_config, []))[1].append((subject, body))
+            return
+        self._submit(('email', smtp_config, subject, body, receiver))
+
+    def send_wechat(self, webhook_url, message):
+        """提交一条企业微信 markdown 消息，立即返回"""
+        if not webhook_url:
+            print("企业微信 Webhook URL 未配置，跳过发送通知。")
+            return
+        if self.digest:
+            with self._lock:
+                self._pending_wechat.setdefault(webhook_url, []).append(message)
+            return
+        self._submit(('wechat', webhook_url, message))
+
+    def _submit(self, item):
+        self._ensure_worker()
+        self._queue.put(item)
+
+    def flush(self):
+        """汇总模式下，将累积的通知合并后提交发送"""
+        with self._lock:
+            pending_emails, self._pending_emails = self._pending_emails, {}
+            pending_wechat, self._pending_wechat = self._pending_wechat, {}
+        for (_, _, _, receiver), (smtp_config, messages) in pending_emails.items():
+            if len(messages) == 1:
+                subject, body = messages[0]
+            else:
+                subject = f"代码审查通知汇总 ({len(messages)} 条)"
+                body = "\n\n".join(f"===== {item_subject} =====\n{item_body}" for item_subject, item_body in messages)
+            self._submit(('email', smtp_config, subject, body, receiver))
+        for webhook_url, messages in pending_wechat.items():
+            if len(messages) == 1:
+                message = messages[0]
+            else:
+                message = f"### 代码审查通知汇总 ({len(messages)} 条)\n\n" + "\n\n---\n\n".join(messages)
+            self._submit(('wechat', webhook_url, message))
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            try:
+                if item is _STOP:
+                    return
+                if item[0] == 'email':
+                    self._deliver_email(*item[1:])
+                else:
+                    self._deliver_wechat(*item[1:])
+            finally:
+                self._queue.task_done()
+
+    def _deliver_email(self, smtp_config, subject, body, receiver):
+        key = (smtp_config['host'], smtp_config.get('port', 587), smtp_config['user'])
+        mailer = self._mailers.get(key)
+        if mailer is None:
+            mailer = self._mailers[key] = SmtpMailer(smtp_config, self.timeout)
+        try:
+            with get_default_metrics().span("notify_email"):
+                mailer.send(subject, body, receiver)
+            print(f"邮件已成功发送至 {receiver}")
+        except Exception as e:
+            print(f"发送邮件失败: {e}")
+
+    def _deliver_wechat(self, webhook_url, message):
+        if self._session is None:
+            self._session = requests.Session()
+        try:
+            with get_default_metrics().span("notify_wechat"):
+                post_wechat_markdown(webhook_url, message, self.timeout, self._session)
+        except Exception as e:
+            print(f"发送企业微信通知时发生未知错误: {e}")
+
+    def wait(self, wait_seconds=NOTIFY_SHUTDOWN_WAIT_SECONDS):
+        """
+        等待已提交的通知发送完毕，最多等待 wait_seconds 秒。
+        :return: 是否全部发送完毕。
+        """
+        if self._thread is None:
+            return True
+        done = threading.Event()
+
+        def join_queue():
+            self._queue.join()
+            done.set()
+
+        threading.Thread(target=join_queue, daemon=True).start()
+        return done.wait(wait_seconds)
+
+    def close(self, wait_seconds=NOTIFY_SHUTDOWN_WAIT_SECONDS):
+        """发送汇总、等待队列清空并关闭 SMTP 会话，重复调用无副作用"""
+        if self.closed:
+            return
+        self.closed = True
+        self.flush()
+        if not self.wait(wait_seconds):
+            print(f"等待通知发送超时 ({wait_seconds}s)，部分通知可能未发送。")
+            return
+        if self._thread is not None:
+            self._queue.put(_STOP)
+            self._thread.join(self.timeout)
+        for mailer in self._mailers.values():
+            mailer.close()
+        if self._session is not None:
+            self._session.close()
+
+
+_default_dispatcher = None
+_default_dispatcher_lock = threading.Lock()
+
+
+def get_default_dispatcher():
+    """返回进程内共享的通知分发器，进程退出前会自动发送剩余的通知"""
+    global _default_dispatcher
+    with _default_dispatcher_lock:
+        if _default_dispatcher is None or _default_dispatcher.closed:
+            _default_dispatcher = NotificationDispatcher()
+            atexit.register(_default_dispatcher.close)
+        return _default_dispatcher
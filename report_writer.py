@@ -0,0 +1,94 @@
+import os
+
+from review_metrics import get_default_metrics
+
+
+class ReportWriter:
+    """
+    边审查边写入的报告文件。
+
+    每个文件的报告片段审查完成后立即追加并刷新到磁盘，内存中不保留报告内容，
+    因此内存占用与仓库大小无关。审查过程中写入 "<报告路径>.partial"，调用 finish() 后才替换为正式报告；
+    进程中途被终止时，已完成部分保留在 .partial 文件中，也不会覆盖上一次的完整报告。
+    """
+
+    def __init__(self, report_path):
+        """
+        :param report_path: 正式报告的路径。
+        """
+        self.report_path = os.path.abspath(report_path)
+        self.partial_path = self.report_path + ".partial"
+        self.sections_written = 0
+        self.chars_written = 0
+        self._file = None
+        self._started = False
+
+    def _ensure_open(self):
+        if self._file is None:
+            directory = os.path.dirname(self.report_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            # 首次打开时清空旧的 .partial 文件，之后 (例如 close() 后继续写入) 以追加方式打开
+            self._file = open(self.partial_path, 'a' if self._started else 'w', encoding='utf-8')
+            if not self._started:
+                print(f"审查报告将实时写入: {self.partial_path}")
+            self._started = True
+        return self._file
+
+    def write_parts(self, parts):
+        """追加一组报告片段 (通常是一个文件的审查结果)，各片段以换行分隔，写入后立即刷新"""
+        if not parts:
+            return
+        text = "\n".join(parts) + "\n"
+        with get_default_metrics().span("report_write"):
+            report_file = self._ensure_open()
+            report_file.write(text)
+            report_file.flush()
+        self.sections_written += 1
+        self.chars_written += len(text)
+
+    def write(self, text):
+        """追加一段文本"""
+        self.write_parts([text])
+
+    def finish(self):
+        """
+        关闭文件并将 .partial 替换为正式报告。
+        :return: 正式报告的路径；写入失败时返回 None (已写入的内容仍保留在 .partial 文件中)。
+        """
+        try:
+            self._ensure_open().close()
+            os.replace(self.partial_path, self.report_path)
+        except OSError as e:
+            print(f"保存审查报告到文件失败: {e}")
+            return None
+        finally:
+            self._file = None
+        print(f"审查报告已保存至: {self.report_path}")
+        return self.report_path
+
+    def close(self):
+        """关闭文件但不替换正式报告 (例如审查异常中止时)，已写入的内容保留在 .partial 文件中"""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def read_report_preview(report_path, max_chars=2000):
+    """
+    读取报告开头的至多 max_chars 个字符，用于邮件等通知，不把整份报告读入内存。
+    :return: (预览文本, 报告是否比预览更长)；读取失败时返回 ("", False)。
+    """
+    try:
+        with open(report_path, 'r', encoding='utf-8', errors='ignore') as f:
+            preview = f.read(max_chars)
+            return preview, bool(f.read(1))
+    except OSError as e:
+        print(f"读取审查报告 {report_path} 失败: {e}")
+        return "", False
@@ -0,0 +1,192 @@
+import math
+import os
+import re
+import threading
+
+from review_metrics import get_default_metrics
+
+# 风险评分中各信号的权重
+_CHURN_WEIGHT = 1.0        # 近期修改次数 (取对数)
+_SIZE_WEIGHT = 0.5         # 文件大小 (KB，取对数)
+_KEYWORD_BONUS = 2.0       # 路径命中敏感关键词时的加分
+
+
+def parse_churn(log_output):
+    """
+    解析 `git log --name-only -z --format=` 的输出 (路径以 \0 或换行分隔)，返回 {文件路径: 近期修改次数}。
+    """
+    churn = {}
+    for line in (log_output or "").replace('\0', '\n').splitlines():
+        path = line.strip()
+        if path:
+            churn[path] = churn.get(path, 0) + 1
+    return churn
+
+
+def compile_risk_keywords(keywords):
+    """将敏感关键词编译为匹配路径中单词开头的正则，例如 "pay" 匹配 payment/ 但不匹配 display"""
+    if not keywords:
+        return None
+    return re.compile(r'(?<![a-z])(?:' + '|'.join(re.escape(k.lower()) for k in keywords) + ')')
+
+
+def risk_score(file_path, size, churn_count, language_weights, keyword_regex):
+    """
+    根据本地信号计算文件的风险评分，评分越高越优先审查。
+    :return: (评分, 命中的信号说明列表)
+    """
+    extension = os.path.splitext(file_path)[1].lower()
+    language_weight = language_weights.get(extension, 1.0)
+    score = 1.0
+    reasons = []
+    if churn_count:
+        score += _CHURN_WEIGHT * math.log1p(churn_count)
+        reasons.append(f"近期修改 {churn_count} 次")
+    if size:
+        score += _SIZE_WEIGHT * math.log1p(size / 1024)
+    if keyword_regex is not None:
+        match = keyword_regex.search(file_path.lower())
+        if match:
+            score += _KEYWORD_BONUS
+            reasons.append(f"敏感路径 '{match.group(0)}'")
+    if language_weight != 1.0:
+        reasons.append(f"语言权重 {language_weight:g}")
+    return score * language_weight, reasons
+
+
+def rank_by_risk(file_paths, file_sizes, churn, language_weights, keyword_regex):
+    """
+    按风险评分从高到低排序文件，评分相同时保持原有顺序。
+    :return: [(文件路径, 评分, 信号说明列表), ...]
+    """
+    ranked = []
+    for file_path in file_paths:
+        score, reasons = risk_score(file_path, file_sizes.get(file_path), churn.get(file_path, 0),
+                                    language_weights, keyword_regex)
+        ranked.append((file_path, score, reasons))
+    ranked.sort(key=lambda item: -item[1])
+    return ranked
+
+
+def estimate_review_tokens(size, template_tokens, expected_output_tokens, max_content_chars,
+                           chunked_review=False, chunk_max_tokens=4000):
+    """
+    在不读取文件内容的情况下，根据文件大小 (字节) 估算审查该文件消耗的 token 数。
+    超出长度上限的文件: 分块审查时按块数估算每块以及整合请求的开销，否则按截断后的长度估算。
+    :return: (输入 token 数, 输出 token 数)
+    """
+    if size is None:
+        size = max_content_chars
+    content_tokens = size // 4 + 1
+    if size <= max_content_chars:
+        return template_tokens + content_tokens, expected_output_tokens
+    if not chunked_review:
+        return template_tokens + max_content_chars // 4 + 1, expected_output_tokens
+    chunk_count = max(1, math.ceil(content_tokens / max(1, chunk_max_tokens)))
+    # 每块一次请求，再加一次整合请求 (其输入为各块的审查意见)
+    input_tokens = content_tokens + template_tokens * (chunk_count + 1) + expected_output_tokens * chunk_count
+    return input_tokens, expected_output_tokens * (chunk_count + 1)
+
+
+class TokenBudgetGovernor:
+    """
+    一次审查运行的 token / 费用预算。
+
+    每次审查前按估算值预留额度，审查结束后释放预留；已消耗的额度取自 API 响应中的实际 usage
+    (通过共享的 ReviewMetrics 统计)，因此命中缓存、没有实际调用 API 的文件不会消耗预算。
+    审查中有调用没有返回 usage (流式响应被截断、后端不返回 usage 等) 时，release 按预留的估算值补记消耗，
+    避免这类调用完全不计入预算。
+    预留时若 已消耗 + 已预留 + 本次估算 超过上限，则拒绝本次审查，调用方应跳过该文件。
+    """
+
+    def __init__(self, max_tokens=0, max_cost=0.0, input_price=0.0, cached_input_price=0.0, output_price=0.0):
+        """
+        :param max_tokens: 输入与输出 token 的总上限，0 表示不限制。
+        :param max_cost: 费用上限，0 表示不限制。
+        :param input_price: 每百万输入 token (未命中上下文缓存) 的价格。
+        :param cached_input_price: 每百万命中上下文缓存的输入 token 的价格。
+        :param output_price: 每百万输出 token 的价格。
+        """
+        self.max_tokens = max_tokens or 0
+        self.max_cost = max_cost or 0.0
+        self.input_price = input_price
+        self.cached_input_price = cached_input_price
+        self.output_price = output_price
+        self._lock = threading.Lock()
+        self._baseline = get_default_metrics().tokens()
+        self._reserved_tokens = 0
+        self._reserved_cost = 0.0
+        # 没有返回 usage 的调用按估算值补记的消耗
+        self._unreported_tokens = 0
+        self._unreported_cost = 0.0
+
+    def estimate_cost(self, input_tokens, output_tokens):
+        """估算费用 (按输入全部未命中缓存计算，偏保守)"""
+        return (input_tokens * self.input_price + output_tokens * self.output_price) / 1_000_000
+
+    def usage_cost(self, tokens):
+        """
+        按 usage 字段计算 (token 数, 费用)。
+        :param tokens: {usage 字段: token 数}，字段见 review_metrics.USAGE_TOKEN_FIELDS。
+        """
+        prompt_tokens = tokens.get("prompt_tokens", 0)
+        completion_tokens = tokens.get("completion_tokens", 0)
+        cache_hit = tokens.get("prompt_cache_hit_tokens", 0)
+        cache_miss = tokens.get("prompt_cache_miss_tokens", 0) if (cache_hit or tokens.get("prompt_cache_miss_tokens")) else prompt_tokens
+        cost = (cache_hit * self.cached_input_price + cache_miss * self.input_price
+                + completion_tokens * self.output_price) / 1_000_000
+        return prompt_tokens + completion_tokens, cost
+
+    def spent(self):
+        """返回本次运行实际消耗的 (token 数, 费用)，包括没有返回 usage 的调用按估算值补记的部分"""
+        tokens = get_default_metrics().tokens()
+        spent_tokens, spent_cost = self.usage_cost(
+            {field: tokens[field] - self._baseline.get(field, 0) for field in tokens}
+        )
+        return spent_tokens + self._unreported_tokens, spent_cost + self._unreported_cost
+
+    def try_reserve(self, input_tokens, output_tokens):
+        """
+        为一次审查预留额度。
+        :return: 预留成功时返回预留凭据 (调用 release 归还)，超出预算时返回 None。
+        """
+        tokens = input_tokens + output_tokens
+        cost = self.estimate_cost(input_tokens, output_tokens)
+        with self._lock:
+            spent_tokens, spent_cost = self.spent()
+            if self.max_tokens and spent_tokens + self._reserved_tokens + tokens > self.max_tokens:
+                return None
+            if self.max_cost and spent_cost + self._reserved_cost + cost > self.max_cost:
+                return None
+            self._reserved_tokens += tokens
+            self._reserved_cost += cost
+        return tokens, cost
+
+    def release(self, reservation, usage=None):
+        """
+        审查结束后归还预留的额度。返回了 usage 的调用已计入 spent；
+        usage 中有调用没有返回 usage 时，按预留的估算值补记 (已报告的用量不足估算值的部分)。
+        :param usage: 本次审查的 review_metrics.UsageTally，为 None 时视为所有调用都返回了 usage。
+        """
+        if reservation is None:
+            return
+        tokens, cost = reservation
+        with self._lock:
+            self._reserved_tokens -= tokens
+            self._reserved_cost -= cost
+            if usage is not None and usage.calls_without_usage:
+                reported_tokens, reported_cost = self.usage_cost(usage.tokens)
+                self._unreported_tokens += max(0, tokens - reported_tokens)
+                self._unreported_cost += max(0.0, cost - reported_cost)
+
+    def describe_limits(self):
+        limits = []
+        if self.max_tokens:
+            limits.append(f"{self.max_tokens} tokens")
+        if self.max_cost:
+            limits.append(f"费用 {self.max_cost:g}")
+        return " / ".join(limits) or "不限"
+
+    def format_status(self):
+        spent_tokens, spent_cost = self.spent()
+        return f"预算 {self.describe_limits()}，实际消耗 {spent_tokens} tokens (费用约 {spent_cost:.4f})"
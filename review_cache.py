@@ -0,0 +1,169 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+
+def git_blob_sha(data):
+    """
+    按 git 的规则计算内容的 blob SHA-1 (与 `git hash-object` 结果一致)。
+    :param data: bytes 或 str (str 会按 UTF-8 编码)。
+    """
+    if isinstance(data, str):
+        data = data.encode('utf-8')
+    header = f"blob {len(data)}\0".encode('ascii')
+    return hashlib.sha1(header + data).hexdigest()
+
+
+def fingerprint(text):
+    """返回文本 (如提示词模板) 的短指纹，用于区分不同版本的模板"""
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()[:16]
+
+
+class ReviewCache:
+    """
+    基于 SQLite 的内容寻址审查结果缓存。
+
+    缓存键由调用方通过 make_key 生成，通常包含文件的 blob SHA、提示词模板指纹、
+    模型名称和 max_tokens，因此只要文件内容和提示词不变，就可以直接复用上次的审查结果。
+    支持按存活时间和总大小淘汰条目，并统计本次运行的命中/未命中次数。
+    """
+
+    def __init__(self, db_path, max_age_days=30, max_size_mb=200):
+        """
+        :param db_path: SQLite 数据库文件路径，所在目录不存在时会自动创建。
+        :param max_age_days: 条目最长保留天数 (按最后访问时间计算)，为 None 或 0 时不按时间淘汰。
+        :param max_size_mb: 缓存内容总大小上限 (MB)，超出时淘汰最久未访问的条目，为 None 或 0 时不限制。
+        """
+        self.db_path = os.path.abspath(db_path)
+        self.max_age_seconds = max_age_days * 86400 if max_age_days else None
+        self.max_size_bytes = int(max_size_mb * 1024 * 1024) if max_size_mb else None
+        self.hits = 0
+        self.misses = 0
+        self._conn = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(*parts):
+        """将若干组成部分 (blob SHA、模板指纹、模型、max_tokens 等) 合成一个缓存键"""
+        joined = "\0".join(str(part) for part in parts)
+        return hashlib.sha256(joined.encode('utf-8')).hexdigest()
+
+    def _connect(self):
+        """首次使用时才打开数据库，避免仅导入模块就创建文件"""
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+            self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS review_cache ("
+                " key TEXT PRIMARY KEY,"
+                " value TEXT NOT NULL,"
+                " size INTEGER NOT NULL,"
+                " created_at REAL NOT NULL,"
+                " last_access REAL NOT NULL,"
+                " hit_count INTEGER NOT NULL DEFAULT 0)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_review_cache_last_access ON review_cache (last_access)")
+            self._conn.commit()
+            self._evict_locked()
+        return self._conn
+
+    def get(self, key):
+        """查询缓存，命中时返回缓存的审查结果，否则返回 None"""
+        with self._lock:
+            try:
+                conn = self._connect()
+                row = conn.execute("SELECT value, last_access FROM review_cache WHERE key = ?", (key,)).fetchone()
+                now = time.time()
+                if row is None or (self.max_age_seconds and now - row[1] > self.max_age_seconds):
+                    self.misses += 1
+                    return None
+                conn.execute("UPDATE review_cache SET last_access = ?, hit_count = hit_count + 1 WHERE key = ?", (now, key))
+                conn.commit()
+                self.hits += 1
+                return row[0]
+            except sqlite3.Error as e:
+                print(f"读取审查缓存失败: {e}")
+                self.misses += 1
+                return None
+
+    def put(self, key, value):
+        """写入缓存。写入失败只打印警告，不影响审查流程"""
+        if value is None:
+            return
+        with self._lock:
+            try:
+                conn = self._connect()
+                now = time.time()
+                conn.execute(
+                    "INSERT OR REPLACE INTO review_cache (key, value, size, created_at, last_access, hit_count) VALUES (?, ?, ?, ?, ?, 0)",
+                    (key, value, len(value.encode('utf-8')), now, now)
+                )
+                conn.commit()
+            except sqlite3.Error as e:
+                print(f"写入审查缓存失败: {e}")
+
+    def evict(self):
+        """按存活时间和总大小淘汰过期条目，返回删除的条目数"""
+        with self._lock:
+            try:
+                self._connect()
+                return self._evict_locked()
+            except sqlite3.Error as e:
+                print(f"清理审查缓存失败: {e}")
+                return 0
+
+    def _evict_locked(self):
+        conn = self._conn
+        removed = 0
+        if self.max_age_seconds:
+            cursor = conn.execute("DELETE FROM review_cache WHERE last_access < ?", (time.time() - self.max_age_seconds,))
+            removed += cursor.rowcount
+        if self.max_size_bytes:
+            total_size = conn.execute("SELECT COALESCE(SUM(size), 0) FROM review_cache").fetchone()[0]
+            if total_size > self.max_size_bytes:
+                # 从最久未访问的条目开始删除，直到总大小回到上限以内
+                stale_keys = []
+                for key, size in conn.execute("SELECT key, size FROM review_cache ORDER BY last_access ASC"):
+                    if total_size <= self.max_size_bytes:
+                        break
+                    stale_keys.append((key,))
+                    total_size -= size
+                conn.executemany("DELETE FROM review_cache WHERE key = ?", stale_keys)
+                removed += len(stale_keys)
+        conn.commit()
+        if removed:
+            print(f"审查缓存已淘汰 {removed} 个条目。")
+        return removed
+
+    def stats(self):
+        """返回本次运行的命中统计以及缓存中的条目数和总大小"""
+        with self._lock:
+            entries, total_size = 0, 0
+            if self._conn is not None:
+                entries, total_size = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM review_cache").fetchone()
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "entries": entries,
+                "size_bytes": total_size,
+            }
+
+    def format_stats(self):
+        """返回适合打印或写入报告摘要的统计信息"""
+        s = self.stats()
+        return (f"审查缓存命中 {s['hits']} 次，未命中 {s['misses']} 次 (命中率 {s['hit_rate']:.1%})，"
+                f"缓存条目 {s['entries']} 个，约 {s['size_bytes'] / 1024 / 1024:.1f} MB")
+
+    def close(self):
+        """淘汰过期条目并关闭数据库连接"""
+        with self._lock:
+            if self._conn is not None:
+                try:
+                    self._evict_locked()
+                finally:
+                    self._conn.close()
+                    self._conn = None
@@ -0,0 +1,111 @@
+import hashlib
+import threading
+
+# 内容去重: 同一次运行中内容相同 (规范化后) 的文件或变更只调用一次 API，其余路径直接沿用第一次的审查结果。
+# 审查缓存的键包含文件路径，无法覆盖 vendored 副本、复制粘贴的文件等不同路径下的相同内容，由这里补充。
+
+
+def normalize_content(text):
+    """规范化文本用于比较: 统一换行符，去掉行尾空白以及首尾的空行"""
+    lines = text.replace('\r\n', '\n').replace('\r', '\n').split('\n')
+    return '\n'.join(line.rstrip() for line in lines).strip('\n')
+
+
+def normalize_hunk(hunk_content):
+    """规范化 diff hunk: 去掉带有行号的 "@@ ... @@" 行，相同的改动出现在文件不同位置时也视为相同"""
+    return normalize_content('\n'.join(
+        line for line in hunk_content.replace('\r\n', '\n').split('\n') if not line.startswith('@@')
+    ))
+
+
+def content_key(*parts):
+    """计算一个或多个 (已规范化的) 文本的去重键"""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part.encode('utf-8', errors='replace'))
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+class _Entry:
+    __slots__ = ('first_path', 'done', 'result')
+
+    def __init__(self, first_path):
+        self.first_path = first_path
+        self.done = threading.Event()
+        self.result = None
+
+
+class ReviewDeduplicator:
+    """
+    按内容去重审查请求 (线程安全)。
+
+    review_once(key, path, compute): 第一个提交某个键的路径调用 compute() 完成审查，
+    之后相同键的路径直接得到同一结果；第一次审查仍在进行时，其他线程等待其完成而不是重复调用 API。
+    第一次审查失败 (is_error 返回 True) 时不共享结果，后续路径各自重新审查。
+    """
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._entries = {}
+        self.saved_count = 0
+
+    def review_once(self, key, path, compute, is_error=None):
+        """
+        :return: (审查结果, 首次审查该内容的路径)；结果由本次调用计算时路径为 None。
+        """
+        if not self.enabled:
+            return compute(), None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = self._entries[key] = _Entry(path)
+                owner = True
+            else:
+                owner = False
+        if owner:
+            result = None
+            try:
+                result = compute()
+                return result, None
+            finally:
+                if result is None or (is_error is not None and is_error(result)):
+                    # 失败的结果不共享，移除记录后让等待者和后续路径重新审查
+                    with self._lock:
+                        if self._entries.get(key) is entry:
+                            del self._entries[key]
+                else:
+                    entry.result = result
+                entry.done.set()
+
+        entry.done.wait()
+        if entry.result is None:
+            return self.review_once(key, path, compute, is_error)
+        with self._lock:
+            self.saved_count += 1
+        return entry.result, entry.first_path
+
+    def lookup(self, key):
+        """返回已完成审查的 (结果, 首次审查的路径)，没有时返回 None (不会等待进行中的审查)"""
+        if not self.enabled:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry.result is None:
+                return None
+            self.saved_count += 1
+            return entry.result, entry.first_path
+
+    def remember(self, key, path, result):
+        """记录在别处 (例如合并审查) 完成的审查结果，已有记录时保留原记录"""
+        if not self.enabled:
+            return
+        with self._lock:
+            if key not in self._entries:
+                entry = self._entries[key] = _Entry(path)
+                entry.result = result
+                entry.done.set()
+
+    def format_stats(self):
+        return f"内容去重: {self.saved_count} 处内容与已审查的内容相同，沿用了已有结果，节省 {self.saved_count} 次审查请求"
@@ -0,0 +1,119 @@
+import hashlib
+import json
+import os
+import threading
+import time
+
+
+class ReviewJournal:
+    """
+    全项目审查的检查点日志 (只追加的 JSON Lines 文件，每次审查运行一个文件)。
+
+    第一行记录运行信息，之后每审查完成一个文件追加一行 {"path": ..., "parts": [...]} 并立即刷新。
+    进程中途退出后，使用相同的运行 ID 恢复时可以跳过已完成的文件，并从日志中读取它们的报告片段重建完整报告。
+    内存中只保存 文件路径 -> 日志中的偏移量，报告内容在需要时才按偏移量读取。
+    """
+
+    def __init__(self, journal_dir, run_id):
+        self.run_id = run_id
+        self.journal_path = os.path.abspath(os.path.join(journal_dir, f"{run_id}.jsonl"))
+        self._offsets = {}
+        self._writer = None
+        self._reader = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_run_id(repo_path, branch, commit_sha):
+        """根据仓库、分支和提交生成运行 ID，对同一提交重新运行时得到相同的 ID"""
+        key = "\0".join([os.path.abspath(repo_path), branch or "", commit_sha or ""])
+        safe_branch = "".join(ch if ch.isalnum() or ch in "-_." else "_" for ch in (branch or "HEAD"))
+        return f"{safe_branch}-{hashlib.sha256(key.encode('utf-8')).hexdigest()[:12]}"
+
+    def open(self, run_info, resume=False):
+        """
+        打开日志。resume 为 True 且已有同一运行的日志时，载入已完成文件的索引并继续追加；
+        否则新建日志并写入运行信息。
+        :return: 已完成 (可跳过) 的文件数。
+        """
+        os.makedirs(os.path.dirname(self.journal_path), exist_ok=True)
+        if resume and os.path.exists(self.journal_path):
+            self._load_index()
+            self._writer = open(self.journal_path, 'ab')
+        else:
+            if resume:
+                print(f"未找到运行 {self.run_id} 的检查点日志，将从头开始审查。")
+            self._offsets = {}
+            self._writer = open(self.journal_path, 'wb')
+            header = dict(run_info, run_id=self.run_id, started_at=time.time())
+            self._append({"run": header})
+        print(f"审查检查点日志: {self.journal_path}")
+        return len(self._offsets)
+
+    def _load_index(self):
+        """扫描已有日志，记录每个已完成文件的偏移量；进程被终止时写了一半的最后一行会被截掉"""
+        offsets = {}
+        valid_end = 0
+        with open(self.journal_path, 'rb') as f:
+            while True:
+                offset = f.tell()
+                line = f.readline()
+                if not line:
+                    break
+                if not line.endswith(b"\n"):
+                    break
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    break
+                if "path" in record:
+                    offsets[record["path"]] = offset
+                valid_end = f.tell()
+        if valid_end < os.path.getsize(self.journal_path):
+            with open(self.journal_path, 'r+b') as f:
+                f.truncate(valid_end)
+        self._offsets = offsets
+
+    def _append(self, record):
+        data = (json.dumps(record, ensure_ascii=False) + "\n").encode('utf-8')
+        offset = self._writer.tell()
+        self._writer.write(data)
+        self._writer.flush()
+        return offset
+
+    def __contains__(self, file_path):
+        return file_path in self._offsets
+
+    def record(self, file_path, report_parts):
+        """追加一个已完成文件的报告片段"""
+        with self._lock:
+            self._offsets[file_path] = self._append({"path": file_path, "parts": report_parts})
+
+    def read(self, file_path):
+        """读取已完成文件的报告片段，不存在时返回 None"""
+        with self._lock:
+            offset = self._offsets.get(file_path)
+            if offset is None:
+                return None
+            if self._writer is not None:
+                self._writer.flush()
+            if self._reader is None:
+                self._reader = open(self.journal_path, 'rb')
+            self._reader.seek(offset)
+            line = self._reader.readline()
+        return json.loads(line).get("parts")
+
+    def close(self, remove=False):
+        """
+        关闭日志。
+        :param remove: 为 True 时删除日志文件 (审查已完整结束、不再需要恢复时)。
+        """
+        with self._lock:
+            for handle in (self._writer, self._reader):
+                if handle is not None:
+                    handle.close()
+            self._writer = self._reader = None
+        if remove:
+            try:
+                os.remove(self.journal_path)
+            except OSError:
+                pass
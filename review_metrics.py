@@ -0,0 +1,308 @@
+import cProfile
+import json
+import os
+import threading
+import time
+from contextlib import ContextDecorator, contextmanager
+
+from config import (
+    METRICS_ENABLED,
+    METRICS_DIR,
+    METRICS_PROFILE_ENABLED,
+    BUDGET_PRICE_INPUT_PER_MTOK as PRICE_INPUT_PER_MTOK,
+    BUDGET_PRICE_CACHED_INPUT_PER_MTOK as PRICE_CACHED_INPUT_PER_MTOK
+)
+
+# DeepSeek 响应 usage 中记录的 token 字段 (prompt_cache_hit_tokens / miss_tokens 为上下文缓存命中情况)
+USAGE_TOKEN_FIELDS = ("prompt_tokens", "completion_tokens", "prompt_cache_hit_tokens", "prompt_cache_miss_tokens")
+
+
+class _StageStats:
+    __slots__ = ('count', 'total_seconds', 'max_seconds')
+
+    def __init__(self):
+        self.count = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+
+
+class UsageTally:
+    """
+    一段调用范围内 (例如审查一个文件) 完成的 API 调用次数与 token 用量 (线程安全)。
+    在 usage_scope(tally) 中调用 ReviewMetrics.record_usage 时累加；
+    calls_without_usage 为响应中没有 usage 的调用次数，例如流式响应在最后的 usage 之前被截断，或后端不返回 usage。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.calls_without_usage = 0
+        self.tokens = dict.fromkeys(USAGE_TOKEN_FIELDS, 0)
+
+    def add(self, usage):
+        with self._lock:
+            self.calls += 1
+            if not usage:
+                self.calls_without_usage += 1
+                return
+            for field in USAGE_TOKEN_FIELDS:
+                value = usage.get(field)
+                if isinstance(value, int):
+                    self.tokens[field] += value
+
+
+_usage_scope = threading.local()
+
+
+@contextmanager
+def usage_scope(tally):
+    """with 语句内当前线程记录的 API 用量同时累加到 tally，退出时恢复外层的 tally"""
+    previous = getattr(_usage_scope, "tally", None)
+    _usage_scope.tally = tally
+    try:
+        yield tally
+    finally:
+        _usage_scope.tally = previous
+
+
+def current_usage_tally():
+    """返回当前线程所在 usage_scope 的 UsageTally，不在其中时返回 None (用于把它传给代为发送请求的线程)"""
+    return getattr(_usage_scope, "tally", None)
+
+
+class ReviewMetrics:
+    """
+    一次审查运行的分阶段耗时与 token 用量统计 (线程安全)。
+
+    - span(stage): 记录一个阶段的耗时，例如 git_diff、file_read、prompt_build、api_call、report_write、notify_email。
+      并发执行时各线程的耗时会累加，因此阶段累计耗时可能超过整体运行时间。
+    - record_usage(usage): 累加 API 响应中 usage 字段的 token 数。
+    - increment(name): 累加计数器，例如 api_retries。
+    """
+
+    def __init__(self, run_name="review"):
+        self._lock = threading.Lock()
+        self.reset(run_name)
+
+    def reset(self, run_name="review"):
+        """清空统计并以 run_name 开始新的运行"""
+        with self._lock:
+            self.run_name = run_name
+            self.started_at = time.time()
+            self._started_monotonic = time.monotonic()
+            self._stages = {}
+            self._tokens = dict.fromkeys(USAGE_TOKEN_FIELDS, 0)
+            self._counters = {}
+
+    def record(self, stage, seconds):
+        """记录阶段 stage 的一次耗时 (秒)"""
+        with self._lock:
+            stats = self._stages.get(stage)
+            if stats is None:
+                stats = self._stages[stage] = _StageStats()
+            stats.count += 1
+            stats.total_seconds += seconds
+            if seconds > stats.max_seconds:
+                stats.max_seconds = seconds
+
+    @contextmanager
+    def span(self, stage):
+        """以 with 语句记录一个阶段的耗时，阶段内抛出异常时同样记录"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - started)
+
+    def record_usage(self, usage, seconds=None):
+        """
+        累加 API 响应中的 token 用量，usage 为空或缺少字段时忽略。每次完成的 API 调用都应调用一次 (usage 为空时同样调用)，
+        使当前 usage_scope 的 UsageTally 能统计出没有返回 usage 的调用。
+        :param seconds: 本次请求的耗时；响应中带有上下文缓存命中信息时，按是否命中分别记录为
+                        chat_prompt_cache_hit / chat_prompt_cache_miss 阶段，用于比较缓存命中对延迟的影响。
+        """
+        tally = current_usage_tally()
+        if tally is not None:
+            tally.add(usage)
+        if not usage:
+            return
+        with self._lock:
+            for field in USAGE_TOKEN_FIELDS:
+                value = usage.get(field)
+                if isinstance(value, int):
+                    self._tokens[field] += value
+        cache_hit_tokens = usage.get("prompt_cache_hit_tokens")
+        if seconds is not None and isinstance(cache_hit_tokens, int):
+            self.record("chat_prompt_cache_hit" if cache_hit_tokens > 0 else "chat_prompt_cache_miss", seconds)
+
+    def tokens(self):
+        """返回当前累计的 token 用量"""
+        with self._lock:
+            return dict(self._tokens)
+
+    def increment(self, name, amount=1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + amount
+
+    def summary(self):
+        """返回可序列化为 JSON 的统计摘要"""
+        with self._lock:
+            return {
+                "run": self.run_name,
+                "started_at": self.started_at,
+                "duration_seconds": time.monotonic() - self._started_monotonic,
+                "stages": {
+                    stage: {
+                        "count": stats.count,
+                        "total_seconds": round(stats.total_seconds, 6),
+                        "avg_seconds": round(stats.total_seconds / stats.count, 6) if stats.count else 0.0,
+                        "max_seconds": round(stats.max_seconds, 6),
+                    }
+                    for stage, stats in sorted(self._stages.items())
+                },
+                "tokens": dict(self._tokens),
+                "counters": dict(sorted(self._counters.items())),
+            }
+
+    def format_summary(self):
+        """返回按累计耗时排序的各阶段耗时与 token 用量，用于打印"""
+        data = self.summary()
+        lines = [f"各阶段耗时 (运行总耗时 {data['duration_seconds']:.1f}s，并发时为各线程累计):"]
+        for stage, stats in sorted(data["stages"].items(), key=lambda item: -item[1]["total_seconds"]):
+            lines.append(f"  {stage:<22} {stats['count']:>7} 次  累计 {stats['total_seconds']:>9.2f}s  "
+                         f"平均 {stats['avg_seconds'] * 1000:>8.1f}ms  最长 {stats['max_seconds']:>7.2f}s")
+        tokens = data["tokens"]
+        if any(tokens.values()):
+            cache_hit = tokens['prompt_cache_hit_tokens']
+            hit_rate = cache_hit / tokens['prompt_tokens'] if tokens['prompt_tokens'] else 0.0
+            # 命中上下文缓存的输入 token 按缓存价格计费，节省的费用按 config 中的价格估算
+            saved = cache_hit * (PRICE_INPUT_PER_MTOK - PRICE_CACHED_INPUT_PER_MTOK) / 1_000_000
+            lines.append(f"  token 用量: 输入 {tokens['prompt_tokens']} (上下文缓存命中 {cache_hit}，命中率 {hit_rate:.1%}，"
+                         f"节省约 {saved:.4f})，输出 {tokens['completion_tokens']}")
+        if data["counters"]:
+            lines.append("  计数: " + "，".join(f"{name} {value}" for name, value in data["counters"].items()))
+        return "\n".join(lines)
+
+    def format_prometheus(self):
+        """以 Prometheus textfile collector 格式返回统计"""
+        data = self.summary()
+        run_label = f'run="{data["run"]}"'
+        lines = [
+            "# HELP code_sentinel_run_duration_seconds Wall time of the last review run.",
+            "# TYPE code_sentinel_run_duration_seconds gauge",
+            f"code_sentinel_run_duration_seconds{{{run_label}}} {data['duration_seconds']:.6f}",
+            "# HELP code_sentinel_run_started_timestamp_seconds Start time of the last review run.",
+            "# TYPE code_sentinel_run_started_timestamp_seconds gauge",
+            f"code_sentinel_run_started_timestamp_seconds{{{run_label}}} {data['started_at']:.3f}",
+        ]
+        stage_metrics = (
+            ("code_sentinel_stage_seconds_total", "counter", "total_seconds", "Cumulative time spent in each stage."),
+            ("code_sentinel_stage_calls_total", "counter", "count", "Number of times each stage ran."),
+            ("code_sentinel_stage_max_seconds", "gauge", "max_seconds", "Longest single execution of each stage."),
+        )
+        for name, metric_type, field, description in stage_metrics:
+            lines.append(f"# HELP {name} {description}")
+            lines.append(f"# TYPE {name} {metric_type}")
+            for stage, stats in data["stages"].items():
+                lines.append(f'{name}{{{run_label},stage="{stage}"}} {stats[field]}')
+        lines.append("# HELP code_sentinel_tokens_total Tokens reported in API usage.")
+        lines.append("# TYPE code_sentinel_tokens_total counter")
+        for field, value in data["tokens"].items():
+            lines.append(f'code_sentinel_tokens_total{{{run_label},kind="{field}"}} {value}')
+        if data["counters"]:
+            lines.append("# HELP code_sentinel_events_total Miscellaneous event counters.")
+            lines.append("# TYPE code_sentinel_events_total counter")
+            for counter, value in data["counters"].items():
+                lines.append(f'code_sentinel_events_total{{{run_label},event="{counter}"}} {value}')
+        return "\n".join(lines) + "\n"
+
+    def export(self, metrics_dir):
+        """
+        将统计写入 metrics_dir: 每次运行一个 JSON 摘要 (<运行名>-<时间>.json)，
+        以及供 Prometheus textfile collector 读取的 <运行名>.prom (原子替换，只保留最近一次运行)。
+        :return: (JSON 路径, Prometheus 文件路径)；写入失败时返回 (None, None)。
+        """
+        try:
+            os.makedirs(metrics_dir, exist_ok=True)
+            stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(self.started_at))
+            json_path = os.path.abspath(os.path.join(metrics_dir, f"{self.run_name}-{stamp}.json"))
+            with open(json_path, 'w', encoding='utf-8') as f:
+                json.dump(self.summary(), f, ensure_ascii=False, indent=2)
+            prom_path = os.path.abspath(os.path.join(metrics_dir, f"{self.run_name}.prom"))
+            with open(prom_path + ".tmp", 'w', encoding='utf-8') as f:
+                f.write(self.format_prometheus())
+            os.replace(prom_path + ".tmp", prom_path)
+        except OSError as e:
+            print(f"写入运行指标失败: {e}")
+            return None, None
+        return json_path, prom_path
+
+
+class MetricsRun(ContextDecorator):
+    """
+    一次审查运行的指标范围，可用作 with 语句、装饰器，或显式调用 start() / finish():
+    进入时重置共享的 ReviewMetrics，退出时打印各阶段耗时并导出 JSON 和 Prometheus 文件；
+    启用 profile 时同时用 cProfile 记录主线程的本地开销并保存为 <运行名>-<时间>.prof
+    (可用 `python -m pstats` 或 snakeviz 查看；工作线程中的调用不在其中，需要完整画像时可将并发数设为 1)。
+    """
+
+    def __init__(self, run_name, metrics_dir=METRICS_DIR, enabled=METRICS_ENABLED, profile=METRICS_PROFILE_ENABLED):
+        self.run_name = run_name
+        self.metrics_dir = metrics_dir
+        self.enabled = enabled
+        self.profile = profile
+        self._profiler = None
+
+    def start(self):
+        """重置共享的 ReviewMetrics 并开始记录，返回 self 以便稍后调用 finish()"""
+        get_default_metrics().reset(self.run_name)
+        if self.profile:
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+        return self
+
+    def finish(self):
+        """结束记录，打印各阶段耗时并导出指标文件"""
+        metrics = get_default_metrics()
+        if self._profiler is not None:
+            self._profiler.disable()
+            profile_path = os.path.abspath(os.path.join(
+                self.metrics_dir, f"{self.run_name}-{time.strftime('%Y%m%d-%H%M%S', time.localtime(metrics.started_at))}.prof"))
+            try:
+                os.makedirs(self.metrics_dir, exist_ok=True)
+                self._profiler.dump_stats(profile_path)
+                print(f"cProfile 结果已保存至: {profile_path}")
+            except OSError as e:
+                print(f"保存 cProfile 结果失败: {e}")
+            self._profiler = None
+        print(metrics.format_summary())
+        if self.enabled:
+            json_path, prom_path = metrics.export(self.metrics_dir)
+            if json_path:
+                print(f"运行指标已保存至: {json_path} 和 {prom_path}")
+
+    def __enter__(self):
+        self.start()
+        return get_default_metrics()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.finish()
+        return False
+
+
+_default_metrics = ReviewMetrics()
+
+
+def get_default_metrics():
+    """返回进程内共享的 ReviewMetrics 实例，各模块的耗时都记录在这里"""
+    return _default_metrics
+
+
+def git_stage_name(command):
+    """根据 git 命令得到阶段名，例如 "git ls-tree -r ..." -> "git_ls_tree"，非 git 命令返回 "shell" """
+    words = command.split() if isinstance(command, str) else list(command)
+    if len(words) >= 2 and words[0] == "git":
+        for word in words[1:]:
+            if not word.startswith("-"):
+                return "git_" + word.replace("-", "_")
+    return "shell"
@@ -0,0 +1,113 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+
+class ReviewStateStore:
+    """
+    增量审查的持久化状态 (SQLite)。
+
+    按 (仓库, 分支) 记录上次完整审查到的提交，以及每个文件在该次审查中的报告片段，
+    使下一次审查只需处理此后新增或修改的文件，其余文件的审查结果直接沿用。
+    """
+
+    def __init__(self, db_path):
+        self.db_path = os.path.abspath(db_path)
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+            self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS reviewed_commits ("
+                " repo_path TEXT NOT NULL, branch TEXT NOT NULL, commit_sha TEXT NOT NULL, updated_at REAL NOT NULL,"
+                " PRIMARY KEY (repo_path, branch))"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS file_findings ("
+                " repo_path TEXT NOT NULL, branch TEXT NOT NULL, file_path TEXT NOT NULL,"
+                " report_parts TEXT NOT NULL, updated_at REAL NOT NULL,"
+                " PRIMARY KEY (repo_path, branch, file_path))"
+            )
+            self._conn.commit()
+        return self._conn
+
+    def get_last_commit(self, repo_path, branch):
+        """返回该仓库和分支上次审查完成时的提交 SHA，没有记录时返回 None"""
+        with self._lock:
+            row = self._connect().execute(
+                "SELECT commit_sha FROM reviewed_commits WHERE repo_path = ? AND branch = ?", (repo_path, branch)
+            ).fetchone()
+            return row[0] if row else None
+
+    def set_last_commit(self, repo_path, branch, commit_sha):
+        with self._lock:
+            conn = self._connect()
+            conn.execute(
+                "INSERT OR REPLACE INTO reviewed_commits (repo_path, branch, commit_sha, updated_at) VALUES (?, ?, ?, ?)",
+                (repo_path, branch, commit_sha, time.time())
+            )
+            conn.commit()
+
+    def load_findings(self, repo_path, branch):
+        """返回 {文件路径: 报告片段列表}"""
+        with self._lock:
+            rows = self._connect().execute(
+                "SELECT file_path, report_parts FROM file_findings WHERE repo_path = ? AND branch = ?", (repo_path, branch)
+            ).fetchall()
+        return {file_path: json.loads(report_parts) for file_path, report_parts in rows}
+
+    def stored_paths(self, repo_path, branch):
+        """返回已保存审查结果的文件路径集合 (不读取报告内容)"""
+        with self._lock:
+            rows = self._connect().execute(
+                "SELECT file_path FROM file_findings WHERE repo_path = ? AND branch = ?", (repo_path, branch)
+            ).fetchall()
+        return {row[0] for row in rows}
+
+    def get_findings(self, repo_path, branch, file_path):
+        """返回单个文件保存的报告片段列表，没有记录时返回 None"""
+        with self._lock:
+            row = self._connect().execute(
+                "SELECT report_parts FROM file_findings WHERE repo_path = ? AND branch = ? AND file_path = ?",
+                (repo_path, branch, file_path)
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def save_findings(self, repo_path, branch, findings):
+        """
+        保存文件的审查结果。
+        :param findings: {文件路径: 报告片段列表}
+        """
+        if not findings:
+            return
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            conn.executemany(
+                "INSERT OR REPLACE INTO file_findings (repo_path, branch, file_path, report_parts, updated_at) VALUES (?, ?, ?, ?, ?)",
+                [(repo_path, branch, path, json.dumps(parts, ensure_ascii=False), now) for path, parts in findings.items()]
+            )
+            conn.commit()
+
+    def delete_findings(self, repo_path, branch, file_paths):
+        """删除已不存在或已不再审查的文件的记录"""
+        if not file_paths:
+            return
+        with self._lock:
+            conn = self._connect()
+            conn.executemany(
+                "DELETE FROM file_findings WHERE repo_path = ? AND branch = ? AND file_path = ?",
+                [(repo_path, branch, path) for path in file_paths]
+            )
+            conn.commit()
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None